@@ -29,6 +29,7 @@ import { Badge } from "@/components/ui/badge"
 import { useGeminiDiagnosis } from "@/lib/hooks/useGeminiDiagnosis"
 import { useChatWidget } from "@/lib/hooks/useChatWidget"
 import { useMlAnalysis } from "@/lib/hooks/useMlAnalysis"
+import type { DiagnosisData } from "@/services/mlService"
 
 // Type definition for diagnoses
 interface Diagnosis {
@@ -39,6 +40,20 @@ interface Diagnosis {
   doctor: string;
 }
 
+// How often the diagnoses list is refreshed while the page is visible
+const DIAGNOSES_REFRESH_MS = 30000
+
+// Transform the data to match our component's expected format
+function formatDiagnoses(diagnosesData: DiagnosisData[]): Diagnosis[] {
+  return diagnosesData.map((d) => ({
+    id: d.id,
+    title: d.aiDiagnosis,
+    date: d.diagnosisDate,
+    status: d.status === "approved" ? "Confirmed" : "Pending Review",
+    doctor: d.doctorName
+  }))
+}
+
 export default function PatientDashboard() {
   const router = useRouter()
   const [isUploading, setIsUploading] = useState(false)
@@ -65,27 +80,18 @@ export default function PatientDashboard() {
     submitImageDiagnosis,
     isSubmittingDiagnosis,
     getDiagnoses,
+    loadMoreDiagnoses,
+    hasMoreDiagnoses,
     isLoadingDiagnoses
   } = useMlAnalysis()
   
   useEffect(() => {
-    // Fetch past diagnoses directly from ML backend
+    // Fetch the newest page of past diagnoses directly from ML backend
     async function fetchDiagnoses() {
       setIsLoading(true)
       
       try {
-        const diagnosesData = await getDiagnoses()
-        
-        // Transform the data to match our component's expected format
-        const formattedDiagnoses = diagnosesData.map((d) => ({
-          id: d.id,
-          title: d.aiDiagnosis,
-          date: d.diagnosisDate,
-          status: d.status === "approved" ? "Confirmed" : "Pending Review",
-          doctor: d.doctorName
-        }))
-        
-        setPastDiagnoses(formattedDiagnoses)
+        setPastDiagnoses(formatDiagnoses(await getDiagnoses()))
       } catch (error) {
         console.error("Error fetching diagnoses:", error)
         
@@ -100,7 +106,26 @@ export default function PatientDashboard() {
     }
     
     fetchDiagnoses()
+    
+    // Poll for new diagnoses; an unchanged list is answered with 304 Not Modified
+    const refresh = setInterval(async () => {
+      if (document.visibilityState !== "visible") return
+      try {
+        setPastDiagnoses(formatDiagnoses(await getDiagnoses()))
+      } catch (error) {
+        console.error("Error refreshing diagnoses:", error)
+      }
+    }, DIAGNOSES_REFRESH_MS)
+    return () => clearInterval(refresh)
   }, []) // Empty dependency array to ensure this only runs once
+  
+  const handleLoadMoreDiagnoses = async () => {
+    try {
+      setPastDiagnoses(formatDiagnoses(await loadMoreDiagnoses()))
+    } catch (error) {
+      toast.error("Could not load more diagnoses")
+    }
+  }
 
   const handleSymptomSubmit = async (e: React.FormEvent) => {
     e.preventDefault()
@@ -507,9 +532,15 @@ export default function PatientDashboard() {
               </CardContent>
               {pastDiagnoses.length > 0 && (
                 <CardFooter className="flex justify-center border-t bg-muted/50 p-2">
-                  <Button variant="link">
-                    View Full History
-                  </Button>
+                  {hasMoreDiagnoses ? (
+                    <Button variant="link" onClick={handleLoadMoreDiagnoses} disabled={isLoadingDiagnoses}>
+                      {isLoadingDiagnoses ? "Loading..." : "Load More"}
+                    </Button>
+                  ) : (
+                    <Button variant="link">
+                      View Full History
+                    </Button>
+                  )}
                 </CardFooter>
               )}
             </Card>
@@ -1,4 +1,4 @@
-import { useState, useCallback } from 'react';
+import { useState, useCallback, useRef } from 'react';
 import mlService, { 
   SymptomAnalysisResult, 
   ImageAnalysisResult,
@@ -28,6 +28,8 @@ interface UseMlAnalysisResult {
   
   // Diagnosis retrieval
   getDiagnoses: () => Promise<DiagnosisData[]>;
+  loadMoreDiagnoses: () => Promise<DiagnosisData[]>;
+  hasMoreDiagnoses: boolean;
   getDiagnosisById: (id: string) => Promise<DiagnosisData>;
   diagnoses: DiagnosisData[] | null;
   currentDiagnosis: DiagnosisData | null;
@@ -61,6 +63,17 @@ export function useMlAnalysis(): UseMlAnalysisResult {
   const [currentDiagnosis, setCurrentDiagnosis] = useState<DiagnosisData | null>(null);
   const [isLoadingDiagnoses, setIsLoadingDiagnoses] = useState(false);
   const [diagnosesError, setDiagnosesError] = useState<Error | null>(null);
+  const [hasMoreDiagnoses, setHasMoreDiagnoses] = useState(false);
+  // Diagnoses loaded so far and the cursor of the next page, read by the callbacks below
+  const loadedDiagnoses = useRef<DiagnosisData[] | null>(null);
+  const nextCursor = useRef<string | null>(null);
+  
+  const showDiagnoses = (list: DiagnosisData[], cursor: string | null) => {
+    loadedDiagnoses.current = list;
+    nextCursor.current = cursor;
+    setDiagnoses(list);
+    setHasMoreDiagnoses(cursor !== null);
+  };
   
   /**
    * Analyze symptoms using the ML API
@@ -147,16 +160,20 @@ export function useMlAnalysis(): UseMlAnalysisResult {
   }, []);
   
   /**
-   * Get all diagnoses
+   * Get the newest page of diagnoses; safe to poll, since an unchanged page
+   * costs a 304 and keeps any pages added with loadMoreDiagnoses
    */
   const getDiagnoses = useCallback(async (): Promise<DiagnosisData[]> => {
     setIsLoadingDiagnoses(true);
     setDiagnosesError(null);
     
     try {
-      const result = await mlService.getDiagnoses();
-      setDiagnoses(result);
-      return result;
+      const page = await mlService.getDiagnosesPage();
+      if (page.notModified && loadedDiagnoses.current) {
+        return loadedDiagnoses.current;
+      }
+      showDiagnoses(page.diagnoses, page.nextCursor);
+      return page.diagnoses;
     } catch (error) {
       const err = error instanceof Error ? error : new Error('Failed to fetch diagnoses');
       setDiagnosesError(err);
@@ -166,6 +183,31 @@ export function useMlAnalysis(): UseMlAnalysisResult {
     }
   }, []);
   
+  /**
+   * Append the next page of diagnoses to those already loaded
+   */
+  const loadMoreDiagnoses = useCallback(async (): Promise<DiagnosisData[]> => {
+    const loaded = loadedDiagnoses.current || [];
+    if (!nextCursor.current) {
+      return loaded;
+    }
+    setIsLoadingDiagnoses(true);
+    setDiagnosesError(null);
+    
+    try {
+      const page = await mlService.getDiagnosesPage(nextCursor.current);
+      const result = [...loaded, ...page.diagnoses];
+      showDiagnoses(result, page.nextCursor);
+      return result;
+    } catch (error) {
+      const err = error instanceof Error ? error : new Error('Failed to fetch more diagnoses');
+      setDiagnosesError(err);
+      throw err;
+    } finally {
+      setIsLoadingDiagnoses(false);
+    }
+  }, []);
+  
   /**
    * Get a diagnosis by ID
    */
@@ -215,6 +257,8 @@ export function useMlAnalysis(): UseMlAnalysisResult {
     submissionError,
     
     getDiagnoses,
+    loadMoreDiagnoses,
+    hasMoreDiagnoses,
     getDiagnosisById,
     diagnoses,
     currentDiagnosis,
@@ -8,12 +8,14 @@ export interface SymptomAnalysisResult {
   recommendation: string;
   model_used: string;
   differential_diagnosis?: Record<string, number>;
+  processing_time_ms?: number;
 }
 
 export interface ImageAnalysisResult {
   diagnosis: string;
   confidence: number;
   all_probabilities: Record<string, number>;
+  processing_time_ms?: number;
 }
 
 export interface DiagnosisData {
@@ -41,6 +43,13 @@ export interface DiagnosisData {
   };
 }
 
+export interface DiagnosesPage {
+  diagnoses: DiagnosisData[];
+  nextCursor: string | null;
+  // True when the server answered 304 and the previously fetched page was returned
+  notModified: boolean;
+}
+
 export interface SymptomSubmission {
   description: string;
   duration: string;
@@ -54,6 +63,9 @@ export interface ImageSubmission {
   bodyPart: string;
 }
 
+// Last first page of diagnoses and its ETag, so polling it costs a 304 when nothing changed
+let firstPage: { etag: string; page: DiagnosesPage } | null = null;
+
 /**
  * Service for interacting with the ML API
  */
@@ -122,7 +134,8 @@ const mlService = {
             confidence: analysisResult.confidence,
             recommendation: analysisResult.recommendation,
             modelUsed: analysisResult.model_used,
-            differentialDiagnosis: analysisResult.differential_diagnosis
+            differentialDiagnosis: analysisResult.differential_diagnosis,
+            processingTimeMs: analysisResult.processing_time_ms
           }
         }
       });
@@ -151,7 +164,8 @@ const mlService = {
           mlAnalysis: {
             diagnosis: analysisResult.diagnosis,
             confidence: analysisResult.confidence,
-            allProbabilities: analysisResult.all_probabilities
+            allProbabilities: analysisResult.all_probabilities,
+            processingTimeMs: analysisResult.processing_time_ms
           }
         }
       });
@@ -164,12 +178,31 @@ const mlService = {
   },
   
   /**
-   * Get all diagnoses
+   * Get one page of diagnoses, newest first
+   * @param cursor - nextCursor of the previous page; omit for the first page
    */
-  getDiagnoses: async (): Promise<DiagnosisData[]> => {
+  getDiagnosesPage: async (cursor?: string | null): Promise<DiagnosesPage> => {
     try {
-      const response = await axios.get(`${ML_API_URL}/api/diagnoses`);
-      return response.data.diagnoses;
+      const cached = cursor ? null : firstPage;
+      const response = await axios.get(`${ML_API_URL}/api/diagnoses`, {
+        params: cursor ? { cursor } : {},
+        headers: cached ? { 'If-None-Match': cached.etag } : {},
+        validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+      });
+      if (response.status === 304 && cached) {
+        return { ...cached.page, notModified: true };
+      }
+      
+      const page: DiagnosesPage = {
+        diagnoses: response.data.diagnoses,
+        nextCursor: response.data.nextCursor,
+        notModified: false
+      };
+      const etag = response.headers['etag'];
+      if (!cursor) {
+        firstPage = etag ? { etag, page } : null;
+      }
+      return page;
     } catch (error) {
       console.error('Error fetching diagnoses:', error);
       throw error;
@@ -0,0 +1,385 @@
+"""ASGI entry point serving the same API as main.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Requires starlette, python-multipart and an ASGI server such as uvicorn.
+Routes, payloads and responses match the Flask app, and the models, result
+cache and diagnosis store are the ones main.py sets up. The event loop
+never blocks on a model: inference runs in a bounded InferencePool, and
+when its backlog is full requests get a 503 with a Retry-After header
+instead of queueing indefinitely. Multipart uploads are parsed as they
+arrive and spooled to temporary files, so images are decoded from the
+spooled file rather than read into memory by the handler. Long-polls of
+GET /api/diagnoses/<id> wait on the event loop without holding a thread.
+"""
+import asyncio
+import contextlib
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import main
+import metrics
+from inference_pool import InferencePool, PoolFull
+
+# Threads running model calls; keep at least SYMPTOMS_BATCH_SIZE so micro-batches can fill
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", max(main.SYMPTOMS_BATCH_SIZE, 4)))
+# Model calls allowed to wait for a thread before requests are turned away
+INFERENCE_QUEUE = int(os.environ.get("INFERENCE_QUEUE", 64))
+# Seconds clients are told to wait after a 503
+RETRY_AFTER = int(os.environ.get("RETRY_AFTER", 1))
+
+inference_pool = InferencePool(max_workers=INFERENCE_WORKERS, max_pending=INFERENCE_QUEUE)
+
+_DONE = object()
+
+
+def _busy_response():
+    return JSONResponse(
+        {"error": "Server is busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER)}
+    )
+
+
+class RequestTimingMiddleware:
+    """Time each request's stages into main.request_metrics, as the Flask hooks do
+
+    The endpoint label is the route function's name, which matches the
+    Flask view names, so both entry points report the same series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings, token = metrics.begin("unmatched")
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings.stages:
+                    message.setdefault("headers", []).append(
+                        (b"server-timing", timings.server_timing().encode("latin-1"))
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.end(token)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                timings.endpoint = endpoint.__name__
+            main.request_metrics.observe(timings, status)
+
+
+def _cached_response(result, hit):
+    """Return a JSON response tagged with its cache status"""
+    with metrics.stage("json_serialization"):
+        return JSONResponse(result, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+async def _json_body(request):
+    """Return the parsed JSON body, or None if it isn't valid JSON"""
+    with metrics.stage("request_parse"):
+        try:
+            return await request.json()
+        except ValueError:
+            return None
+
+
+async def _form_body(request):
+    """Return the parsed form, or None if the multipart body is malformed"""
+    with metrics.stage("request_parse"):
+        try:
+            return await request.form()
+        except (HTTPException, MultiPartException, ValueError):
+            return None
+
+
+def _invalid_form_response():
+    return JSONResponse({"error": "Invalid multipart form data"}, status_code=400)
+
+
+async def _ndjson_response(lines, on_close=None):
+    """Stream an iterable of dicts as newline-delimited JSON, computing each line in the pool
+
+    The first line is computed before the response starts, so a full pool
+    still produces a 503. Later lines wait for room in the pool instead.
+    """
+    iterator = iter(lines)
+    try:
+        first = await inference_pool.run(next, iterator, _DONE)
+    except BaseException:
+        if on_close is not None:
+            await on_close()
+        raise
+
+    async def body():
+        try:
+            line = first
+            while line is not _DONE:
+                with metrics.stage("json_serialization"):
+                    encoded = json.dumps(line) + "\n"
+                yield encoded
+                line = await _run_when_free(next, iterator, _DONE)
+        finally:
+            if on_close is not None:
+                await on_close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def _run_when_free(fn, *args):
+    while True:
+        try:
+            return await inference_pool.run(fn, *args)
+        except PoolFull:
+            await asyncio.sleep(0.05)
+
+
+async def index(request):
+    return JSONResponse({"message": "Welcome to the Medical Image Analysis API"})
+
+
+async def healthz(request):
+    # Liveness: the event loop is up and serving, whether or not models are loaded
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    # Readiness: all required models are loaded
+    status = main.model_loader.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+async def predict(request):
+    form = await _form_body(request)
+    if form is None:
+        return _invalid_form_response()
+    try:
+        upload = form.get("image")
+        if not isinstance(upload, UploadFile):
+            return JSONResponse({"error": "No image file provided"}, status_code=400)
+        return _cached_response(*await inference_pool.run(main._predict_image, upload.file))
+    except PoolFull:
+        return _busy_response()
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        await form.close()
+
+
+async def predict_batch(request):
+    form = await _form_body(request)
+    if form is None:
+        return _invalid_form_response()
+    files = [upload for upload in form.getlist("images") if isinstance(upload, UploadFile)]
+    if not files:
+        await form.close()
+        return JSONResponse({"error": "No image files provided"}, status_code=400)
+
+    # The spooled files stay open until the whole response has been streamed
+    uploads = [(upload.filename, upload.file) for upload in files]
+    try:
+        return await _ndjson_response(main._image_batch_lines(uploads), on_close=form.close)
+    except PoolFull:
+        return _busy_response()
+
+
+async def analyze_symptoms(request):
+    data = await _json_body(request)
+    if not isinstance(data, dict) or "symptoms" not in data:
+        return JSONResponse({"error": "No symptoms provided"}, status_code=400)
+
+    try:
+        return _cached_response(*await inference_pool.run(main._analyze_symptoms, data["symptoms"]))
+    except PoolFull:
+        return _busy_response()
+    except Exception as e:
+        return JSONResponse({
+            "error": f"Error analyzing symptoms: {str(e)}",
+            "diagnosis": "Error in analysis",
+            "confidence": 0,
+            "recommendation": "Please consult with a doctor for a professional diagnosis."
+        }, status_code=500)
+
+
+async def analyze_symptoms_batch(request):
+    # Accept either a bare JSON array or {"symptoms": [...]}
+    data = await _json_body(request)
+    texts = data.get("symptoms") if isinstance(data, dict) else data
+    if not isinstance(texts, list) or not texts:
+        return JSONResponse({"error": "Expected a non-empty list of symptom descriptions"}, status_code=400)
+
+    try:
+        return await _ndjson_response(main._symptoms_batch_lines(texts))
+    except PoolFull:
+        return _busy_response()
+
+
+async def get_metrics(request):
+    # Prometheus text exposition of the per-stage latency histograms
+    return Response(main.request_metrics.render(), headers={"Content-Type": metrics.PROMETHEUS_CONTENT_TYPE})
+
+
+async def get_stats(request):
+    stats = await run_in_threadpool(main._service_stats)
+    stats["inference_pool"] = inference_pool.stats()
+    return JSONResponse(stats)
+
+
+async def create_diagnosis(request):
+    image = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # Image upload: analyzed in the background
+        form = await _form_body(request)
+        if form is None:
+            return _invalid_form_response()
+        try:
+            upload = form.get("image")
+            if isinstance(upload, UploadFile):
+                image = await upload.read()
+            diagnosis_type = "image"
+            diagnosis_data = {key: value for key, value in form.items() if not isinstance(value, UploadFile)}
+        finally:
+            await form.close()
+    else:
+        data = await _json_body(request)
+        if not data or "type" not in data or "data" not in data:
+            return JSONResponse({"error": "Invalid request format"}, status_code=400)
+        diagnosis_type, diagnosis_data = data["type"], data["data"]
+
+    try:
+        if image is None and "mlAnalysis" in diagnosis_data:
+            # The client already ran the analysis; store the diagnosis as-is
+            diagnosis = main._build_diagnosis(diagnosis_type, diagnosis_data)
+            await run_in_threadpool(main.diagnosis_store.create, diagnosis)
+            return JSONResponse({"success": True, "diagnosisId": diagnosis["id"]})
+
+        error = main._submission_error(diagnosis_type, diagnosis_data, image)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+        try:
+            diagnosis = await run_in_threadpool(main.submit_diagnosis, diagnosis_type, diagnosis_data, image)
+        except main.BacklogFull as e:
+            return JSONResponse(
+                {"error": str(e)},
+                status_code=503,
+                headers={"Retry-After": str(main.DIAGNOSIS_RETRY_AFTER)}
+            )
+        return JSONResponse(
+            {"success": True, "diagnosisId": diagnosis["id"], "analysisStatus": diagnosis["analysisStatus"]},
+            status_code=202,
+            headers={"Location": f"/api/diagnoses/{diagnosis['id']}"}
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def _etag_matches(header, etag):
+    """Check an If-None-Match header against an (unquoted) ETag"""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+
+async def get_all_diagnoses(request):
+    try:
+        params = main._list_params(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid query parameters: {str(e)}"}, status_code=400)
+
+    try:
+        etag = await run_in_threadpool(main._diagnoses_etag, params)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        # Starlette iterates the synchronous generator in a worker thread
+        return StreamingResponse(
+            main.stream_page(main.diagnosis_store, **params),
+            media_type="application/json",
+            headers=headers
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def _wait_for_diagnosis(diagnosis_id, wait, seen, poll_interval=0.25):
+    """Like main.wait_for_diagnosis, but sleeps on the event loop rather than holding a thread"""
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        diagnosis = await run_in_threadpool(main.diagnosis_store.get, diagnosis_id)
+        remaining = deadline - asyncio.get_running_loop().time()
+        if diagnosis is None or remaining <= 0 or main._analysis_changed(diagnosis, seen):
+            return diagnosis
+        await asyncio.sleep(min(remaining, poll_interval))
+
+
+async def get_diagnosis(request):
+    try:
+        wait, seen = main._wait_params(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid query parameters: {str(e)}"}, status_code=400)
+
+    try:
+        diagnosis = await _wait_for_diagnosis(request.path_params["diagnosis_id"], wait, seen)
+        if diagnosis is None:
+            return JSONResponse({"error": "Diagnosis not found"}, status_code=404)
+        return JSONResponse(diagnosis)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+routes = [
+    Route("/", index),
+    Route("/healthz", healthz),
+    Route("/readyz", readyz),
+    Route("/api/predict", predict, methods=["POST"]),
+    Route("/api/predict/batch", predict_batch, methods=["POST"]),
+    Route("/api/symptoms", analyze_symptoms, methods=["POST"]),
+    Route("/api/symptoms/batch", analyze_symptoms_batch, methods=["POST"]),
+    Route("/api/stats", get_stats),
+    Route("/metrics", get_metrics),
+    Route("/api/diagnoses", create_diagnosis, methods=["POST"]),
+    Route("/api/diagnoses", get_all_diagnoses, methods=["GET"]),
+    Route("/api/diagnoses/{diagnosis_id}", get_diagnosis),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    inference_pool.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(
+            CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"], expose_headers=["ETag"]
+        ),
+        Middleware(RequestTimingMiddleware)
+    ],
+    lifespan=lifespan
+)
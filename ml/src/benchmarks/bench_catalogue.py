@@ -0,0 +1,151 @@
+"""Compare loading the condition catalogue from a pickle and from the mapped format.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_catalogue --conditions 1000 10000 100000
+
+Writes a synthetic catalogue in both formats, then loads each one in a
+fresh process the way SymptomAnalyzer does: the pickle is unpickled and
+its keyword index compiled; the mapped catalogue is opened. Reports file
+size, load time, the first and steady-state keyword-matching latency,
+and how much the process's resident memory grew. Private (anonymous)
+memory is counted separately from file-backed pages, which every worker
+mapping the same catalogue shares.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from benchmarks.bench_keyword_matcher import make_catalogue
+from initialize_symptoms_model import TEST_SYMPTOMS
+
+RECOMMENDATIONS = [
+    "Rest, fluids, and monitor symptoms. Seek medical attention if symptoms worsen.",
+    "Please consult with a doctor.",
+    "Avoid known triggers and take prescribed medication at onset of symptoms.",
+    "Seek immediate medical attention.",
+]
+
+
+def synthetic_catalogue(count, seed=0):
+    rng = random.Random(seed)
+    catalogue = make_catalogue(count, seed=seed)
+    for name, info in catalogue.items():
+        info["recommendations"] = rng.choice(RECOMMENDATIONS)
+        info["description"] = f"{name} presents with {info['symptoms'][0]} and {info['symptoms'][1]}."
+    return catalogue
+
+
+def memory_mb():
+    """(anonymous, file-backed) resident memory of this process in MB"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                values[key] = int(value.split()[0]) / 1024
+    return values.get("RssAnon", 0.0), values.get("RssFile", 0.0)
+
+
+def load(fmt, path, repeats, queue):
+    from models.catalogue import Catalogue
+    from models.keyword_matcher import KeywordMatcher
+
+    anon_before, file_before = memory_mb()
+    started = time.perf_counter()
+    if fmt == "pickle":
+        with open(path, "rb") as f:
+            config = pickle.load(f)
+        conditions_info = config["conditions_info"]
+        labels = config["labels"]
+        matcher = KeywordMatcher(conditions_info)
+    else:
+        conditions_info = Catalogue(path)
+        labels = conditions_info.labels
+        matcher = conditions_info.keyword_matcher
+    load_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    condition, _ = matcher.best(TEST_SYMPTOMS[0])
+    if condition is not None:
+        conditions_info[condition]["recommendations"]
+    first_match_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for text in TEST_SYMPTOMS:
+            condition, _ = matcher.best(text)
+            if condition is not None:
+                conditions_info[condition]["recommendations"]
+    match_us = (time.perf_counter() - started) * 1e6 / (repeats * len(TEST_SYMPTOMS))
+
+    anon_after, file_after = memory_mb()
+    queue.put({
+        "format": fmt,
+        "labels": len(labels),
+        "load_ms": load_ms,
+        "first_match_ms": first_match_ms,
+        "match_us": match_us,
+        "private_mb": anon_after - anon_before,
+        "shared_mb": file_after - file_before,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conditions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    from models.catalogue import write_catalogue
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.conditions:
+            catalogue = synthetic_catalogue(count)
+            paths = {
+                "pickle": os.path.join(directory, f"{count}.pkl"),
+                "mapped": os.path.join(directory, f"{count}.catalogue"),
+            }
+            with open(paths["pickle"], "wb") as f:
+                pickle.dump({"conditions_info": catalogue, "labels": list(catalogue)}, f)
+            started = time.perf_counter()
+            write_catalogue(paths["mapped"], catalogue)
+            write_s = time.perf_counter() - started
+
+            for fmt, path in paths.items():
+                queue = context.Queue()
+                process = context.Process(target=load, args=(fmt, path, args.repeats, queue))
+                process.start()
+                row = queue.get()
+                process.join()
+                row.update({
+                    "conditions": count,
+                    "file_mb": os.path.getsize(path) / 1024 / 1024,
+                    "write_s": write_s if fmt == "mapped" else None,
+                })
+                rows.append(row)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'conditions':>10} {'format':>7} {'file MB':>8} {'load ms':>9} {'1st match ms':>13} "
+          f"{'match us':>9} {'private MB':>11} {'shared MB':>10}")
+    for row in rows:
+        print(
+            f"{row['conditions']:>10} {row['format']:>7} {row['file_mb']:>8.1f} {row['load_ms']:>9.2f} "
+            f"{row['first_match_ms']:>13.2f} {row['match_us']:>9.1f} {row['private_mb']:>11.1f} "
+            f"{row['shared_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare the original GET /api/diagnoses encoding with the streaming one.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_diagnoses_streaming --sizes 1000 10000 100000
+
+The original endpoint copied every diagnosis into a list, sorted it and
+encoded the whole document before sending the first byte. The streaming
+endpoint encodes rows as SQLite returns them. For each store size this
+reports time-to-first-byte, total time and peak Python heap (tracemalloc)
+for the full listing, and for the streamed first page that the dashboard
+actually requests.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_diagnosis_store import fill, make_diagnoses
+from storage import SQLiteDiagnosisStore, stream_page
+
+
+def legacy_body(diagnoses):
+    """The original get_all_diagnoses: copy, sort and encode everything at once"""
+    diagnoses_list = list(diagnoses.values())
+    diagnoses_list.sort(key=lambda x: x["diagnosisDate"], reverse=True)
+    yield json.dumps({"diagnoses": diagnoses_list, "total": len(diagnoses_list)})
+
+
+def measure(make_body):
+    """Return time-to-first-byte, total time and peak heap for consuming a response body"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in make_body():
+        if first_byte is None:
+            first_byte = time.perf_counter()
+        size += len(chunk)
+    finished = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ttfb_ms": (first_byte - started) * 1000,
+        "total_ms": (finished - started) * 1000,
+        "peak_heap_mb": peak / 1024 / 1024,
+        "body_mb": size / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            diagnoses = {d["id"]: d for d in make_diagnoses(size)}
+            store = SQLiteDiagnosisStore(os.path.join(directory, f"diagnoses-{size}.db"))
+            fill(store, size)
+
+            cases = {
+                "legacy full list": lambda: legacy_body(diagnoses),
+                "streamed full list": lambda: stream_page(store, limit=size),
+                "streamed first page": lambda: stream_page(store, limit=args.page_size),
+            }
+            for name, make_body in cases.items():
+                rows.append({"size": size, "case": name, **measure(make_body)})
+            store.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'size':>8} {'case':>20} {'TTFB ms':>10} {'total ms':>10} {'peak heap MB':>13} {'body MB':>8}")
+    for row in rows:
+        print(
+            f"{row['size']:>8} {row['case']:>20} {row['ttfb_ms']:>10.2f} {row['total_ms']:>10.2f} "
+            f"{row['peak_heap_mb']:>13.2f} {row['body_mb']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
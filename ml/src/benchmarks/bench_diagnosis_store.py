@@ -0,0 +1,123 @@
+"""Load test for diagnosis listing as the store grows.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_diagnosis_store --sizes 1000 10000 100000 1000000
+
+Fills a fresh SQLite store (and, up to --memory-limit, the in-process dict
+store) with synthetic diagnoses, then measures the latency of fetching the
+first page, a status-filtered page, a date-filtered page and a single
+diagnosis by id.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+from storage import MemoryDiagnosisStore, SQLiteDiagnosisStore
+
+STATUSES = ["pending", "reviewed", "completed"]
+TYPES = ["Symptom Analysis", "Image Analysis"]
+
+
+def make_diagnoses(count, seed=0):
+    """Yield synthetic diagnoses spread over roughly three years"""
+    rng = random.Random(seed)
+    start = date(2023, 1, 1)
+    for _ in range(count):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "diagnosisDate": (start + timedelta(days=rng.randrange(1000))).isoformat(),
+            "type": rng.choice(TYPES),
+            "status": rng.choice(STATUSES),
+            "aiDiagnosis": "Migraine",
+            "confidence": rng.random() * 100,
+            "doctorName": "Awaiting doctor review",
+            "doctorFeedback": ""
+        }
+
+
+def fill(store, count, chunk=50000):
+    diagnoses = make_diagnoses(count)
+    while True:
+        batch = [d for _, d in zip(range(chunk), diagnoses)]
+        if not batch:
+            return
+        store.create_many(batch)
+
+
+def percentiles(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": statistics.median(samples),
+        "p95_ms": samples[int(len(samples) * 0.95) - 1]
+    }
+
+
+def measure(store, some_id, page_size, repeats):
+    return {
+        "first_page": percentiles(lambda: store.list(limit=page_size), repeats),
+        "status_page": percentiles(lambda: store.list(status="pending", limit=page_size), repeats),
+        "date_page": percentiles(
+            lambda: store.list(date_from="2024-01-01", date_to="2024-03-31", limit=page_size), repeats
+        ),
+        "get_by_id": percentiles(lambda: store.get(some_id), repeats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--memory-limit", type=int, default=100000,
+                        help="Largest size to also run against the in-memory store")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            backends = {"sqlite": SQLiteDiagnosisStore(os.path.join(directory, f"diagnoses-{size}.db"))}
+            if size <= args.memory_limit:
+                backends["memory"] = MemoryDiagnosisStore()
+
+            for name, store in backends.items():
+                started = time.perf_counter()
+                fill(store, size)
+                fill_seconds = time.perf_counter() - started
+                some_id = next(make_diagnoses(1))["id"]
+                rows.append({
+                    "backend": name,
+                    "size": size,
+                    "fill_seconds": fill_seconds,
+                    **measure(store, some_id, args.page_size, args.repeats)
+                })
+                store.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'backend':>8} {'size':>9} {'first page p50/p95 ms':>22} {'status page':>14} "
+          f"{'date page':>14} {'get by id':>14}")
+    for row in rows:
+        cells = [
+            f"{row[key]['p50_ms']:.2f}/{row[key]['p95_ms']:.2f}"
+            for key in ("first_page", "status_page", "date_page", "get_by_id")
+        ]
+        print(f"{row['backend']:>8} {row['size']:>9} {cells[0]:>22} {cells[1]:>14} {cells[2]:>14} {cells[3]:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Load test the Flask dev server, gunicorn sync workers and the ASGI app.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_http_load --servers flask gunicorn asgi --concurrency 8 32 128 512
+
+Each server is started in turn on a local port with the result cache
+disabled and a temporary diagnosis store, and waits until /readyz
+reports the models loaded. Then, for each concurrency level, that many
+client threads send requests to a route back to back over keep-alive
+connections for --duration seconds. Reports throughput, p50/p95/p99
+latency, 503s (backpressure) and failed connections or timeouts.
+"Capacity" is the highest concurrency level served without failures.
+gunicorn and uvicorn must be installed for their servers.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from initialize_symptoms_model import TEST_SYMPTOMS
+
+SERVERS = {
+    "flask": lambda port, workers: [
+        sys.executable, "-c", f"import main; main.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    ],
+    "gunicorn": lambda port, workers: [
+        "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "main:app"
+    ],
+    "asgi": lambda port, workers: [
+        "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"
+    ],
+}
+
+
+def sample_jpeg(size=(512, 512)):
+    from PIL import Image
+    import numpy as np
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def multipart_body(field, files):
+    """Encode (filename, data) pairs as one multipart form field; returns (body, content type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data in files:
+        parts.append((
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode() + data + b"\r\n")
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def make_requests(route):
+    """Return a function giving (method, path, body, headers) for the i-th request"""
+    if route == "symptoms":
+        def request(i):
+            body = json.dumps({"symptoms": TEST_SYMPTOMS[i % len(TEST_SYMPTOMS)]}).encode()
+            return "POST", "/api/symptoms", body, {"Content-Type": "application/json"}
+    elif route == "predict":
+        body, content_type = multipart_body("image", [("xray.jpg", sample_jpeg())])
+
+        def request(i):
+            return "POST", "/api/predict", body, {"Content-Type": content_type}
+    elif route == "diagnoses":
+        def request(i):
+            return "GET", "/api/diagnoses?limit=50", None, {}
+    else:
+        raise ValueError(f"Unknown route '{route}'")
+    return request
+
+
+def wait_ready(port, timeout, process=None):
+    """Poll /readyz until it answers 200; gives up early if `process` has exited"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/readyz")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(1)
+    return False
+
+
+def client(port, make_request, deadline, timeout, offset, results):
+    latencies, statuses, failures = [], {}, 0
+    connection = None
+    i = offset
+    while time.monotonic() < deadline:
+        method, path, body, headers = make_request(i)
+        i += 1
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            failures += 1
+            if connection is not None:
+                connection.close()
+            connection = None
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+            connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+    results.append((latencies, statuses, failures))
+
+
+def run_load(port, make_request, concurrency, duration, timeout):
+    results = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=client, args=(port, make_request, deadline, timeout, n * 1000, results))
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    statuses = {}
+    for _, counts, _ in results:
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+    ok = statuses.get(200, 0)
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else None
+
+    return {
+        "throughput_rps": ok / duration,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "ok": ok,
+        "rejected_503": statuses.get(503, 0),
+        "other_errors": sum(count for status, count in statuses.items() if status not in (200, 503)),
+        "failed_connections": sum(result[2] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--routes", nargs="+", default=["symptoms"], choices=["symptoms", "predict", "diagnoses"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128, 512])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per level")
+    parser.add_argument("--timeout", type=float, default=30, help="Client request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for server in args.servers:
+            env = dict(
+                os.environ,
+                RESULT_CACHE_SIZE="0",
+                DIAGNOSES_DB=os.path.join(directory, f"{server}.db"),
+                DIAGNOSIS_JOBS_DB=os.path.join(directory, f"{server}-jobs.db"),
+            )
+            env.pop("MODEL_SERVER_SOCKET", None)
+            process = subprocess.Popen(SERVERS[server](args.port, args.workers), env=env)
+            try:
+                if not wait_ready(args.port, args.ready_timeout, process):
+                    rows.append({"server": server, "error": "server did not become ready"})
+                    continue
+                for route in args.routes:
+                    make_request = make_requests(route)
+                    for concurrency in args.concurrency:
+                        result = run_load(args.port, make_request, concurrency, args.duration, args.timeout)
+                        rows.append({"server": server, "route": route, "concurrency": concurrency, **result})
+            finally:
+                process.terminate()
+                process.wait()
+
+    # Capacity: highest concurrency served without failed connections or timeouts
+    capacity = {}
+    for row in rows:
+        if "error" not in row and row["failed_connections"] == 0:
+            key = (row["server"], row["route"])
+            capacity[key] = max(capacity.get(key, 0), row["concurrency"])
+
+    if args.json:
+        print(json.dumps({
+            "results": rows,
+            "capacity": [{"server": s, "route": r, "concurrency": c} for (s, r), c in capacity.items()],
+        }, indent=2))
+        return
+
+    def ms(value):
+        return f"{value:.1f}" if value is not None else "-"
+
+    print(f"{'server':>9} {'route':>10} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>9} "
+          f"{'503s':>6} {'errors':>7} {'failed':>7}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['server']:>9}  {row['error']}")
+            continue
+        print(
+            f"{row['server']:>9} {row['route']:>10} {row['concurrency']:>5} {row['throughput_rps']:>8.2f} "
+            f"{ms(row['p50_ms']):>8} {ms(row['p95_ms']):>8} {ms(row['p99_ms']):>9} {row['rejected_503']:>6} "
+            f"{row['other_errors']:>7} {row['failed_connections']:>7}"
+        )
+    print()
+    for (server, route), concurrency in capacity.items():
+        print(f"capacity {server}/{route}: {concurrency} concurrent connections")
+
+
+if __name__ == "__main__":
+    main()
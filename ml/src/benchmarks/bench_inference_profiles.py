@@ -0,0 +1,99 @@
+"""Parity and throughput report for the zero-shot inference profiles.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_inference_profiles --profiles fp32 int8 distilled distilled-int8 --threads 1 2 4
+
+Each profile/thread combination runs in a fresh process (torch thread pools
+can only be configured once per process) over the test sentences from
+initialize_symptoms_model.py. Parity is measured against the fp32 profile:
+how often the diagnosis matches and how far the confidence moves.
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+
+from initialize_symptoms_model import TEST_SYMPTOMS
+from models.inference_profile import PROFILES
+
+
+def run_profile(name, threads, repeats, queue):
+    from models.inference_profile import InferenceProfile
+    from models.symptoms_model import SymptomAnalyzer
+
+    started = time.perf_counter()
+    analyzer = SymptomAnalyzer(profile=InferenceProfile(name, intra_op_threads=threads, inter_op_threads=1))
+    load_seconds = time.perf_counter() - started
+    if analyzer.classifier is None:
+        queue.put({"error": "classifier failed to load"})
+        return
+
+    results = [analyzer.analyze(text) for text in TEST_SYMPTOMS]  # also warms up
+    latencies = []
+    for _ in range(repeats):
+        for text in TEST_SYMPTOMS:
+            started = time.perf_counter()
+            analyzer.analyze(text)
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    queue.put({
+        "load_seconds": load_seconds,
+        "throughput_rps": 1000 * len(latencies) / sum(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "diagnoses": [r["diagnosis"] for r in results],
+        "confidences": [float(r["confidence"]) for r in results],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for name in args.profiles:
+        for threads in args.threads:
+            queue = context.Queue()
+            process = context.Process(target=run_profile, args=(name, threads, args.repeats, queue))
+            process.start()
+            rows.append({"profile": name, "threads": threads, **queue.get()})
+            process.join()
+
+    # Parity against fp32 (any thread count gives the same outputs)
+    baseline = next((r for r in rows if r["profile"] == "fp32" and "error" not in r), None)
+    for row in rows:
+        if baseline is None or "error" in row:
+            continue
+        pairs = list(zip(row["diagnoses"], baseline["diagnoses"]))
+        deltas = [abs(a - b) for a, b in zip(row["confidences"], baseline["confidences"])]
+        row["agreement"] = sum(a == b for a, b in pairs) / len(pairs)
+        row["max_confidence_delta"] = max(deltas)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'profile':>15} {'threads':>8} {'load s':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'agreement':>10} {'max conf delta':>15}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['profile']:>15} {row['threads']:>8}  {row['error']}")
+            continue
+        agreement = f"{row['agreement']:.0%}" if "agreement" in row else "-"
+        delta = f"{row['max_confidence_delta']:.1f}" if "max_confidence_delta" in row else "-"
+        print(
+            f"{row['profile']:>15} {row['threads']:>8} {row['load_seconds']:>7.1f} {row['throughput_rps']:>7.2f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {agreement:>10} {delta:>15}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compare the indexed keyword matcher with the original nested scan.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_keyword_matcher --conditions 5 500 5000
+
+Builds synthetic condition catalogues of the given sizes and reports the
+one-off index build time and the per-text matching latency of both
+implementations.
+"""
+import argparse
+import json
+import random
+import time
+
+from initialize_symptoms_model import TEST_SYMPTOMS
+from models.keyword_matcher import KeywordMatcher
+
+VOCABULARY = [
+    "pain", "ache", "swelling", "fever", "cough", "rash", "nausea", "fatigue",
+    "dizziness", "bleeding", "numbness", "stiffness", "cramps", "itching",
+    "chest", "back", "joint", "muscle", "skin", "throat", "eye", "ear", "head",
+    "abdominal", "chronic", "sudden", "mild", "severe", "night", "morning"
+]
+
+
+def make_catalogue(count, seed=0):
+    """Return a synthetic conditions_info with `count` conditions"""
+    rng = random.Random(seed)
+    catalogue = {}
+    for i in range(count):
+        symptoms = [" ".join(rng.sample(VOCABULARY, rng.randint(1, 3))) for _ in range(5)]
+        catalogue[f"Condition {i}"] = {
+            "symptoms": symptoms,
+            "synonyms": {symptoms[0]: [" ".join(rng.sample(VOCABULARY, 2))]},
+            "recommendations": "Please consult with a doctor."
+        }
+    return catalogue
+
+
+def legacy_best(conditions_info, text):
+    """The original nested substring scan from SymptomAnalyzer._keyword_matching"""
+    symptoms_lower = text.lower()
+    max_matches = 0
+    best_condition = None
+    for condition, info in conditions_info.items():
+        matches = sum(1 for symptom in info["symptoms"] if symptom in symptoms_lower)
+        if matches > max_matches:
+            max_matches = matches
+            best_condition = condition
+    return best_condition, max_matches
+
+
+def time_per_text(fn, texts, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - started) / (repeats * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conditions", type=int, nargs="+", default=[5, 500, 5000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    for count in args.conditions:
+        catalogue = make_catalogue(count)
+
+        started = time.perf_counter()
+        matcher = KeywordMatcher(catalogue)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        legacy_us = time_per_text(lambda t: legacy_best(catalogue, t), TEST_SYMPTOMS, args.repeats) * 1e6
+        indexed_us = time_per_text(matcher.best, TEST_SYMPTOMS, args.repeats) * 1e6
+        rows.append({
+            "conditions": count,
+            "build_ms": build_ms,
+            "legacy_us": legacy_us,
+            "indexed_us": indexed_us,
+            "speedup": legacy_us / indexed_us
+        })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'conditions':>10} {'build ms':>10} {'legacy us/text':>16} {'indexed us/text':>17} {'speedup':>9}")
+    for row in rows:
+        print(
+            f"{row['conditions']:>10} {row['build_ms']:>10.2f} {row['legacy_us']:>16.1f} "
+            f"{row['indexed_us']:>17.1f} {row['speedup']:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Memory and throughput with per-worker models vs one shared model server.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_model_server --workers 4 8 16 --duration 30
+
+Each worker process stands in for a gunicorn sync worker and sends
+/api/symptoms-style requests (the initialize_symptoms_model.py test
+sentences) back to back. In "embedded" mode every worker loads its own
+SymptomAnalyzer, as main.py does today; in "server" mode the workers
+are ModelClients of one model_server.py process. Reports aggregate
+requests/s and per-worker resident memory (RSS, and PSS which splits
+shared pages fairly between processes), plus the server's own memory.
+Linux only: memory is read from /proc.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from initialize_symptoms_model import TEST_SYMPTOMS
+
+
+def memory_mb(pid="self"):
+    """Return (rss, pss) in MB for a process"""
+    values = {}
+    for path, key in ((f"/proc/{pid}/status", "VmRSS:"), (f"/proc/{pid}/smaps_rollup", "Pss:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        values[key] = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+    return values.get("VmRSS:"), values.get("Pss:")
+
+
+def run_worker(mode, socket_path, duration, ready, go, queue):
+    if mode == "server":
+        from model_server import ModelClient, RemoteSymptomAnalyzer
+        analyzer = RemoteSymptomAnalyzer(ModelClient(socket_path))
+    else:
+        from models.symptoms_model import SymptomAnalyzer
+        analyzer = SymptomAnalyzer()
+    analyzer.analyze(TEST_SYMPTOMS[0])  # warm up
+    ready.release()
+    go.wait()
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        analyzer.analyze(TEST_SYMPTOMS[i % len(TEST_SYMPTOMS)])
+        latencies.append((time.perf_counter() - started) * 1000)
+        i += 1
+    rss, pss = memory_mb()
+    queue.put({"requests": len(latencies), "latencies": latencies, "rss_mb": rss, "pss_mb": pss})
+
+
+def run_server(socket_path):
+    from model_server import ModelServer
+    ModelServer(socket_path).serve_forever()
+
+
+def run_case(context, mode, workers, duration, socket_path):
+    server = None
+    if mode == "server":
+        from model_server import ModelClient
+        server = context.Process(target=run_server, args=(socket_path,), daemon=True)
+        server.start()
+        if not ModelClient(socket_path).wait_ready("symptoms", timeout=600):
+            server.terminate()
+            return {"error": "model server failed to load the classifier"}
+
+    ready = context.Semaphore(0)
+    go = context.Event()
+    queue = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(mode, socket_path, duration, ready, go, queue))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()  # model loading isn't part of the measurement
+    go.set()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    server_rss = server_pss = None
+    if server is not None:
+        server_rss, server_pss = memory_mb(server.pid)
+        server.terminate()
+        server.join()
+
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    total_pss = sum(result["pss_mb"] or 0 for result in results) + (server_pss or 0)
+    return {
+        "throughput_rps": sum(result["requests"] for result in results) / duration,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "worker_rss_mb": statistics.mean(result["rss_mb"] or 0 for result in results),
+        "worker_pss_mb": statistics.mean(result["pss_mb"] or 0 for result in results),
+        "server_rss_mb": server_rss,
+        "total_pss_mb": total_pss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--modes", nargs="+", default=["embedded", "server"], choices=["embedded", "server"])
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, "models.sock")
+        for workers in args.workers:
+            for mode in args.modes:
+                result = run_case(context, mode, workers, args.duration, socket_path)
+                rows.append({"workers": workers, "mode": mode, **result})
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'workers':>8} {'mode':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'worker RSS MB':>14} "
+          f"{'worker PSS MB':>14} {'server RSS MB':>14} {'total PSS MB':>13}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['workers']:>8} {row['mode']:>9}  {row['error']}")
+            continue
+        server_rss = f"{row['server_rss_mb']:.0f}" if row["server_rss_mb"] is not None else "-"
+        print(
+            f"{row['workers']:>8} {row['mode']:>9} {row['throughput_rps']:>8.2f} {row['p50_ms']:>8.1f} "
+            f"{row['p95_ms']:>8.1f} {row['worker_rss_mb']:>14.0f} {row['worker_pss_mb']:>14.0f} "
+            f"{server_rss:>14} {row['total_pss_mb']:>13.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
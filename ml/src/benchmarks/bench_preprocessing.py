@@ -0,0 +1,120 @@
+"""Compare the original /api/predict preprocessing with ImagePreprocessor.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_preprocessing --batch 32
+
+Synthetic JPEG and PNG inputs are generated at 224px and at a full-resolution
+radiograph size (3000x2500, the size of a typical DICOM chest X-ray). Each
+case runs in a fresh process so the reported peak RSS belongs to that case
+alone.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from models.preprocessing import ImagePreprocessor
+
+SIZES = {
+    "224px": (224, 224),
+    "dicom": (3000, 2500),
+}
+
+
+def make_image(size, fmt, seed=0):
+    """Encode a smooth random grayscale-ish image, similar to an X-ray"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (size[1] // 16 + 1, size[0] // 16 + 1), dtype=np.uint8)
+    img = Image.fromarray(small, mode="L").resize(size, Image.BILINEAR).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def legacy_preprocess(image_bytes):
+    """The original per-request path from main.predict, plus the float32 cast Keras does"""
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img = img.resize((224, 224))
+    img_array = np.array(img) / 255.0
+    return np.expand_dims(img_array, axis=0).astype(np.float32)
+
+
+def legacy_batch(images):
+    return np.concatenate([legacy_preprocess(data) for data in images])
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(path, images, repeats, workers, queue):
+    baseline = peak_rss_mb()
+
+    preprocessor = ImagePreprocessor(size=(224, 224))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    if path == "legacy":
+        fn = legacy_batch
+    else:
+        fn = lambda data: preprocessor.preprocess_batch(data, executor=executor)[0]
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(images)
+    elapsed = time.perf_counter() - started
+
+    executor.shutdown()
+    queue.put({
+        "path": path,
+        "ms_per_image": elapsed / (repeats * len(images)) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - baseline,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for size_name in SIZES:
+        for fmt in ("JPEG", "PNG"):
+            # Encode inputs here so their generation doesn't count towards a case's peak RSS
+            images = [make_image(SIZES[size_name], fmt, seed=i) for i in range(args.batch)]
+            for path in ("legacy", "preprocessor"):
+                queue = context.Queue()
+                process = context.Process(
+                    target=run_case,
+                    args=(path, images, args.repeats, args.workers, queue)
+                )
+                process.start()
+                row = queue.get()
+                process.join()
+                rows.append({"input": size_name, "format": fmt, **row})
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'input':>7} {'format':>6} {'path':>13} {'ms/image':>10} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    for row in rows:
+        print(
+            f"{row['input']:>7} {row['format']:>6} {row['path']:>13} {row['ms_per_image']:>10.2f} "
+            f"{row['peak_rss_mb']:>12.1f} {row['rss_growth_mb']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
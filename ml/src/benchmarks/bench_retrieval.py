@@ -0,0 +1,140 @@
+"""Compare embedding retrieval with zero-shot NLI as the condition catalogue grows.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_retrieval --conditions 5 100 1000 10000
+
+Each catalogue is the five built-in conditions padded with synthetic ones.
+For every size, reports the one-off cost of embedding the catalogue, the
+saved index's size and load time, and the per-request latency of
+SymptomAnalyzer.analyze with the embedding engine, with NLI re-ranking of
+the top candidates, and with the NLI pipeline over every label. NLI over
+the whole catalogue is only run up to --nli-max conditions, since its cost
+grows linearly with them. Top-1 agreement compares the embedding engines
+with the NLI pipeline where both ran.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import torch
+from transformers import pipeline
+
+from benchmarks.bench_keyword_matcher import make_catalogue
+from initialize_symptoms_model import TEST_SYMPTOMS
+from models.embedding_index import EMBEDDING_MODEL, ConditionIndex, SentenceEncoder
+from models.inference_profile import ZERO_SHOT_MODEL
+from models.symptoms_model import SymptomAnalyzer
+
+
+def make_analyzer(conditions_info, engine, index_path=None):
+    """Return a lazily-loaded SymptomAnalyzer over a custom catalogue"""
+    analyzer = SymptomAnalyzer(engine=engine, lazy=True)
+    analyzer.conditions_info = conditions_info
+    analyzer.labels = list(conditions_info)
+    analyzer.index_path = index_path
+    analyzer._refresh_catalogue()
+    return analyzer
+
+
+def run(analyzer, repeats):
+    """Return (ms per request, top labels) for analyzing the sample texts"""
+    analyzer._classify(TEST_SYMPTOMS[0])  # warm-up
+
+    top_labels = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for text in TEST_SYMPTOMS:
+            top_labels.append(analyzer._classify(text)["labels"][0])
+    elapsed = time.perf_counter() - started
+    return elapsed * 1000 / (repeats * len(TEST_SYMPTOMS)), top_labels
+
+
+def agreement(tops, reference):
+    if reference is None:
+        return None
+    return sum(a == b for a, b in zip(tops, reference)) / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conditions", type=int, nargs="+", default=[5, 100, 1000, 10000])
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL)
+    parser.add_argument("--nli-model", default=ZERO_SHOT_MODEL)
+    parser.add_argument("--rerank-top", type=int, default=5)
+    parser.add_argument("--nli-max", type=int, default=100, help="Largest catalogue to run full NLI on")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    device = 0 if torch.cuda.is_available() else -1
+    encoder = SentenceEncoder(args.embedding_model, device=device)
+    nli = pipeline("zero-shot-classification", model=args.nli_model, device=device)
+    builtin = SymptomAnalyzer(lazy=True).conditions_info
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.conditions:
+            catalogue = dict(list(builtin.items())[:count])
+            catalogue.update(make_catalogue(max(0, count - len(catalogue))))
+            labels = list(catalogue)
+
+            started = time.perf_counter()
+            index = ConditionIndex.build(encoder, catalogue, labels)
+            build_s = time.perf_counter() - started
+            index_path = os.path.join(directory, f"{count}.index.npz")
+            index.save(index_path)
+            started = time.perf_counter()
+            ConditionIndex.load(index_path)
+            load_ms = (time.perf_counter() - started) * 1000
+
+            # The analyzer picks up the saved index rather than re-embedding
+            analyzer = make_analyzer(catalogue, "embedding", index_path)
+            analyzer.embedding_model = args.embedding_model
+            analyzer.load_classifier()
+            retrieval_ms, retrieval_tops = run(analyzer, args.repeats)
+
+            # Same retriever with the shared NLI pipeline re-ranking the top candidates
+            analyzer.rerank_top = analyzer.classifier.rerank_top = args.rerank_top
+            analyzer.classifier.reranker = nli
+            rerank_ms, rerank_tops = run(analyzer, args.repeats)
+
+            nli_ms = nli_tops = None
+            if count <= args.nli_max:
+                baseline = make_analyzer(catalogue, "pipeline")
+                baseline.classifier = nli
+                nli_ms, nli_tops = run(baseline, args.repeats)
+
+            rows.append({
+                "conditions": count,
+                "build_s": build_s,
+                "index_mb": os.path.getsize(index_path) / 1e6,
+                "load_ms": load_ms,
+                "retrieval_ms": retrieval_ms,
+                "rerank_ms": rerank_ms,
+                "nli_ms": nli_ms,
+                "retrieval_top1_agreement": agreement(retrieval_tops, nli_tops),
+                "rerank_top1_agreement": agreement(rerank_tops, nli_tops),
+            })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    print(f"{'conditions':>10} {'build s':>8} {'index MB':>9} {'load ms':>8} {'retrieval ms':>13} "
+          f"{'rerank ms':>10} {'NLI ms':>9} {'agree':>6} {'agree rr':>9}")
+    for row in rows:
+        print(
+            f"{row['conditions']:>10} {row['build_s']:>8.2f} {row['index_mb']:>9.2f} {row['load_ms']:>8.2f} "
+            f"{row['retrieval_ms']:>13.2f} {row['rerank_ms']:>10.2f} {fmt(row['nli_ms'], '.2f'):>9} "
+            f"{fmt(row['retrieval_top1_agreement'], '.0%'):>6} {fmt(row['rerank_top1_agreement'], '.0%'):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
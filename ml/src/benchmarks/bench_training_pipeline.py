@@ -0,0 +1,153 @@
+"""Compare training from in-memory arrays with the streaming tf.data pipeline.
+
+Run from ml/src:
+
+    python -m benchmarks.bench_training_pipeline --images 2000 --epochs 2
+
+Writes a synthetic per-class JPEG directory (and TFRecord shards of it),
+then trains MedicalImageClassifier on it once per mode, each in a fresh
+process:
+
+- arrays: every image decoded into one float32 array up front, then
+  `train(x, y)` as before
+- directory / records: streamed from the image files or the shards
+- directory+cache / records+cache: the same with decoded images cached in
+  memory after the first epoch
+
+Reports the time to load the arrays, images/sec for the first epoch and
+for later epochs, and the peak resident memory of the training process.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks import fixtures
+
+CLASS_NAMES = ["Pneumonia", "Normal", "COVID-19", "Tuberculosis", "Lung Cancer"]
+
+MODES = ("arrays", "directory", "directory+cache", "records", "records+cache")
+
+
+def write_image_directory(directory, count, seed=0):
+    images = fixtures.image_corpus(count, seed=seed, sizes=((1024, 1024), (768, 1024), (512, 512)))
+    for name in CLASS_NAMES:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    for i, data in enumerate(images):
+        with open(os.path.join(directory, CLASS_NAMES[i % len(CLASS_NAMES)], f"{i:06d}.jpg"), "wb") as f:
+            f.write(data)
+
+
+def train_mode(mode, image_dir, shard_pattern, epochs, batch_size, queue):
+    try:
+        queue.put(run_mode(mode, image_dir, shard_pattern, epochs, batch_size))
+    except Exception as e:
+        queue.put({"mode": mode, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_mode(mode, image_dir, shard_pattern, epochs, batch_size):
+    import numpy as np
+    import tensorflow as tf
+    from models.model import MedicalImageClassifier
+    from models.training_data import list_labelled_images
+
+    epoch_seconds = []
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.started = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            epoch_seconds.append(time.perf_counter() - self.started)
+
+    classifier = MedicalImageClassifier(num_classes=len(CLASS_NAMES))
+    paths, labels, _ = list_labelled_images(image_dir, CLASS_NAMES)
+    load_s = None
+
+    if mode == "arrays":
+        started = time.perf_counter()
+        encoded = []
+        for path in paths:
+            with open(path, "rb") as f:
+                encoded.append(f.read())
+        x, _ = classifier.preprocessor.preprocess_batch(encoded)
+        del encoded
+        y = np.eye(len(CLASS_NAMES), dtype=np.float32)[labels]
+        load_s = time.perf_counter() - started
+        classifier.train(x, y, epochs=epochs, batch_size=batch_size, callbacks=[EpochTimer()])
+    else:
+        source = image_dir if mode.startswith("directory") else shard_pattern
+        dataset = classifier.make_dataset(
+            source,
+            batch_size=batch_size,
+            cache="memory" if mode.endswith("+cache") else None,
+            class_names=CLASS_NAMES,
+            augment=True
+        )
+        classifier.train(dataset, epochs=epochs, callbacks=[EpochTimer()])
+
+    return {
+        "mode": mode,
+        "images": len(paths),
+        "load_s": load_s,
+        "first_epoch_images_per_s": len(paths) / epoch_seconds[0],
+        "later_epochs_images_per_s": (
+            len(paths) * (len(epoch_seconds) - 1) / sum(epoch_seconds[1:]) if len(epoch_seconds) > 1 else None
+        ),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        image_dir = os.path.join(directory, "images")
+        write_image_directory(image_dir, args.images)
+        shard_prefix = os.path.join(directory, "shards", "train")
+        if any(mode.startswith("records") for mode in args.modes):
+            from models.training_data import write_tfrecord_shards
+            write_tfrecord_shards(image_dir, shard_prefix, num_shards=args.shards, class_names=CLASS_NAMES)
+
+        for mode in args.modes:
+            queue = context.Queue()
+            process = context.Process(
+                target=train_mode,
+                args=(mode, image_dir, shard_prefix + "-*.tfrecord", args.epochs, args.batch_size, queue)
+            )
+            process.start()
+            rows.append(queue.get())
+            process.join()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    def fmt(value):
+        return f"{value:.1f}" if value is not None else "-"
+
+    print(f"{'mode':>16} {'load s':>8} {'epoch 1 img/s':>14} {'later img/s':>12} {'peak MB':>9}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['mode']:>16}  {row['error']}")
+            continue
+        print(
+            f"{row['mode']:>16} {fmt(row['load_s']):>8} {fmt(row['first_epoch_images_per_s']):>14} "
+            f"{fmt(row['later_epochs_images_per_s']):>12} {row['peak_rss_mb']:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Measure what the keyword/classifier cascade gains and loses on a labelled corpus.
+
+Run from ml/src:
+
+    python -m benchmarks.eval_cascade --texts 500 --min-matches 2 3 4 --margin 1 2
+
+Analyzes the corpus once with the classifier always running (the
+baseline), then once per early-exit policy in the grid. For each policy
+reports throughput and speedup over the baseline, how many texts keyword
+matching answered on its own, top-1 agreement with the baseline's
+diagnoses (the agreement given up by exiting early) and, for both, accuracy
+against the corpus labels.
+
+The corpus is synthetic (benchmarks.fixtures) unless --corpus names a JSON
+Lines file of {"text": ..., "condition": ...} records.
+"""
+import argparse
+import json
+import time
+
+from benchmarks import fixtures
+
+
+def load_corpus(path, count):
+    if path is None:
+        return fixtures.symptom_corpus(count)
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                corpus.append((record["text"], record["condition"]))
+    return corpus[:count] if count else corpus
+
+
+def run(analyzer, texts, batch_size, repeats):
+    """Return (texts per second, diagnoses, cascade stats) over `repeats` passes"""
+    analyzer.analyze_batch(texts[:batch_size])  # warm-up
+    analyzer._cascade_stats.reset()  # don't count the warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        diagnoses = []
+        for start in range(0, len(texts), batch_size):
+            diagnoses += [r["diagnosis"] for r in analyzer.analyze_batch(texts[start:start + batch_size])]
+    elapsed = time.perf_counter() - started
+    return len(texts) * repeats / elapsed, diagnoses, analyzer.cascade_stats()
+
+
+def share(values, reference):
+    return sum(a == b for a, b in zip(values, reference)) / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--corpus", help="JSON Lines file of labelled texts")
+    parser.add_argument("--engine", default="pipeline")
+    parser.add_argument("--profile", default="fp32")
+    parser.add_argument("--model", help="Zero-shot checkpoint overriding the profile's")
+    parser.add_argument("--min-matches", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--margin", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--min-confidence", type=float, default=40)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    from models.cascade import CascadePolicy
+    from models.inference_profile import InferenceProfile
+    from models.symptoms_model import SymptomAnalyzer
+
+    corpus = load_corpus(args.corpus, args.texts)
+    texts = [text for text, _ in corpus]
+    labels = [condition for _, condition in corpus]
+
+    analyzer = SymptomAnalyzer(engine=args.engine, profile=InferenceProfile(args.profile, model_name=args.model))
+
+    policies = [(None, None)] + [(m, margin) for m in args.min_matches for margin in args.margin]
+    rows = []
+    baseline = None
+    for min_matches, margin in policies:
+        analyzer.set_cascade(CascadePolicy(
+            keyword_min_matches=min_matches,
+            keyword_min_margin=margin or 1,
+            classifier_min_confidence=args.min_confidence
+        ))
+        throughput, diagnoses, stats = run(analyzer, texts, args.batch_size, args.repeats)
+        if baseline is None:
+            baseline = {"throughput": throughput, "diagnoses": diagnoses}
+        rows.append({
+            "min_matches": min_matches,
+            "margin": margin,
+            "texts_per_s": throughput,
+            "speedup": throughput / baseline["throughput"],
+            "keyword_exit_rate": stats["hit_rates"]["keyword_exit"],
+            "classifier_runs_saved": stats["classifier_runs_saved"],
+            "hit_rates": stats["hit_rates"],
+            "baseline_agreement": share(diagnoses, baseline["diagnoses"]),
+            "accuracy": share(diagnoses, labels),
+        })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'policy':>14} {'texts/s':>9} {'speedup':>8} {'kw exit':>8} {'agree':>7} {'accuracy':>9}")
+    for row in rows:
+        policy = "always" if row["min_matches"] is None else f">={row['min_matches']} +{row['margin']}"
+        print(
+            f"{policy:>14} {row['texts_per_s']:>9.1f} {row['speedup']:>7.2f}x {row['keyword_exit_rate']:>8.0%} "
+            f"{row['baseline_agreement']:>7.0%} {row['accuracy']:>9.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Offline stand-in models and synthetic corpora for benchmarks.
+
+Nothing here downloads anything. The zero-shot stand-in is a BART
+sequence classifier with random weights and a word-level tokenizer built
+from the synthetic vocabulary. It has the same architecture and
+interfaces as bart-large-mnli, only far smaller, so code paths and
+relative costs can be compared between runs but its predictions are
+meaningless. The image stand-in is MedicalImageClassifier's own CNN with
+random weights. Every generator is seeded, so the same arguments always
+give the same data.
+"""
+import io
+import os
+import random
+
+import numpy as np
+
+# Default SymptomAnalyzer catalogue, mirrored here so corpora can be built without it
+CONDITION_SYMPTOMS = {
+    "Respiratory infection": ["cough", "fever", "shortness of breath", "sore throat", "runny nose"],
+    "Migraine": ["headache", "sensitivity to light", "nausea", "blurred vision"],
+    "Gastrointestinal issue": ["abdominal pain", "diarrhea", "nausea", "vomiting", "bloating"],
+    "Allergic reaction": ["itching", "rash", "swelling", "runny nose", "watery eyes"],
+    "Common cold": ["runny nose", "cough", "sneezing", "sore throat", "mild fever"],
+}
+
+OPENINGS = ["I have", "I've had", "For two days I have had", "My child has", "Since yesterday I get", "I feel"]
+FILLERS = ["and", "with some", "plus", "along with", "and also", "as well as"]
+CLOSINGS = ["", "It is getting worse.", "It started after dinner.", "I also feel tired.", "Nothing helps."]
+
+SPECIAL_TOKENS = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+
+
+def symptom_corpus(count, seed=0, conditions=CONDITION_SYMPTOMS):
+    """Return `count` (text, condition) pairs of synthetic patient descriptions
+
+    Each text mentions two to four symptoms of its condition, so keyword
+    matching has realistic work to do and the label can be used to score
+    agreement.
+    """
+    rng = random.Random(seed)
+    names = list(conditions)
+    corpus = []
+    for _ in range(count):
+        condition = rng.choice(names)
+        symptoms = rng.sample(conditions[condition], min(len(conditions[condition]), rng.randint(2, 4)))
+        parts = [rng.choice(OPENINGS), symptoms[0]]
+        for symptom in symptoms[1:]:
+            parts += [rng.choice(FILLERS), symptom]
+        text = " ".join(parts) + ". " + rng.choice(CLOSINGS)
+        corpus.append((text.strip(), condition))
+    return corpus
+
+
+def image_corpus(count, seed=0, sizes=((512, 512), (1024, 768), (2048, 2048))):
+    """Return `count` JPEG-encoded synthetic X-ray-like images of mixed sizes"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        # Smooth gradient plus noise, so JPEG sizes are realistic rather than noise-sized
+        y, x = np.mgrid[0:height, 0:width]
+        base = (x / width * 96 + y / height * 96).astype(np.float32)
+        noise = rng.normal(0, 24, (height, width)).astype(np.float32)
+        gray = np.clip(base + noise + rng.integers(0, 64), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(gray).convert("RGB").save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def _vocabulary(conditions=CONDITION_SYMPTOMS):
+    words = set()
+    texts = [text for text, _ in symptom_corpus(500)] + list(conditions)
+    texts += ["This patient has {}", "This example is {}."] + OPENINGS + FILLERS + CLOSINGS
+    for text in texts:
+        for word in text.lower().replace(".", " . ").replace(",", " , ").split():
+            words.add(word)
+    return SPECIAL_TOKENS + sorted(words - set(SPECIAL_TOKENS))
+
+
+def build_tiny_bart(directory, seed=0, d_model=64, layers=2):
+    """Save a random-weight BART NLI model and tokenizer to `directory`
+
+    The directory can be passed as SYMPTOMS_MODEL (or InferenceProfile's
+    model_name) in place of facebook/bart-large-mnli.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import BartConfig, BartForSequenceClassification, PreTrainedTokenizerFast
+
+    vocabulary = _vocabulary()
+    token_ids = {token: i for i, token in enumerate(vocabulary)}
+    tokenizer = Tokenizer(models.WordLevel(token_ids, unk_token="<unk>"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    # BART's layout: <s> A </s> for single texts and <s> A </s></s> B </s> for pairs
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>",
+        pair="<s> $A </s> </s> $B </s>",
+        special_tokens=[("<s>", token_ids["<s>"]), ("</s>", token_ids["</s>"])]
+    )
+    fast_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>", eos_token="</s>", pad_token="<pad>", unk_token="<unk>", mask_token="<mask>",
+        model_max_length=128
+    )
+
+    config = BartConfig(
+        vocab_size=len(vocabulary),
+        d_model=d_model,
+        encoder_layers=layers,
+        decoder_layers=layers,
+        encoder_attention_heads=2,
+        decoder_attention_heads=2,
+        encoder_ffn_dim=d_model * 2,
+        decoder_ffn_dim=d_model * 2,
+        max_position_embeddings=128,
+        pad_token_id=token_ids["<pad>"],
+        bos_token_id=token_ids["<s>"],
+        eos_token_id=token_ids["</s>"],
+        decoder_start_token_id=token_ids["</s>"],
+        id2label={0: "contradiction", 1: "neutral", 2: "entailment"},
+        label2id={"contradiction": 0, "neutral": 1, "entailment": 2},
+    )
+    torch.manual_seed(seed)
+    model = BartForSequenceClassification(config)
+    model.eval()
+
+    os.makedirs(directory, exist_ok=True)
+    model.save_pretrained(directory)
+    fast_tokenizer.save_pretrained(directory)
+    return directory
+
+
+def build_image_model(path, seed=0):
+    """Save a random-weight MedicalImageClassifier to `path` and return the path"""
+    import tensorflow as tf
+    from models.model import MedicalImageClassifier
+
+    tf.random.set_seed(seed)
+    classifier = MedicalImageClassifier()
+    classifier.save(path)
+    return path
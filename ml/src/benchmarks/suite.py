@@ -0,0 +1,403 @@
+"""Reproducible offline benchmark suite with regression checks.
+
+Run from ml/src:
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output new.json --baseline bench.json --threshold 0.15
+
+Uses the stand-in models and seeded corpora from benchmarks/fixtures.py,
+so it needs no network access and the same code gives comparable
+numbers from run to run on the same machine.
+
+Two groups are run:
+
+- micro: one function per benchmark (keyword matching, SymptomAnalyzer.analyze
+  and analyze_batch with and without the classifier, image preprocessing,
+  MedicalImageClassifier.predict). Each runs in a fresh process for a fixed
+  number of iterations after a warm-up.
+- http: the Flask app serving the stand-in models, loaded route by route
+  at a fixed concurrency for a fixed duration.
+
+Every result reports throughput (items/s), p50/p95/p99 latency in
+milliseconds and peak resident memory of the process that ran it. The
+report is written as JSON. With --baseline, the run fails (exit status 1)
+if any benchmark's throughput fell, or its p95 latency or peak memory
+grew, by more than the threshold.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import fixtures
+from benchmarks.bench_http_load import SERVERS, multipart_body, run_load, wait_ready
+
+SEED = 0
+
+
+def _peak_rss_mb(pid=None):
+    """Peak resident memory of this process, or of another one via /proc"""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+# Micro benchmarks: setup(models) returns (call(i), items per call)
+
+def _texts(count=256):
+    return [text for text, _ in fixtures.symptom_corpus(count, seed=SEED)]
+
+
+def setup_keyword_matching(models):
+    from models.symptoms_model import SymptomAnalyzer
+    analyzer = SymptomAnalyzer(lazy=True)
+    texts = _texts()
+    return (lambda i: analyzer._keyword_matching(texts[i % len(texts)])), 1
+
+
+def setup_analyze_keyword_only(models):
+    from models.symptoms_model import SymptomAnalyzer
+    analyzer = SymptomAnalyzer(lazy=True)
+    texts = _texts()
+    return (lambda i: analyzer.analyze(texts[i % len(texts)])), 1
+
+
+def _analyzer_with_classifier(models, engine="pipeline"):
+    from models.inference_profile import InferenceProfile
+    from models.symptoms_model import SymptomAnalyzer
+    profile = InferenceProfile("fp32", intra_op_threads=1, inter_op_threads=1, model_name=models["bart"])
+    analyzer = SymptomAnalyzer(engine=engine, profile=profile)
+    if analyzer.classifier is None:
+        raise RuntimeError("The stand-in classifier failed to load")
+    return analyzer
+
+
+def setup_analyze(models):
+    analyzer = _analyzer_with_classifier(models)
+    texts = _texts()
+    return (lambda i: analyzer.analyze(texts[i % len(texts)])), 1
+
+
+def setup_analyze_batch(models):
+    analyzer = _analyzer_with_classifier(models)
+    texts = _texts()
+    return (lambda i: analyzer.analyze_batch(texts[(i * 32) % 224:(i * 32) % 224 + 32])), 32
+
+
+def setup_preprocess(models):
+    from models.preprocessing import ImagePreprocessor
+    preprocessor = ImagePreprocessor((224, 224))
+    images = fixtures.image_corpus(6, seed=SEED)
+    return (lambda i: preprocessor.preprocess(images[i % len(images)])), 1
+
+
+def setup_predict(models):
+    import numpy as np
+    from models.model import MedicalImageClassifier
+    classifier = MedicalImageClassifier.load(models["image"])
+    batch = np.random.default_rng(SEED).random((1, 224, 224, 3), dtype=np.float32)
+    return (lambda i: classifier.predict(batch)), 1
+
+
+def setup_predict_batch(models):
+    import numpy as np
+    from models.model import MedicalImageClassifier
+    classifier = MedicalImageClassifier.load(models["image"])
+    batch = np.random.default_rng(SEED).random((32, 224, 224, 3), dtype=np.float32)
+    return (lambda i: classifier.predict(batch)), 32
+
+
+# name: (setup, iterations, warm-up iterations)
+MICROBENCHMARKS = {
+    "keyword_matching": (setup_keyword_matching, 20000, 200),
+    "analyze_keyword_only": (setup_analyze_keyword_only, 20000, 200),
+    "analyze": (setup_analyze, 300, 10),
+    "analyze_batch32": (setup_analyze_batch, 30, 2),
+    "preprocess": (setup_preprocess, 120, 6),
+    "predict": (setup_predict, 200, 5),
+    "predict_batch32": (setup_predict_batch, 20, 2),
+}
+
+
+def collect_micro(process, queue, timeout):
+    """Wait for a micro benchmark's result, or an error if its process dies or hangs"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except queue_module.Empty:
+            pass
+        if not process.is_alive():
+            try:
+                # The result may have arrived just before the process exited
+                return queue.get(timeout=1)
+            except queue_module.Empty:
+                return {"error": f"benchmark process exited with code {process.exitcode}"}
+        if time.monotonic() > deadline:
+            process.terminate()
+            return {"error": f"no result within {timeout:.0f}s"}
+
+
+def run_micro(name, models, scale, queue):
+    try:
+        setup, iterations, warmup = MICROBENCHMARKS[name]
+        call, items_per_call = setup(models)
+        for i in range(warmup):
+            call(i)
+
+        iterations = max(1, int(iterations * scale))
+        latencies = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+        return
+
+    total_seconds = sum(latencies) / 1000
+    latencies.sort()
+    queue.put({
+        "iterations": iterations,
+        "throughput": items_per_call * iterations / total_seconds,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "p99_ms": _percentile(latencies, 0.99),
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+
+
+# HTTP routes: name -> request(i) giving (method, path, body, headers)
+
+def http_requests(route):
+    texts = _texts()
+    if route == "symptoms":
+        def request(i):
+            body = json.dumps({"symptoms": texts[i % len(texts)]}).encode()
+            return "POST", "/api/symptoms", body, {"Content-Type": "application/json"}
+    elif route == "symptoms_batch":
+        def request(i):
+            start = (i * 16) % (len(texts) - 16)
+            body = json.dumps({"symptoms": texts[start:start + 16]}).encode()
+            return "POST", "/api/symptoms/batch", body, {"Content-Type": "application/json"}
+    elif route == "predict":
+        bodies = [multipart_body("image", [("xray.jpg", image)]) for image in fixtures.image_corpus(3, seed=SEED)]
+
+        def request(i):
+            body, content_type = bodies[i % len(bodies)]
+            return "POST", "/api/predict", body, {"Content-Type": content_type}
+    elif route == "predict_batch":
+        images = fixtures.image_corpus(8, seed=SEED, sizes=((512, 512),))
+        body, content_type = multipart_body("images", [(f"xray{i}.jpg", image) for i, image in enumerate(images)])
+
+        def request(i):
+            return "POST", "/api/predict/batch", body, {"Content-Type": content_type}
+    elif route == "create_diagnosis":
+        def request(i):
+            payload = {"type": "symptoms", "data": {
+                "description": texts[i % len(texts)],
+                "mlAnalysis": {"diagnosis": "Migraine", "confidence": 80, "processingTimeMs": 120}
+            }}
+            return "POST", "/api/diagnoses", json.dumps(payload).encode(), {"Content-Type": "application/json"}
+    elif route == "list_diagnoses":
+        def request(i):
+            return "GET", "/api/diagnoses?limit=50", None, {}
+    elif route == "stats":
+        def request(i):
+            return "GET", "/api/stats", None, {}
+    else:
+        raise ValueError(f"Unknown route '{route}'")
+    return request
+
+
+HTTP_ROUTES = (
+    "symptoms", "symptoms_batch", "predict", "predict_batch", "create_diagnosis", "list_diagnoses", "stats"
+)
+
+# Items per request, so HTTP throughput is comparable with the micro benchmarks
+HTTP_ITEMS = {"symptoms_batch": 16, "predict_batch": 8}
+
+
+def run_http(models, routes, server, concurrency, duration, port, directory):
+    env = dict(
+        os.environ,
+        SYMPTOMS_MODEL=models["bart"],
+        IMAGE_MODEL_PATH=models["image"],
+        RESULT_CACHE_SIZE="0",
+        DIAGNOSES_DB=os.path.join(directory, "diagnoses.db"),
+        DIAGNOSIS_JOBS_DB=os.path.join(directory, "diagnosis_jobs.db"),
+        TORCH_INTRA_OP_THREADS="1",
+        HF_HUB_OFFLINE="1",
+        TRANSFORMERS_OFFLINE="1",
+    )
+    # Keep the server on the stand-in models and temp files, whatever the caller has set
+    for name in ("MODEL_SERVER_SOCKET", "PROFILE_DIR", "SYMPTOMS_CATALOGUE"):
+        env.pop(name, None)
+    process = subprocess.Popen(SERVERS[server](port, 1), env=env, stdout=subprocess.DEVNULL)
+    results = {}
+    try:
+        if not wait_ready(port, timeout=300, process=process):
+            return {f"http/{route}": {"error": "server did not become ready"} for route in routes}
+        for route in routes:
+            load = run_load(port, http_requests(route), concurrency, duration, timeout=60)
+            errors = load["other_errors"] + load["failed_connections"] + load["rejected_503"]
+            result = {
+                "concurrency": concurrency,
+                "throughput": load["throughput_rps"] * HTTP_ITEMS.get(route, 1),
+                "p50_ms": load["p50_ms"],
+                "p95_ms": load["p95_ms"],
+                "p99_ms": load["p99_ms"],
+                "errors": errors,
+                "peak_rss_mb": _peak_rss_mb(process.pid),
+            }
+            if not load["ok"]:
+                result = {"error": f"no successful responses ({errors} errors)"}
+            results[f"http/{route}"] = result
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+# Regression checks: metric -> whether higher values are better
+COMPARED_METRICS = {"throughput": True, "p95_ms": False, "peak_rss_mb": False}
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """Return a description of every metric that regressed beyond its threshold"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None or "error" in previous:
+            continue
+        if "error" in result:
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            limit = memory_threshold if metric == "peak_rss_mb" else threshold
+            worse = -change if higher_is_better else change
+            if worse > limit:
+                regressions.append(f"{name}: {metric} {old:.2f} -> {new:.2f} ({change:+.1%}, limit {limit:.0%})")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Allowed relative drop in throughput or rise in p95 latency (default 0.15)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="Allowed relative rise in peak memory (default 0.10)")
+    parser.add_argument("--groups", nargs="+", default=["micro", "http"], choices=["micro", "http"])
+    parser.add_argument("--micro", nargs="+", default=list(MICROBENCHMARKS), choices=list(MICROBENCHMARKS))
+    parser.add_argument("--routes", nargs="+", default=list(HTTP_ROUTES), choices=list(HTTP_ROUTES))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply micro benchmark iteration counts")
+    parser.add_argument("--server", default="flask", choices=list(SERVERS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per route")
+    parser.add_argument("--port", type=int, default=5098)
+    parser.add_argument("--micro-timeout", type=float, default=900,
+                        help="Seconds to wait for each micro benchmark before recording an error")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        print("Building stand-in models...", file=sys.stderr)
+        models = {
+            "bart": fixtures.build_tiny_bart(os.path.join(directory, "tiny-bart"), seed=SEED),
+            "image": fixtures.build_image_model(os.path.join(directory, "image_model.keras"), seed=SEED),
+        }
+
+        if "micro" in args.groups:
+            for name in args.micro:
+                print(f"micro/{name}", file=sys.stderr)
+                queue = context.Queue()
+                process = context.Process(target=run_micro, args=(name, models, args.scale, queue))
+                process.start()
+                results[f"micro/{name}"] = collect_micro(process, queue, args.micro_timeout)
+                process.join()
+
+        if "http" in args.groups:
+            print(f"http ({args.server}, {args.concurrency} connections)", file=sys.stderr)
+            results.update(run_http(
+                models, args.routes, args.server, args.concurrency, args.duration, args.port, directory
+            ))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": SEED,
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    print(f"\n{'benchmark':>30} {'items/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}",
+          file=sys.stderr)
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:>30}  {result['error']}", file=sys.stderr)
+            continue
+        peak = f"{result['peak_rss_mb']:.0f}" if result.get("peak_rss_mb") else "-"
+        print(f"{name:>30} {result['throughput']:>10.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {peak:>8}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        if regressions:
+            print("\nRegressions against the baseline:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("\nNo regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+# Job states in the backlog; finished jobs are deleted
+QUEUED = "queued"
+RUNNING = "running"
+
+
+class BacklogFull(RuntimeError):
+    """Raised when the job backlog already holds its maximum number of jobs"""
+
+
+class JobBacklog:
+    """Durable FIFO of diagnosis jobs in a local SQLite file.
+
+    Jobs survive restarts: a job is only deleted once it has been
+    processed. A claimed job is leased to this backlog instance for
+    `lease_seconds`; the owner keeps it with renew() while it works, and a
+    job whose lease ran out (its process died or hung) is put back in the
+    queue by the next claim() or recover() in any process. Owners are
+    random tokens, so a reused process id never looks like a live owner.
+    Every worker process on the host can share one backlog file; claims
+    take a write lock, so each job is handed to one worker at a time.
+    `path=":memory:"` keeps the backlog in memory for a single process.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            data BLOB,
+            state TEXT NOT NULL,
+            owner TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL,
+            lease_expires REAL,
+            not_before REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, seq);
+    """
+
+    # Columns added since the first version of the schema
+    MIGRATIONS = {
+        "lease_expires": "ALTER TABLE jobs ADD COLUMN lease_expires REAL",
+        "not_before": "ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0",
+    }
+
+    def __init__(self, path, max_jobs=None, lease_seconds=30):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.lease_seconds = lease_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.owner = None
+        with self._lock:
+            conn = self._connection()
+            conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in self.MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+
+    def _connection(self):
+        """Return this process's connection (callers hold self._lock)"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA busy_timeout=30000")
+            self._conn, self._pid = conn, os.getpid()
+            # A forked child must not share its parent's leases
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        return self._conn
+
+    def _requeue_expired(self, conn, now):
+        """Requeue running jobs whose lease has run out (callers hold the write lock)"""
+        return conn.execute(
+            "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL "
+            "WHERE state = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (QUEUED, RUNNING, now)
+        ).rowcount
+
+    def enqueue(self, job_id, kind, payload, data=None):
+        """Add a job, raising BacklogFull if the backlog is at `max_jobs`"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.max_jobs is not None:
+                    (count,) = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+                    if count >= self.max_jobs:
+                        raise BacklogFull("Diagnosis backlog is full")
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, payload, data, state, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, json.dumps(payload), data, QUEUED, time.time())
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def claim(self):
+        """Lease the oldest queued job that is due to this backlog and return it, or None
+
+        Jobs whose lease has expired are requeued first.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired(conn, now)
+                row = conn.execute(
+                    "SELECT seq, id, kind, payload, data, attempts, enqueued_at FROM jobs "
+                    "WHERE state = ? AND not_before <= ? ORDER BY seq LIMIT 1",
+                    (QUEUED, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE seq = ?",
+                        (RUNNING, self.owner, now + self.lease_seconds, row[0])
+                    )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        _, job_id, kind, payload, data, attempts, enqueued_at = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "data": data,
+            "attempts": attempts + 1,
+            "enqueued_at": enqueued_at,
+        }
+
+    def complete(self, job_id):
+        """Remove a finished job; returns False if its lease had passed to another owner"""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND owner = ?", (job_id, self.owner)
+            ).rowcount > 0
+
+    def release(self, job_id, delay=0):
+        """Put a claimed job back in the queue, to be claimed again after `delay` seconds"""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, not_before = ? "
+                "WHERE id = ? AND owner = ?",
+                (QUEUED, time.time() + delay, job_id, self.owner)
+            ).rowcount > 0
+
+    def renew(self):
+        """Extend the leases of every job this backlog is running; returns how many"""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE state = ? AND owner = ?",
+                (time.time() + self.lease_seconds, RUNNING, self.owner)
+            ).rowcount
+
+    def recover(self):
+        """Requeue running jobs whose lease has expired; returns how many"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                recovered = self._requeue_expired(conn, time.time())
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return recovered
+
+    def counts(self):
+        """Return the number of jobs in each state"""
+        with self._lock:
+            rows = self._connection().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys((QUEUED, RUNNING), 0)
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+
+class JobRunner:
+    """Fixed pool of worker threads draining a JobBacklog.
+
+    Each worker claims the oldest queued job and calls `process(job)`. A job
+    whose processing raises is retried, after `retry_delay` seconds doubled
+    on each further attempt, until it has been attempted `max_attempts`
+    times; then `fail(job, error)` is called and the job is dropped. A job
+    claimed more often than that, because the workers holding it kept
+    dying, is failed without processing it again. Workers wait for
+    `ready()` to return before taking their first job, e.g. until the
+    models have loaded. submit() wakes an idle worker immediately; jobs
+    added by other processes sharing the backlog, and jobs whose lease
+    expired, are picked up within `poll_interval` seconds. A heartbeat
+    thread renews the leases of running jobs, and a worker that hits an
+    unexpected error backs off and keeps going.
+
+    wait_for_change() lets request handlers long-poll: it returns when any
+    job in this process finishes a step, or after the timeout.
+    """
+
+    # Longest pause of a worker whose loop keeps failing
+    MAX_ERROR_BACKOFF = 30.0
+
+    def __init__(self, backlog, process, fail, workers=2, max_attempts=3, poll_interval=1.0, ready=None,
+                 retry_delay=1.0):
+        self.backlog = backlog
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._process = process
+        self._fail = fail
+        self._ready = ready
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Condition()
+        self._changed = threading.Condition()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._errors = 0
+
+    def start(self):
+        """Requeue jobs whose lease has expired and start the workers"""
+        if self._threads:
+            return
+        recovered = self.backlog.recover()
+        if recovered:
+            print(f"Requeued {recovered} unfinished diagnosis jobs")
+        targets = [(self._work, f"diagnosis-job-{i}") for i in range(self.workers)]
+        targets.append((self._heartbeat, "diagnosis-job-lease"))
+        for target, name in targets:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job_id, kind, payload, data=None):
+        """Add a job to the backlog (raises BacklogFull) and wake a worker"""
+        self.backlog.enqueue(job_id, kind, payload, data)
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def notify_changed(self):
+        """Wake long-polling requests, e.g. after a job's record was updated"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait_for_change(self, timeout):
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _work(self):
+        if self._ready is not None:
+            try:
+                self._ready()
+            except Exception:
+                traceback.print_exc()
+        backoff = self.poll_interval
+        while not self._stopping.is_set():
+            try:
+                self._work_once()
+            except Exception:
+                # e.g. the backlog file is locked or unreadable: don't lose the worker
+                traceback.print_exc()
+                with self._lock:
+                    self._errors += 1
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.MAX_ERROR_BACKOFF)
+            else:
+                backoff = self.poll_interval
+
+    def _work_once(self):
+        job = self.backlog.claim()
+        if job is None:
+            with self._wakeup:
+                self._wakeup.wait(self.poll_interval)
+            return
+
+        with self._lock:
+            self._busy += 1
+        try:
+            if job["attempts"] > self.max_attempts:
+                self._finish_failed(job, RuntimeError("Job was abandoned by its worker too many times"))
+                return
+            try:
+                self._process(job)
+            except Exception as e:
+                traceback.print_exc()
+                self._finish_failed(job, e)
+            else:
+                self.backlog.complete(job["id"])
+                with self._lock:
+                    self._completed += 1
+        finally:
+            with self._lock:
+                self._busy -= 1
+            self.notify_changed()
+
+    def _finish_failed(self, job, error):
+        if job["attempts"] < self.max_attempts:
+            self.backlog.release(job["id"], delay=self.retry_delay * 2 ** (job["attempts"] - 1))
+            with self._lock:
+                self._retried += 1
+            return
+        try:
+            self._fail(job, error)
+        finally:
+            self.backlog.complete(job["id"])
+            with self._lock:
+                self._failed += 1
+
+    def _heartbeat(self):
+        """Renew this process's leases well before they run out"""
+        while not self._stopping.wait(self.backlog.lease_seconds / 3):
+            try:
+                self.backlog.renew()
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "workers": self.workers,
+                "busy": self._busy,
+                "completed": self._completed,
+                "failed": self._failed,
+                "retried": self._retried,
+                "errors": self._errors,
+            }
+        stats["backlog"] = self.backlog.counts()
+        stats["max_backlog"] = self.backlog.max_jobs
+        return stats
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
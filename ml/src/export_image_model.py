@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from models.model import (
+    MedicalImageClassifier,
+    SERVING_FORMATS,
+    SERVING_RUNTIMES,
+    write_serving_manifest
+)
+
+# Minimum top-1 agreement with the Keras model for a format to be served
+PARITY_THRESHOLD = 0.99
+
+
+def load_eval_data(path, input_shape, count):
+    """Load a held-out set from an .npz with `x` (images) and optional `y` (one-hot labels)"""
+    if path:
+        data = np.load(path)
+        x = data["x"].astype(np.float32)
+        y = data["y"] if "y" in data else None
+        return x, y
+    print("No --eval-data given; parity is measured on random inputs and recorded as unknown")
+    return np.random.random((count, *input_shape)).astype(np.float32), None
+
+
+def measure_latency(model, x, repeats):
+    """Return median single-image latency in milliseconds"""
+    model.predict(x[:1])  # warm up
+    samples = []
+    for i in range(repeats):
+        sample = x[i % len(x)][None]
+        started = time.perf_counter()
+        model.predict(sample)
+        samples.append((time.perf_counter() - started) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    """Export a trained MedicalImageClassifier for serving and check each format"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("model_path", help="Saved Keras model (MedicalImageClassifier.save)")
+    parser.add_argument("output_dir", help="Directory for the serving artifacts")
+    parser.add_argument("--formats", nargs="+", default=["savedmodel", "tflite"], choices=SERVING_FORMATS)
+    parser.add_argument("--int8", action="store_true", help="Also export an int8-quantized TFLite model")
+    parser.add_argument("--eval-data", help=".npz file with held-out `x` and `y` arrays")
+    parser.add_argument("--eval-count", type=int, default=64, help="Random samples when --eval-data is omitted")
+    parser.add_argument("--repeats", type=int, default=50, help="Single-image predictions to time per format")
+    args = parser.parse_args()
+    if not args.eval_data and (args.int8 or "tflite_int8" in args.formats):
+        parser.error("int8 quantization needs --eval-data to calibrate on and to check parity")
+
+    classifier = MedicalImageClassifier.load(args.model_path)
+    x, y = load_eval_data(args.eval_data, classifier.input_shape, args.eval_count)
+
+    formats = list(args.formats)
+    if args.int8 and "tflite_int8" not in formats:
+        formats.append("tflite_int8")
+
+    manifest = classifier.export(args.output_dir, formats=formats, representative_data=x, skip_unavailable=True)
+    exported = list(manifest["formats"])
+
+    # Reference predictions from the Keras model
+    reference = classifier.predict(x)
+    keras_report = {
+        "size_bytes": None,
+        "latency_ms": measure_latency(classifier, x, args.repeats),
+        "accuracy": float(np.mean(reference.argmax(1) == y.argmax(1))) if y is not None else None,
+        "agreement": 1.0,
+        "parity_ok": True
+    }
+
+    for fmt in exported:
+        info = manifest["formats"][fmt]
+        try:
+            model = SERVING_RUNTIMES[fmt](os.path.join(args.output_dir, info["path"]))
+        except Exception as e:
+            print(f"Could not load {fmt} for evaluation: {e}")
+            info["latency_ms"] = None
+            continue
+
+        predictions = model.predict(x)
+        agreement = float(np.mean(predictions.argmax(1) == reference.argmax(1)))
+        info.update({
+            "latency_ms": measure_latency(model, x, args.repeats),
+            "agreement": agreement,
+            "max_abs_diff": float(np.max(np.abs(predictions - reference))),
+            "accuracy": float(np.mean(predictions.argmax(1) == y.argmax(1))) if y is not None else None,
+            # Agreement on random inputs says nothing about real images
+            "parity_ok": agreement >= PARITY_THRESHOLD if args.eval_data else None
+        })
+
+    # The loader uses these measurements to pick the fastest format that passed parity on held-out data
+    write_serving_manifest(args.output_dir, manifest)
+
+    print(f"\n{'format':>12} {'size MB':>9} {'latency ms':>11} {'accuracy':>9} {'agreement':>10} {'parity':>7}")
+    rows = [("keras", keras_report)] + list(manifest["formats"].items())
+    for name, info in rows:
+        size = f"{info['size_bytes'] / 1024 / 1024:.2f}" if info.get("size_bytes") else "-"
+        latency = f"{info['latency_ms']:.2f}" if info.get("latency_ms") is not None else "-"
+        accuracy = f"{info['accuracy']:.3f}" if info.get("accuracy") is not None else "-"
+        agreement = f"{info['agreement']:.3f}" if info.get("agreement") is not None else "-"
+        parity = {True: "ok", False: "FAIL", None: "unknown"}[info.get("parity_ok")]
+        print(f"{name:>12} {size:>9} {latency:>11} {accuracy:>9} {agreement:>10} {parity:>7}")
+
+
+if __name__ == "__main__":
+    main()
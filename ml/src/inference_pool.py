@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolFull(RuntimeError):
+    """Raised when the inference pool's backlog is full"""
+
+
+class InferencePool:
+    """Thread pool for blocking model calls with a bounded backlog.
+
+    At most `max_workers` calls run at once and at most `max_pending` more
+    wait for a thread. Beyond that, submit() raises PoolFull instead of
+    queueing, so an overloaded server can answer 503 right away rather
+    than letting latency grow without bound.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs), returning a concurrent.futures.Future"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PoolFull("Inference queue is full")
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn in the pool and await its result from the event loop
+
+        Like asyncio.to_thread, fn sees the caller's context variables,
+        so stage timings land on the right request.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.wrap_future(self.submit(context.run, fn, *args, **kwargs))
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            if future is not None:
+                self._completed += 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
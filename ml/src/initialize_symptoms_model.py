@@ -1,6 +1,16 @@
 import os
 import sys
 from models.symptoms_model import SymptomAnalyzer
+from models.catalogue import DEFAULT_CATALOGUE_PATH
+
+# Sample symptom descriptions used to smoke-test the model
+TEST_SYMPTOMS = [
+    "I have a headache and sensitivity to light",
+    "I'm experiencing cough, fever, and sore throat",
+    "I have abdominal pain and nausea",
+    "I have a rash and itchy skin",
+    "I feel tired and have a mild fever"
+]
 
 def main():
     """Initialize and test the ClinicalBERT symptom analyzer model"""
@@ -13,21 +23,13 @@ def main():
     model = SymptomAnalyzer(clinical_model="emilyalsentzer/Bio_ClinicalBERT")
     
     # Save the model configuration
-    model_path = os.path.join("models", "clinical_symptoms_analyzer.pkl")
+    model_path = DEFAULT_CATALOGUE_PATH
     model.save(model_path)
     print(f"Model configuration saved to {model_path}")
     
     # Test the model
-    test_symptoms = [
-        "I have a headache and sensitivity to light",
-        "I'm experiencing cough, fever, and sore throat",
-        "I have abdominal pain and nausea",
-        "I have a rash and itchy skin",
-        "I feel tired and have a mild fever"
-    ]
-    
     print("\nTesting the ClinicalBERT model with sample symptoms:")
-    for symptom in test_symptoms:
+    for symptom in TEST_SYMPTOMS:
         result = model.analyze(symptom)
         print(f"\nSymptoms: {symptom}")
         print(f"Diagnosis: {result['diagnosis']}")
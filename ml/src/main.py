@@ -1,27 +1,167 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import numpy as np
-import tensorflow as tf
-from models.model import MedicalImageClassifier
 from models.symptoms_model import SymptomAnalyzer
+from models.inference_profile import InferenceProfile
+from models.embedding_index import EMBEDDING_MODEL
+from models.catalogue import find_catalogue
+from models.cascade import CascadePolicy
+from cache import ResultCache, normalize_text, hash_bytes
+from model_loader import ModelLoader
+from storage import create_store, decode_cursor, stream_page
+from diagnosis_jobs import BacklogFull, JobBacklog, JobRunner
+from models.preprocessing import ImagePreprocessor
+import metrics
 import os
 import json
-from PIL import Image
-import io
+import math
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
 import uuid
+import time
 from datetime import datetime
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# Enable CORS for all routes; browsers may read the ETag to poll /api/diagnoses with If-None-Match
+CORS(app, expose_headers=["ETag"])
 
 # Model paths
-CLINICAL_CONFIG_PATH = os.path.join("models", "clinical_symptoms_analyzer.pkl")
+# Condition catalogue (SYMPTOMS_CATALOGUE overrides the path; legacy pickles are still read)
+CLINICAL_CONFIG_PATH = find_catalogue(os.environ.get("SYMPTOMS_CATALOGUE"))
+# Seconds between checks for a changed catalogue file, which is then reloaded in place (0 disables)
+CATALOGUE_RELOAD_INTERVAL = float(os.environ.get("CATALOGUE_RELOAD_INTERVAL", 10))
+IMAGE_MODEL_PATH = os.environ.get("IMAGE_MODEL_PATH")
+IMAGE_RUNTIME = os.environ.get("IMAGE_RUNTIME")  # force a serving format, e.g. "tflite"
 
-# Load the models
+# Diagnosis storage: a SQLite file shared by all workers, or ":memory:" for a process-local dict
+DIAGNOSES_DB = os.environ.get("DIAGNOSES_DB", os.path.join("data", "diagnoses.db"))
+DIAGNOSES_PAGE_SIZE = int(os.environ.get("DIAGNOSES_PAGE_SIZE", 100))
+DIAGNOSES_MAX_PAGE_SIZE = int(os.environ.get("DIAGNOSES_MAX_PAGE_SIZE", 1000))
+
+# Background diagnosis jobs: durable backlog file (":memory:" for a process-local one),
+# worker threads per process, backlog limit, attempts per job and the longest long-poll
+DIAGNOSIS_JOBS_DB = os.environ.get("DIAGNOSIS_JOBS_DB", os.path.join("data", "diagnosis_jobs.db"))
+DIAGNOSIS_WORKERS = int(os.environ.get("DIAGNOSIS_WORKERS", 2))
+DIAGNOSIS_BACKLOG = int(os.environ.get("DIAGNOSIS_BACKLOG", 1000))
+DIAGNOSIS_MAX_ATTEMPTS = int(os.environ.get("DIAGNOSIS_MAX_ATTEMPTS", 3))
+DIAGNOSIS_MAX_WAIT = float(os.environ.get("DIAGNOSIS_MAX_WAIT", 30))
+# Seconds before a failed job is retried (doubled per attempt), and how long a
+# claimed job stays leased without a heartbeat before another worker may take it
+DIAGNOSIS_RETRY_DELAY = float(os.environ.get("DIAGNOSIS_RETRY_DELAY", 1))
+DIAGNOSIS_LEASE_SECONDS = float(os.environ.get("DIAGNOSIS_LEASE_SECONDS", 30))
+# Seconds clients are told to wait when the backlog is full
+DIAGNOSIS_RETRY_AFTER = int(os.environ.get("DIAGNOSIS_RETRY_AFTER", 5))
+
+# Load models in a background thread so the app starts serving immediately
+MODEL_BACKGROUND_LOAD = os.environ.get("MODEL_BACKGROUND_LOAD", "1") != "0"
+# Retries of a model that failed to load, and the first delay between them (doubled each time)
+MODEL_LOAD_RETRIES = int(os.environ.get("MODEL_LOAD_RETRIES", 2))
+MODEL_LOAD_RETRY_DELAY = float(os.environ.get("MODEL_LOAD_RETRY_DELAY", 10))
+
+# Zero-shot inference engine: "pipeline" (default) or "embedding"
+SYMPTOMS_ENGINE = os.environ.get("SYMPTOMS_ENGINE", "pipeline")
+
+# "embedding" engine: sentence encoder, and how many top candidates NLI re-ranks (0 = none)
+SYMPTOMS_EMBEDDING_MODEL = os.environ.get("SYMPTOMS_EMBEDDING_MODEL", EMBEDDING_MODEL)
+SYMPTOMS_RERANK_TOP = int(os.environ.get("SYMPTOMS_RERANK_TOP", 0))
+
+# Skip the classifier when keyword matching is decisive (opt-in with
+# SYMPTOMS_CASCADE_MIN_MATCHES, and SYMPTOMS_CASCADE_MIN_MARGIN)
+SYMPTOMS_CASCADE = CascadePolicy.from_env()
+
+# Checkpoint/quantization profile and torch thread pools (SYMPTOMS_PROFILE,
+# TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS)
+SYMPTOMS_PROFILE = InferenceProfile.from_env()
+
+# Micro-batching for zero-shot inference (set SYMPTOMS_BATCH_SIZE=1 to disable)
+SYMPTOMS_BATCH_SIZE = int(os.environ.get("SYMPTOMS_BATCH_SIZE", 16))
+SYMPTOMS_BATCH_WAIT_MS = float(os.environ.get("SYMPTOMS_BATCH_WAIT_MS", 10))
+
+# Most premise/label pairs per classifier forward pass; bigger batches are split
+SYMPTOMS_MAX_PAIRS_PER_FORWARD = int(os.environ.get("SYMPTOMS_MAX_PAIRS_PER_FORWARD", 256))
+
+# Batch endpoints: items per model call and threads for image decoding
+SYMPTOMS_BATCH_CHUNK = int(os.environ.get("SYMPTOMS_BATCH_CHUNK", 32))
+IMAGE_BATCH_SIZE = int(os.environ.get("IMAGE_BATCH_SIZE", 32))
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", os.cpu_count() or 4))
+
+# Result cache for /api/symptoms and /api/predict (set RESULT_CACHE_SIZE=0 to disable)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", 64))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 3600))
+
+# Per-request sampling profiles: requests sent with "X-Profile: 1" write
+# collapsed stacks to this directory (profiling is off when it is unset)
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+
+# Share one copy of the models between all workers on a node: when set,
+# requests are forwarded to `python model_server.py` listening on this socket
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET")
+
+# Load the models. Only the condition catalogue is read here; the classifier
+# is loaded by `model_loader` and keyword matching serves requests until then.
 image_model = None
-symptoms_model = SymptomAnalyzer(
-    model_path=CLINICAL_CONFIG_PATH if os.path.exists(CLINICAL_CONFIG_PATH) else None
-)
+if MODEL_SERVER_SOCKET:
+    from model_server import ModelClient, RemoteImageModel, RemoteSymptomAnalyzer
+    model_client = ModelClient(MODEL_SERVER_SOCKET)
+    # The worker maps the catalogue too, so cache keys need no round trip and
+    # keyword matching still answers if the server goes down
+    local_symptoms_model = SymptomAnalyzer(
+        model_path=CLINICAL_CONFIG_PATH,
+        engine=SYMPTOMS_ENGINE,
+        profile=SYMPTOMS_PROFILE,
+        lazy=True,
+        cascade=SYMPTOMS_CASCADE
+    )
+    local_symptoms_model.watch_catalogue(CATALOGUE_RELOAD_INTERVAL)
+    symptoms_model = RemoteSymptomAnalyzer(
+        model_client,
+        refresh_interval=CATALOGUE_RELOAD_INTERVAL,
+        local=local_symptoms_model
+    )
+else:
+    symptoms_model = SymptomAnalyzer(
+        model_path=CLINICAL_CONFIG_PATH,
+        engine=SYMPTOMS_ENGINE,
+        profile=SYMPTOMS_PROFILE,
+        lazy=True,
+        embedding_model=SYMPTOMS_EMBEDDING_MODEL,
+        rerank_top=SYMPTOMS_RERANK_TOP,
+        cascade=SYMPTOMS_CASCADE,
+        max_pairs_per_forward=SYMPTOMS_MAX_PAIRS_PER_FORWARD
+    )
+    symptoms_model.watch_catalogue(CATALOGUE_RELOAD_INTERVAL)
+
+def _load_symptoms_model():
+    if MODEL_SERVER_SOCKET:
+        # The model server answers with keyword matching until its classifier is ready
+        return model_client.wait_ready("symptoms")
+    if not symptoms_model.load_classifier():
+        return False
+    if SYMPTOMS_BATCH_SIZE > 1:
+        symptoms_model.enable_batching(
+            max_batch_size=SYMPTOMS_BATCH_SIZE,
+            max_wait_ms=SYMPTOMS_BATCH_WAIT_MS
+        )
+    return True
+
+def _load_image_model():
+    global image_model
+    if MODEL_SERVER_SOCKET:
+        if not model_client.wait_ready("image"):
+            return False
+        image_model = RemoteImageModel(model_client)
+        return True
+    # Deferred so TensorFlow is only imported when an image model is configured
+    from models.model import load_image_model
+    image_model = load_image_model(IMAGE_MODEL_PATH, runtime=IMAGE_RUNTIME)
+    return True
+
+model_loader = ModelLoader()
+model_loader.add("symptoms", _load_symptoms_model, retries=MODEL_LOAD_RETRIES, retry_delay=MODEL_LOAD_RETRY_DELAY)
+if IMAGE_MODEL_PATH:
+    model_loader.add("image", _load_image_model, retries=MODEL_LOAD_RETRIES, retry_delay=MODEL_LOAD_RETRY_DELAY)
+model_loader.start(background=MODEL_BACKGROUND_LOAD)
 
 # Define class labels
 CLASS_LABELS = [
@@ -32,78 +172,277 @@ CLASS_LABELS = [
     "Lung Cancer"
 ]
 
-# In-memory storage for diagnoses (in a real app, use a database)
-diagnoses = {}
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_SIZE,
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=RESULT_CACHE_TTL
+)
+
+# Image decoding/resizing releases the GIL, so threads parallelize it well
+image_preprocessor = ImagePreprocessor(size=(224, 224))
+preprocess_pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+
+diagnosis_store = create_store(DIAGNOSES_DB)
+
+# Analysis states of a diagnosis submitted without mlAnalysis
+ANALYSIS_QUEUED = "queued"
+ANALYSIS_RUNNING = "running"
+ANALYSIS_COMPLETED = "completed"
+ANALYSIS_FAILED = "failed"
+
+# Stage latency histograms served on /metrics
+request_metrics = metrics.MetricsRegistry()
+
+@app.before_request
+def _start_request_timing():
+    g.timings, g.timings_token = metrics.begin(request.endpoint or "unmatched")
+    g.profiler = None
+    if PROFILE_DIR and request.headers.get("X-Profile", "").lower() in ("1", "true"):
+        g.profiler = metrics.SamplingProfiler(interval=PROFILE_INTERVAL_MS / 1000).start()
+        g.profile_id = uuid.uuid4().hex
+
+@app.after_request
+def _add_timing_headers(response):
+    g.status = response.status_code
+    timings = g.get("timings")
+    if timings is not None and timings.stages:
+        response.headers["Server-Timing"] = timings.server_timing()
+    if g.get("profiler") is not None:
+        # Written once the response (including any streamed body) is finished
+        response.headers["X-Profile-Id"] = g.profile_id
+    return response
+
+@app.teardown_request
+def _finish_request_timing(exc):
+    timings = g.get("timings")
+    if timings is None:
+        return
+    metrics.end(g.timings_token)
+    request_metrics.observe(timings, 500 if exc is not None else g.get("status", 500))
+    profiler = g.get("profiler")
+    if profiler is not None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.stop().write(os.path.join(PROFILE_DIR, f"{g.profile_id}.folded"))
+
+def _cached_response(result, hit):
+    """Return a JSON response tagged with its cache status"""
+    with metrics.stage("json_serialization"):
+        response = jsonify(result)
+    response.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return response
+
+def _ndjson_lines(lines):
+    for line in lines:
+        with metrics.stage("json_serialization"):
+            encoded = json.dumps(line) + "\n"
+        yield encoded
+
+def _ndjson_response(lines):
+    """Stream an iterable of dicts as newline-delimited JSON"""
+    return Response(stream_with_context(_ndjson_lines(lines)), mimetype="application/x-ndjson")
+
+def _image_cache_key(img_array):
+    # Identical model inputs give identical predictions, however the file was encoded
+    return ("image", id(image_model), hash_bytes(img_array.tobytes()))
+
+def _predict_images(batch):
+    """Return class probabilities for a batch of preprocessed images"""
+    if image_model is None:
+        metrics.set_model("mock")
+        # Mock prediction for demonstration
+        confidence_scores = np.random.random((len(batch), len(CLASS_LABELS)))
+        return confidence_scores / np.sum(confidence_scores, axis=1, keepdims=True)
+    # Real prediction
+    metrics.set_model(getattr(image_model, "runtime", "keras"))
+    with metrics.stage("model_forward"):
+        return image_model.predict(batch)
+
+def _image_result(confidence_scores):
+    """Build the /api/predict response for one image's class probabilities"""
+    prediction_idx = np.argmax(confidence_scores)
+    result = {
+        "diagnosis": CLASS_LABELS[prediction_idx],
+        "confidence": float(confidence_scores[prediction_idx] * 100),
+        "all_probabilities": {
+            label: float(confidence_scores[i] * 100) 
+            for i, label in enumerate(CLASS_LABELS)
+        }
+    }
+    
+    # Flag mock predictions served while a configured image model is still loading
+    if IMAGE_MODEL_PATH and image_model is None:
+        result["degraded"] = True
+    return result
+
+def _symptoms_cache_key(symptoms):
+    # Key on everything that can change the answer, including the condition catalogue
+    return (
+        "symptoms",
+        normalize_text(symptoms),
+        symptoms_model.hypothesis_template,
+        symptoms_model.catalogue_fingerprint
+    )
+
+def _symptoms_model_label():
+    # Histogram label for whichever model is answering symptom requests
+    if model_loader.is_ready("symptoms"):
+        return f"{SYMPTOMS_ENGINE}:{SYMPTOMS_PROFILE.name}"
+    return "keyword-matching"
+
+def _finalize_symptoms_result(result):
+    """Fill in response fields the analyzer may have left out"""
+    # Add general recommendation if not present
+    if "recommendation" not in result:
+        result["recommendation"] = "Please consult with a doctor for a professional diagnosis."
+    
+    # Include model information in the response
+    if "model_used" not in result:
+        result["model_used"] = "ClinicalBERT" if hasattr(symptoms_model, "classifier") and symptoms_model.classifier else "keyword matching"
+    
+    # Flag keyword-only answers served while the classifier is still loading. Once it
+    # has failed for good, keyword matching is the service's answer rather than a stopgap
+    if not model_loader.is_ready("symptoms") and not model_loader.has_failed("symptoms"):
+        result["degraded"] = True
+    return result
+
+def _cache_result(cache_key, result):
+    # Don't pin transient model failures or degraded answers in the cache
+    if "model_error" not in result and not result.get("degraded"):
+        result_cache.set(cache_key, result)
 
 @app.route("/")
 def index():
     return jsonify({"message": "Welcome to the Medical Image Analysis API"})
 
+@app.route("/healthz")
+def healthz():
+    # Liveness: the process is up and serving, whether or not models are loaded
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    # Readiness: all required models are loaded
+    status = model_loader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def _cache_hit(cached, started):
+    # Report this request's own time, not the time of the request that filled the entry
+    return {**cached, "processing_time_ms": round((time.perf_counter() - started) * 1000, 1)}, True
+
+def _batch_line(cached):
+    # Batch lines carry no per-item timing, whichever endpoint cached the result
+    return {key: value for key, value in cached.items() if key != "processing_time_ms"}
+
+def _predict_image(image):
+    """Predict on one encoded image (bytes or file object); returns (result, cache hit)"""
+    started = time.perf_counter()
+    # Preprocess the image straight into a float32 model input
+    with metrics.stage("image_decode"):
+        img_array = np.expand_dims(image_preprocessor.preprocess(image), axis=0)
+    
+    cache_key = _image_cache_key(img_array)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return _cache_hit(cached, started)
+    
+    # Make prediction
+    result = _image_result(_predict_images(img_array)[0])
+    result["processing_time_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
+    _cache_result(cache_key, result)
+    return result, False
+
 @app.route("/api/predict", methods=["POST"])
 def predict():
     # Check if image was provided
-    if "image" not in request.files:
+    with metrics.stage("request_parse"):
+        file = request.files.get("image")
+    if file is None:
         return jsonify({"error": "No image file provided"}), 400
     
     try:
-        # Read image
-        file = request.files["image"]
-        img = Image.open(io.BytesIO(file.read())).convert("RGB")
+        return _cached_response(*_predict_image(file.read()))
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _image_batch_lines(uploads):
+    """Yield one result dict per (filename, image) upload, predicting in chunks"""
+    for start in range(0, len(uploads), IMAGE_BATCH_SIZE):
+        chunk = uploads[start:start + IMAGE_BATCH_SIZE]
+        results = [None] * len(chunk)
+        pending = []
         
-        # Preprocess the image
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
+        # Decode and resize the chunk in parallel into one float32 buffer
+        with metrics.stage("image_decode"):
+            batch, errors = image_preprocessor.preprocess_batch(
+                [data for _, data in chunk], executor=preprocess_pool
+            )
+        for i, error in enumerate(errors):
+            if error is not None:
+                results[i] = {"error": f"Could not read image: {error}"}
+                continue
+            cache_key = _image_cache_key(batch[i])
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                results[i] = _batch_line(cached)
+            else:
+                pending.append((i, cache_key))
         
-        # Make prediction
-        if image_model is None:
-            # Mock prediction for demonstration
-            confidence_scores = np.random.random(len(CLASS_LABELS))
-            confidence_scores = confidence_scores / np.sum(confidence_scores)
-            prediction_idx = np.argmax(confidence_scores)
-        else:
-            # Real prediction
-            predictions = image_model.predict(img_array)
-            prediction_idx = np.argmax(predictions[0])
-            confidence_scores = predictions[0]
+        # One model call for every image in the chunk that wasn't cached
+        if pending:
+            try:
+                rows = [i for i, _ in pending]
+                scores = _predict_images(batch if len(rows) == len(chunk) else batch[rows])
+                for (i, cache_key), confidence_scores in zip(pending, scores):
+                    results[i] = _image_result(confidence_scores)
+                    _cache_result(cache_key, results[i])
+            except Exception as e:
+                for i, _ in pending:
+                    results[i] = {"error": str(e)}
         
-        # Return result
-        result = {
-            "diagnosis": CLASS_LABELS[prediction_idx],
-            "confidence": float(confidence_scores[prediction_idx] * 100),
-            "all_probabilities": {
-                label: float(confidence_scores[i] * 100) 
-                for i, label in enumerate(CLASS_LABELS)
-            }
-        }
-        
-        return jsonify(result)
+        for i, result in enumerate(results):
+            yield {"index": start + i, "filename": chunk[i][0], **result}
+
+@app.route("/api/predict/batch", methods=["POST"])
+def predict_batch():
+    with metrics.stage("request_parse"):
+        files = request.files.getlist("images")
+        # Read uploads before streaming starts
+        uploads = [(file.filename, file.read()) for file in files]
+    if not uploads:
+        return jsonify({"error": "No image files provided"}), 400
     
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return _ndjson_response(_image_batch_lines(uploads))
+
+def _analyze_symptoms(symptoms):
+    """Analyze one symptom description; returns (result, cache hit)"""
+    started = time.perf_counter()
+    cache_key = _symptoms_cache_key(symptoms)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return _cache_hit(cached, started)
+    
+    # Use the pretrained model to analyze symptoms
+    metrics.set_model(_symptoms_model_label())
+    result = _finalize_symptoms_result(symptoms_model.analyze(symptoms))
+    result["processing_time_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
+    _cache_result(cache_key, result)
+    return result, False
 
 @app.route("/api/symptoms", methods=["POST"])
 def analyze_symptoms():
     # Get symptoms from request
-    data = request.json
+    with metrics.stage("request_parse"):
+        data = request.json
     if not data or "symptoms" not in data:
         return jsonify({"error": "No symptoms provided"}), 400
     
     symptoms = data["symptoms"]
     
     try:
-        # Use the pretrained model to analyze symptoms
-        result = symptoms_model.analyze(symptoms)
-        
-        # Add general recommendation if not present
-        if "recommendation" not in result:
-            result["recommendation"] = "Please consult with a doctor for a professional diagnosis."
-        
-        # Include model information in the response
-        if "model_used" not in result:
-            result["model_used"] = "ClinicalBERT" if hasattr(symptoms_model, "classifier") and symptoms_model.classifier else "keyword matching"
-        
-        return jsonify(result)
+        return _cached_response(*_analyze_symptoms(symptoms))
     except Exception as e:
         return jsonify({
             "error": f"Error analyzing symptoms: {str(e)}",
@@ -112,113 +451,381 @@ def analyze_symptoms():
             "recommendation": "Please consult with a doctor for a professional diagnosis."
         }), 500
 
-@app.route("/api/diagnoses", methods=["POST"])
-def create_diagnosis():
-    try:
-        # Parse request data
-        data = request.json
-        if not data or "type" not in data or "data" not in data:
-            return jsonify({"error": "Invalid request format"}), 400
+def _symptoms_batch_lines(texts):
+    """Yield one result dict per symptom description, analyzing in chunks"""
+    for start in range(0, len(texts), SYMPTOMS_BATCH_CHUNK):
+        chunk = texts[start:start + SYMPTOMS_BATCH_CHUNK]
+        results = [None] * len(chunk)
+        pending = []
         
-        diagnosis_type = data["type"]
-        diagnosis_data = data["data"]
+        for i, symptoms in enumerate(chunk):
+            if not isinstance(symptoms, str) or not symptoms.strip():
+                results[i] = {"error": "Symptoms must be a non-empty string"}
+                continue
+            cache_key = _symptoms_cache_key(symptoms)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                results[i] = _batch_line(cached)
+            else:
+                pending.append((i, symptoms, cache_key))
         
-        # Generate unique ID
-        diagnosis_id = str(uuid.uuid4())
+        # One classifier call for every text in the chunk that wasn't cached
+        if pending:
+            try:
+                metrics.set_model(_symptoms_model_label())
+                analyzed = symptoms_model.analyze_batch([symptoms for _, symptoms, _ in pending])
+                for (i, _, cache_key), result in zip(pending, analyzed):
+                    results[i] = _finalize_symptoms_result(result)
+                    _cache_result(cache_key, results[i])
+            except Exception as e:
+                for i, _, _ in pending:
+                    results[i] = {"error": f"Error analyzing symptoms: {str(e)}"}
         
-        # Create diagnosis object
-        diagnosis = {
-            "id": diagnosis_id,
-            "diagnosisDate": datetime.now().strftime("%Y-%m-%d"),
-            "type": "Symptom Analysis" if diagnosis_type == "symptoms" else "Image Analysis",
-            "status": "pending",
-            "doctorName": "Awaiting doctor review",
-            "doctorFeedback": "",
-            "aiModelData": {
-                "modelVersion": "ClinicalBERT-1.0" if diagnosis_type == "symptoms" else "MedicalVision-1.0",
-                "analysisTimestamp": datetime.now().isoformat(),
-                "processingTime": "2.3 seconds",
-                "featuresAnalyzed": "Clinical language patterns" if diagnosis_type == "symptoms" else "Anatomical features"
-            }
+        for i, result in enumerate(results):
+            yield {"index": start + i, **result}
+
+@app.route("/api/symptoms/batch", methods=["POST"])
+def analyze_symptoms_batch():
+    # Accept either a bare JSON array or {"symptoms": [...]}
+    with metrics.stage("request_parse"):
+        data = request.json
+    texts = data.get("symptoms") if isinstance(data, dict) else data
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "Expected a non-empty list of symptom descriptions"}), 400
+    
+    return _ndjson_response(_symptoms_batch_lines(texts))
+
+def _service_stats():
+    stats = {
+        "symptoms_profile": symptoms_model.profile.describe(),
+        "symptoms_engine": symptoms_model.engine_stats(),
+        "symptoms_batching": symptoms_model.batching_stats(),
+        "symptoms_cascade": symptoms_model.cascade_stats(),
+        "result_cache": result_cache.stats(),
+        "diagnosis_jobs": diagnosis_runner.stats()
+    }
+    if MODEL_SERVER_SOCKET:
+        stats["model_server"] = model_client.call("stats")["server"]
+    return stats
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    # Prometheus text exposition of the per-stage latency histograms
+    return Response(request_metrics.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    return jsonify(_service_stats())
+
+def _format_processing_time(milliseconds):
+    # Measured by the analysis endpoint and echoed back by the client as processingTimeMs
+    if not isinstance(milliseconds, (int, float)):
+        return "Not recorded"
+    return f"{milliseconds / 1000:.2f} seconds"
+
+def _build_diagnosis(diagnosis_type, diagnosis_data, diagnosis_id=None):
+    """Build a diagnosis record from a POST /api/diagnoses payload"""
+    ml_analysis = diagnosis_data.get("mlAnalysis", {})
+    
+    # Generate unique ID
+    diagnosis_id = diagnosis_id or str(uuid.uuid4())
+    
+    # Create diagnosis object
+    diagnosis = {
+        "id": diagnosis_id,
+        "diagnosisDate": datetime.now().strftime("%Y-%m-%d"),
+        "type": "Symptom Analysis" if diagnosis_type == "symptoms" else "Image Analysis",
+        "status": "pending",
+        "analysisStatus": ANALYSIS_COMPLETED,
+        "doctorName": "Awaiting doctor review",
+        "doctorFeedback": "",
+        "aiModelData": {
+            "modelVersion": "ClinicalBERT-1.0" if diagnosis_type == "symptoms" else "MedicalVision-1.0",
+            "analysisTimestamp": datetime.now().isoformat(),
+            "processingTime": _format_processing_time(ml_analysis.get("processingTimeMs")),
+            "featuresAnalyzed": "Clinical language patterns" if diagnosis_type == "symptoms" else "Anatomical features"
         }
-        
-        # Add type-specific fields
-        if diagnosis_type == "symptoms":
-            ml_analysis = diagnosis_data.get("mlAnalysis", {})
-            diagnosis.update({
-                "aiDiagnosis": ml_analysis.get("diagnosis", "Unknown"),
-                "confidence": ml_analysis.get("confidence", 0),
-                "symptoms": diagnosis_data.get("description", ""),
-                "treatmentRecommendations": [ml_analysis.get("recommendation", "Consult with a doctor")],
-                "riskFactors": ["To be determined by doctor review"],
-                "aiResponse": {
-                    "fullText": f"Based on your symptoms of {diagnosis_data.get('description', '')}, the analysis indicates possible {ml_analysis.get('diagnosis', 'condition')}.",
-                    "sections": {
-                        "primary": ml_analysis.get("diagnosis", "Unknown"),
-                        "confidence": f"{ml_analysis.get('confidence', 0)}%",
-                        "recommendation": ml_analysis.get("recommendation", "Consult with a doctor")
-                    }
+    }
+    
+    # Add type-specific fields
+    if diagnosis_type == "symptoms":
+        diagnosis.update({
+            "aiDiagnosis": ml_analysis.get("diagnosis", "Unknown"),
+            "confidence": ml_analysis.get("confidence", 0),
+            "symptoms": diagnosis_data.get("description", ""),
+            "treatmentRecommendations": [ml_analysis.get("recommendation", "Consult with a doctor")],
+            "riskFactors": ["To be determined by doctor review"],
+            "aiResponse": {
+                "fullText": f"Based on your symptoms of {diagnosis_data.get('description', '')}, the analysis indicates possible {ml_analysis.get('diagnosis', 'condition')}.",
+                "sections": {
+                    "primary": ml_analysis.get("diagnosis", "Unknown"),
+                    "confidence": f"{ml_analysis.get('confidence', 0)}%",
+                    "recommendation": ml_analysis.get("recommendation", "Consult with a doctor")
                 }
-            })
-            
-            # Add differential diagnosis if available
-            differential = ml_analysis.get("differentialDiagnosis")
-            if differential:
-                diagnosis["aiResponse"]["sections"]["differentialDiagnosis"] = json.dumps(differential)
+            }
+        })
         
-        elif diagnosis_type == "image":
-            ml_analysis = diagnosis_data.get("mlAnalysis", {})
-            diagnosis.update({
-                "aiDiagnosis": ml_analysis.get("diagnosis", "Unknown"),
-                "confidence": ml_analysis.get("confidence", 0),
-                "imageSrc": "/sample-image.jpg",  # In a real app, save the image
-                "treatmentRecommendations": ["Consult with a doctor for detailed treatment plan"],
-                "riskFactors": ["To be determined by doctor review"],
-                "aiResponse": {
-                    "fullText": f"Analysis of {diagnosis_data.get('imageType', 'medical image')} shows findings consistent with {ml_analysis.get('diagnosis', 'condition')}.",
-                    "sections": {
-                        "primary": ml_analysis.get("diagnosis", "Unknown"),
-                        "confidence": f"{ml_analysis.get('confidence', 0)}%",
-                        "probabilities": json.dumps(ml_analysis.get("allProbabilities", {}))
-                    }
+        # Add differential diagnosis if available
+        differential = ml_analysis.get("differentialDiagnosis")
+        if differential:
+            diagnosis["aiResponse"]["sections"]["differentialDiagnosis"] = json.dumps(differential)
+    
+    elif diagnosis_type == "image":
+        diagnosis.update({
+            "aiDiagnosis": ml_analysis.get("diagnosis", "Unknown"),
+            "confidence": ml_analysis.get("confidence", 0),
+            "imageSrc": "/sample-image.jpg",  # In a real app, save the image
+            "treatmentRecommendations": ["Consult with a doctor for detailed treatment plan"],
+            "riskFactors": ["To be determined by doctor review"],
+            "aiResponse": {
+                "fullText": f"Analysis of {diagnosis_data.get('imageType', 'medical image')} shows findings consistent with {ml_analysis.get('diagnosis', 'condition')}.",
+                "sections": {
+                    "primary": ml_analysis.get("diagnosis", "Unknown"),
+                    "confidence": f"{ml_analysis.get('confidence', 0)}%",
+                    "probabilities": json.dumps(ml_analysis.get("allProbabilities", {}))
                 }
+            }
+        })
+    
+    return diagnosis
+
+def _ml_analysis(result, processing_ms):
+    """Convert an /api/symptoms or /api/predict result to the mlAnalysis shape clients post"""
+    return {
+        "diagnosis": result.get("diagnosis", "Unknown"),
+        "confidence": result.get("confidence", 0),
+        "recommendation": result.get("recommendation", "Consult with a doctor"),
+        "differentialDiagnosis": result.get("differential_diagnosis"),
+        "allProbabilities": result.get("all_probabilities", {}),
+        "processingTimeMs": round(processing_ms, 1)
+    }
+
+def submit_diagnosis(diagnosis_type, diagnosis_data, image=None):
+    """Queue a diagnosis for background analysis and store its placeholder record
+    
+    Raises BacklogFull when the job backlog is at DIAGNOSIS_BACKLOG.
+    """
+    diagnosis = _build_diagnosis(diagnosis_type, diagnosis_data)
+    diagnosis["analysisStatus"] = ANALYSIS_QUEUED
+    # Stored before the job is queued, so a fast worker's result is never overwritten
+    diagnosis_store.create(diagnosis)
+    try:
+        diagnosis_runner.submit(
+            diagnosis["id"],
+            diagnosis_type,
+            {"data": diagnosis_data, "diagnosisDate": diagnosis["diagnosisDate"], "queuedAt": time.time()},
+            image
+        )
+    except BaseException:
+        diagnosis_store.delete(diagnosis["id"])
+        raise
+    return diagnosis
+
+def _run_diagnosis_job(job):
+    """Analyze a queued diagnosis and fill in its record"""
+    payload = job["payload"]
+    diagnosis = diagnosis_store.get(job["id"])
+    if diagnosis is not None:
+        diagnosis_store.save({**diagnosis, "analysisStatus": ANALYSIS_RUNNING})
+        diagnosis_runner.notify_changed()
+    
+    started = time.perf_counter()
+    if job["kind"] == "image":
+        result, _ = _predict_image(job["data"])
+    else:
+        result, _ = _analyze_symptoms(payload["data"]["description"])
+    # Retry a failed classifier; on the last attempt keep the keyword-matching answer
+    if "model_error" in result and job["attempts"] < DIAGNOSIS_MAX_ATTEMPTS:
+        raise RuntimeError(result["model_error"])
+    processing_ms = (time.perf_counter() - started) * 1000
+    
+    diagnosis = _build_diagnosis(
+        job["kind"],
+        {**payload["data"], "mlAnalysis": _ml_analysis(result, processing_ms)},
+        diagnosis_id=job["id"]
+    )
+    diagnosis["diagnosisDate"] = payload["diagnosisDate"]
+    diagnosis["aiModelData"]["queueTime"] = _format_processing_time(
+        (time.time() - payload["queuedAt"]) * 1000 - processing_ms
+    )
+    if result.get("degraded") or "model_error" in result:
+        diagnosis["aiModelData"]["degraded"] = True
+    diagnosis_store.save(diagnosis)
+
+def _fail_diagnosis_job(job, error):
+    """Record that a diagnosis could not be analyzed after every attempt"""
+    diagnosis = diagnosis_store.get(job["id"])
+    if diagnosis is None:
+        diagnosis = _build_diagnosis(job["kind"], job["payload"]["data"], diagnosis_id=job["id"])
+        diagnosis["diagnosisDate"] = job["payload"]["diagnosisDate"]
+    diagnosis.update({"analysisStatus": ANALYSIS_FAILED, "analysisError": str(error)})
+    diagnosis_store.save(diagnosis)
+
+diagnosis_runner = JobRunner(
+    JobBacklog(DIAGNOSIS_JOBS_DB, max_jobs=DIAGNOSIS_BACKLOG, lease_seconds=DIAGNOSIS_LEASE_SECONDS),
+    _run_diagnosis_job,
+    _fail_diagnosis_job,
+    workers=DIAGNOSIS_WORKERS,
+    max_attempts=DIAGNOSIS_MAX_ATTEMPTS,
+    retry_delay=DIAGNOSIS_RETRY_DELAY,
+    # Don't store keyword-only answers for jobs submitted while the classifier loads
+    ready=model_loader.wait
+)
+diagnosis_runner.start()
+
+def _submission_error(diagnosis_type, diagnosis_data, image):
+    """Return why a diagnosis can't be analyzed in the background, or None"""
+    if diagnosis_type == "symptoms":
+        description = diagnosis_data.get("description")
+        if not isinstance(description, str) or not description.strip():
+            return "Symptom diagnoses need a non-empty description"
+    elif diagnosis_type == "image":
+        if not image:
+            return "Image diagnoses need an uploaded image file"
+    else:
+        return f"Unknown diagnosis type '{diagnosis_type}'"
+    return None
+
+@app.route("/api/diagnoses", methods=["POST"])
+def create_diagnosis():
+    try:
+        # Parse request data
+        with metrics.stage("request_parse"):
+            image = request.files.get("image")
+            if image is not None:
+                # Image upload: analyzed in the background
+                diagnosis_type, diagnosis_data = "image", request.form.to_dict()
+                image = image.read()
+            else:
+                data = request.json
+                if not data or "type" not in data or "data" not in data:
+                    return jsonify({"error": "Invalid request format"}), 400
+                diagnosis_type = data["type"]
+                diagnosis_data = data["data"]
+        
+        if image is None and "mlAnalysis" in diagnosis_data:
+            # The client already ran the analysis; store the diagnosis as-is
+            diagnosis = _build_diagnosis(diagnosis_type, diagnosis_data)
+            diagnosis_store.create(diagnosis)
+            return jsonify({
+                "success": True,
+                "diagnosisId": diagnosis["id"]
             })
         
-        # Store diagnosis
-        diagnoses[diagnosis_id] = diagnosis
+        error = _submission_error(diagnosis_type, diagnosis_data, image)
+        if error:
+            return jsonify({"error": error}), 400
+        try:
+            diagnosis = submit_diagnosis(diagnosis_type, diagnosis_data, image)
+        except BacklogFull as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(DIAGNOSIS_RETRY_AFTER)}
         
-        return jsonify({
+        response = jsonify({
             "success": True,
-            "diagnosisId": diagnosis_id
+            "diagnosisId": diagnosis["id"],
+            "analysisStatus": diagnosis["analysisStatus"]
         })
+        response.status_code = 202
+        response.headers["Location"] = f"/api/diagnoses/{diagnosis['id']}"
+        return response
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _list_params(args):
+    """Parse pagination and filter query parameters for GET /api/diagnoses"""
+    limit = int(args.get("limit", DIAGNOSES_PAGE_SIZE))
+    offset = int(args.get("offset", 0))
+    if not 1 <= limit <= DIAGNOSES_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {DIAGNOSES_MAX_PAGE_SIZE}")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    cursor = args.get("cursor")
+    return {
+        "status": args.get("status"),
+        "type": args.get("type"),
+        "date_from": args.get("dateFrom"),
+        "date_to": args.get("dateTo"),
+        "after": decode_cursor(cursor) if cursor else None,
+        "limit": limit,
+        "offset": offset
+    }
+
+def _diagnoses_etag(params):
+    # The store's revision changes on every write, so it identifies this page's content
+    return hash_bytes(
+        str(diagnosis_store.revision()).encode(),
+        json.dumps(params, sort_keys=True).encode()
+    )
+
 @app.route("/api/diagnoses", methods=["GET"])
 def get_all_diagnoses():
     try:
-        # Convert diagnoses dictionary to list
-        diagnoses_list = list(diagnoses.values())
-        
-        # Sort by date (newest first)
-        diagnoses_list.sort(key=lambda x: x["diagnosisDate"], reverse=True)
+        params = _list_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameters: {str(e)}"}), 400
+    
+    try:
+        etag = _diagnoses_etag(params)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            # Newest first, encoded incrementally as rows are read from the store
+            response = Response(stream_page(diagnosis_store, **params), mimetype="application/json")
         
-        return jsonify({
-            "diagnoses": diagnoses_list,
-            "total": len(diagnoses_list)
-        })
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _wait_params(args):
+    """Parse the long-poll query parameters of GET /api/diagnoses/<id>
+    
+    `wait` is how many seconds to hold the request (capped at
+    DIAGNOSIS_MAX_WAIT) until the diagnosis's analysisStatus differs from
+    `seen`, or without `seen` until the analysis has finished.
+    """
+    wait = float(args.get("wait", 0))
+    # nan would never reach the deadline, and inf would hold the request until the cap anyway
+    if not math.isfinite(wait):
+        raise ValueError("wait must be a finite number")
+    if wait < 0:
+        raise ValueError("wait must not be negative")
+    return min(wait, DIAGNOSIS_MAX_WAIT), args.get("seen")
+
+def _analysis_changed(diagnosis, seen):
+    """Whether a long-poll for `seen` can be answered with this diagnosis"""
+    status = diagnosis.get("analysisStatus", ANALYSIS_COMPLETED)
+    if seen is not None:
+        return status != seen
+    return status in (ANALYSIS_COMPLETED, ANALYSIS_FAILED)
+
+def wait_for_diagnosis(diagnosis_id, wait, seen=None, poll_interval=0.5):
+    """Return the diagnosis once its analysis status changes, or when `wait` seconds pass"""
+    deadline = time.monotonic() + wait
+    while True:
+        diagnosis = diagnosis_store.get(diagnosis_id)
+        remaining = deadline - time.monotonic()
+        if diagnosis is None or remaining <= 0 or _analysis_changed(diagnosis, seen):
+            return diagnosis
+        # Woken early by this process's workers; jobs run by other workers are seen by polling
+        diagnosis_runner.wait_for_change(min(remaining, poll_interval))
+
 @app.route("/api/diagnoses/<diagnosis_id>", methods=["GET"])
 def get_diagnosis(diagnosis_id):
     try:
-        if diagnosis_id not in diagnoses:
+        wait, seen = _wait_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameters: {str(e)}"}), 400
+    
+    try:
+        diagnosis = wait_for_diagnosis(diagnosis_id, wait, seen)
+        if diagnosis is None:
             return jsonify({"error": "Diagnosis not found"}), 404
         
-        return jsonify(diagnoses[diagnosis_id])
+        return jsonify(diagnosis)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
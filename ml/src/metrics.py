@@ -0,0 +1,222 @@
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Stages timed on the hot path. "batch_wait" is time spent queued for a
+# micro-batch and "model_server" a call to model_server.py.
+STAGES = (
+    "request_parse",
+    "image_decode",
+    "keyword_matching",
+    "tokenization",
+    "model_forward",
+    "retrieval",
+    "batch_wait",
+    "model_server",
+    "json_serialization",
+)
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Time spent in each stage while handling one request"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.model = None
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, other):
+        """Add another collector's stage times to this one"""
+        for stage, seconds in other.stages.items():
+            self.add(stage, seconds)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Format the stages for a Server-Timing response header"""
+        return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items())
+
+
+def current():
+    """Return the RequestTimings of the request being handled, if any"""
+    return _current.get()
+
+
+def begin(endpoint):
+    """Start timing a request; returns (timings, token) for end()"""
+    timings = RequestTimings(endpoint)
+    return timings, _current.set(timings)
+
+
+def end(token):
+    _current.reset(token)
+
+
+@contextmanager
+def activate(timings):
+    """Collect stages into `timings` for the duration of the block"""
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current request (a no-op outside requests)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def set_model(name):
+    """Label the current request with the model that answered it"""
+    timings = _current.get()
+    if timings is not None:
+        timings.model = name
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Latency histograms by endpoint and model, rendered for Prometheus.
+
+    Two families are kept: `<prefix>_stage_duration_seconds` labelled by
+    endpoint, model and stage, and `<prefix>_request_duration_seconds`
+    labelled by endpoint, model and status code.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix="medibox"):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._requests = {}
+
+    def observe(self, timings, status):
+        """Record a finished request's stages and total time"""
+        model = timings.model or "none"
+        elapsed = timings.elapsed()
+        with self._lock:
+            for stage_name, seconds in timings.stages.items():
+                self._observe(self._stages, (timings.endpoint, model, stage_name), seconds)
+            self._observe(self._requests, (timings.endpoint, model, str(status)), elapsed)
+
+    def _observe(self, family, labels, seconds):
+        histogram = family.get(labels)
+        if histogram is None:
+            histogram = family[labels] = _Histogram(len(self.buckets))
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            histogram.counts[index] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+
+    def render(self):
+        """Return all histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            self._render_family(
+                lines, f"{self.prefix}_stage_duration_seconds", "Time spent in each request stage.",
+                ("endpoint", "model", "stage"), self._stages
+            )
+            self._render_family(
+                lines, f"{self.prefix}_request_duration_seconds", "Total time to handle a request.",
+                ("endpoint", "model", "status"), self._requests
+            )
+        return "\n".join(lines) + "\n"
+
+    def _render_family(self, lines, name, help_text, label_names, family):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in sorted(family.items()):
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label_text}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+
+
+class SamplingProfiler:
+    """Sample one thread's Python stack at a fixed interval.
+
+    Samples are counted as collapsed stacks ("outer;inner count" lines),
+    the input format of flamegraph.pl and speedscope. Sampling happens on
+    a separate thread, so the profiled code runs unmodified.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
@@ -0,0 +1,141 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+# Model states reported by the readiness endpoint
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelLoader:
+    """Load models in a background thread and track their readiness.
+
+    Each registered task is a callable that loads one model and returns a
+    truthy value on success. Tasks run one after another on a single daemon
+    thread so the web server can start accepting requests immediately. A
+    failed load is retried `retries` times, waiting `retry_delay` seconds
+    (doubled each time) in between; the model stays "loading", with the last
+    error reported, until it is ready or every attempt has failed.
+    """
+
+    def __init__(self):
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._created_at = time.monotonic()
+        self._finished_at = None
+
+    def add(self, name, load_fn, required=True, retries=0, retry_delay=5.0):
+        """Register a model to load. Optional models don't block readiness."""
+        with self._lock:
+            self._tasks[name] = {
+                "load_fn": load_fn,
+                "required": required,
+                "retries": retries,
+                "retry_delay": retry_delay,
+                "state": PENDING,
+                "attempts": 0,
+                "load_seconds": None,
+                "error": None,
+            }
+
+    def start(self, background=True):
+        """Start loading all registered models"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+        if not background:
+            self._thread.join()
+
+    def wait(self, timeout=None):
+        """Block until every model has finished loading (or failed)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def state(self, name):
+        with self._lock:
+            task = self._tasks.get(name)
+            return task["state"] if task else None
+
+    def has_failed(self, name):
+        """Return whether a model's loading has failed for good (every attempt failed)"""
+        return self.state(name) == FAILED
+
+    def is_ready(self, name=None):
+        """Return whether a model (or, without a name, every required model) is ready"""
+        with self._lock:
+            if name is not None:
+                task = self._tasks.get(name)
+                return task is not None and task["state"] == READY
+            return all(
+                task["state"] == READY for task in self._tasks.values() if task["required"]
+            )
+
+    def status(self):
+        """Return the readiness payload, including measured startup time"""
+        with self._lock:
+            models = {
+                name: {
+                    "state": task["state"],
+                    "required": task["required"],
+                    "attempts": task["attempts"],
+                    "load_seconds": task["load_seconds"],
+                    "error": task["error"],
+                }
+                for name, task in self._tasks.items()
+            }
+            finished_at = self._finished_at
+
+        required = [model["state"] for model in models.values() if model["required"]]
+        if all(state == READY for state in required):
+            state = READY
+        elif FAILED in required:
+            state = FAILED
+        else:
+            state = LOADING
+        now = time.monotonic()
+        return {
+            "ready": state == READY,
+            # "failed" means a required model will not load without a restart
+            "state": state,
+            "models": models,
+            "uptime_seconds": round(now - self._created_at, 3),
+            "startup_seconds": round(finished_at - self._created_at, 3) if finished_at else None,
+        }
+
+    def _run(self):
+        for name in list(self._tasks):
+            with self._lock:
+                task = self._tasks[name]
+                task["state"] = LOADING
+
+            started = time.monotonic()
+            while True:
+                with self._lock:
+                    task["attempts"] += 1
+                try:
+                    loaded = task["load_fn"]()
+                    state, error = (READY, None) if loaded else (FAILED, "Model could not be loaded")
+                except Exception as e:
+                    traceback.print_exc()
+                    state, error = FAILED, str(e)
+                if state == READY or task["attempts"] > task["retries"]:
+                    break
+                delay = task["retry_delay"] * 2 ** (task["attempts"] - 1)
+                with self._lock:
+                    task["error"] = error
+                print(f"Model '{name}' failed to load ({error}); retrying in {delay:.0f}s")
+                time.sleep(delay)
+
+            with self._lock:
+                task["state"] = state
+                task["error"] = error
+                task["load_seconds"] = round(time.monotonic() - started, 3)
+            print(f"Model '{name}' {state} in {task['load_seconds']:.1f}s")
+
+        with self._lock:
+            self._finished_at = time.monotonic()
@@ -0,0 +1,445 @@
+"""Model server shared by all web workers on a node.
+
+Every gunicorn worker that imports main.py normally loads its own copy of
+the zero-shot classifier (and image model), so memory grows linearly with
+the worker count. Run this process once per node instead:
+
+    python model_server.py --socket /tmp/medibox-models.sock
+
+and start the web workers with MODEL_SERVER_SOCKET pointing at the same
+path. Workers then send requests over the Unix socket; preprocessed image
+batches travel through shared memory rather than being pickled. Concurrent
+requests from all workers meet in the server's micro-batcher, so batches
+fill up faster than they do inside a single worker.
+
+The server reads the same model settings as main.py (SYMPTOMS_CATALOGUE,
+CATALOGUE_RELOAD_INTERVAL, SYMPTOMS_ENGINE, SYMPTOMS_EMBEDDING_MODEL,
+SYMPTOMS_RERANK_TOP, SYMPTOMS_CASCADE_*, SYMPTOMS_PROFILE, TORCH_*_THREADS,
+SYMPTOMS_BATCH_SIZE, SYMPTOMS_BATCH_WAIT_MS, SYMPTOMS_MAX_PAIRS_PER_FORWARD,
+IMAGE_MODEL_PATH, IMAGE_RUNTIME).
+
+Messages are pickled, so only processes holding the shared key may
+connect. The key is MODEL_SERVER_AUTHKEY if set; otherwise the server
+generates a random key at startup and writes it to `<socket>.key`, readable
+only by the user running it, where clients on the node read it from. The
+socket itself is also restricted to that user.
+"""
+import argparse
+import os
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+import numpy as np
+
+from metrics import stage
+from model_loader import FAILED, READY, ModelLoader
+from models.cascade import CascadePolicy
+from models.catalogue import find_catalogue
+from models.embedding_index import EMBEDDING_MODEL
+from models.inference_profile import InferenceProfile
+from models.symptoms_model import SymptomAnalyzer
+
+CLINICAL_CONFIG_PATH = find_catalogue(os.environ.get("SYMPTOMS_CATALOGUE"))
+DEFAULT_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "/tmp/medibox-models.sock")
+
+# Shared secret used to authenticate connections on the socket; generated per run when unset
+AUTHKEY = os.environ.get("MODEL_SERVER_AUTHKEY", "").encode() or None
+
+
+def key_path_for(socket_path):
+    """File the server writes its generated key to"""
+    return socket_path + ".key"
+
+
+def write_authkey(socket_path):
+    """Generate a random key and write it to the key file with 0600 permissions"""
+    authkey = secrets.token_hex(32).encode()
+    path = key_path_for(socket_path)
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def read_authkey(socket_path):
+    """Read the key written by the server listening on `socket_path`"""
+    with open(key_path_for(socket_path), "rb") as f:
+        return f.read().strip()
+
+
+class ModelServerError(RuntimeError):
+    """Raised in the client when the server reports an error"""
+
+
+def _attach_shared_memory(name):
+    """Open a segment created by a client without taking ownership of it"""
+    segment = shared_memory.SharedMemory(name=name)
+    # Python < 3.13 registers attached segments with this process's resource
+    # tracker, which would unlink them when the server exits. The client owns them.
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+
+class ModelServer:
+    """Own the models and answer requests from web workers over a Unix socket.
+
+    Each client connection is served by its own thread, which also runs
+    the authentication handshake, so a slow or misbehaving client can't
+    hold up other connections. The analyzer and its micro-batcher are
+    shared by all of them.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, authkey=AUTHKEY):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.image_model = None
+        self.symptoms_model = SymptomAnalyzer(
+            model_path=CLINICAL_CONFIG_PATH,
+            engine=os.environ.get("SYMPTOMS_ENGINE", "pipeline"),
+            profile=InferenceProfile.from_env(),
+            lazy=True,
+            embedding_model=os.environ.get("SYMPTOMS_EMBEDDING_MODEL", EMBEDDING_MODEL),
+            rerank_top=int(os.environ.get("SYMPTOMS_RERANK_TOP", 0)),
+            cascade=CascadePolicy.from_env(),
+            max_pairs_per_forward=int(os.environ.get("SYMPTOMS_MAX_PAIRS_PER_FORWARD", 256))
+        )
+        self.batch_size = int(os.environ.get("SYMPTOMS_BATCH_SIZE", 16))
+        self.batch_wait_ms = float(os.environ.get("SYMPTOMS_BATCH_WAIT_MS", 10))
+        self.image_model_path = os.environ.get("IMAGE_MODEL_PATH")
+        self.image_runtime = os.environ.get("IMAGE_RUNTIME")
+        self.catalogue_reload_interval = float(os.environ.get("CATALOGUE_RELOAD_INTERVAL", 10))
+
+        retries = int(os.environ.get("MODEL_LOAD_RETRIES", 2))
+        retry_delay = float(os.environ.get("MODEL_LOAD_RETRY_DELAY", 10))
+        self.loader = ModelLoader()
+        self.loader.add("symptoms", self._load_symptoms_model, retries=retries, retry_delay=retry_delay)
+        if self.image_model_path:
+            self.loader.add("image", self._load_image_model, retries=retries, retry_delay=retry_delay)
+
+        self._listener = None
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._requests = 0
+
+    def _load_symptoms_model(self):
+        if not self.symptoms_model.load_classifier():
+            return False
+        if self.batch_size > 1:
+            self.symptoms_model.enable_batching(max_batch_size=self.batch_size, max_wait_ms=self.batch_wait_ms)
+        return True
+
+    def _load_image_model(self):
+        # Deferred so TensorFlow is only imported when an image model is configured
+        from models.model import load_image_model
+        self.image_model = load_image_model(self.image_model_path, runtime=self.image_runtime)
+        return True
+
+    def serve_forever(self):
+        """Load the models in the background and accept connections until interrupted"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left behind by a previous run
+        if self.authkey is None:
+            self.authkey = write_authkey(self.socket_path)
+        # Connections are authenticated in their own threads rather than by accept()
+        self._listener = Listener(self.socket_path, family="AF_UNIX")
+        os.chmod(self.socket_path, 0o600)
+        self.loader.start(background=True)
+        self.symptoms_model.watch_catalogue(self.catalogue_reload_interval)
+        print(f"Model server listening on {self.socket_path}")
+        try:
+            while True:
+                try:
+                    connection = self._listener.accept()
+                except OSError:
+                    if self._listener is None:
+                        break  # closed
+                    continue
+                threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        self.symptoms_model.disable_batching()
+
+    def _serve(self, connection):
+        try:
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            print(f"Rejected model server connection: {type(e).__name__}: {e}")
+            connection.close()
+            return
+        with self._lock:
+            self._connections += 1
+        try:
+            while True:
+                try:
+                    op, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    reply = ("ok", self._dispatch(op, **kwargs))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                connection.send(reply)
+        finally:
+            connection.close()
+            with self._lock:
+                self._connections -= 1
+
+    def _dispatch(self, op, **kwargs):
+        with self._lock:
+            self._requests += 1
+        handler = getattr(self, f"_op_{op}", None)
+        if handler is None:
+            raise ValueError(f"Unknown model server operation '{op}'")
+        return handler(**kwargs)
+
+    def _op_status(self):
+        return self.loader.status()
+
+    def _op_catalogue(self):
+        model = self.symptoms_model
+        return {
+            "labels": list(model.labels),
+            "hypothesis_template": model.hypothesis_template,
+            "catalogue_fingerprint": model.catalogue_fingerprint,
+        }
+
+    def _op_catalogue_fingerprint(self):
+        return self.symptoms_model.catalogue_fingerprint
+
+    def _op_analyze(self, text):
+        return self.symptoms_model.analyze(text)
+
+    def _op_analyze_batch(self, texts, batch_size=None):
+        return self.symptoms_model.analyze_batch(texts, batch_size=batch_size)
+
+    def _op_predict_images(self, shm, shape, dtype):
+        if self.image_model is None:
+            raise RuntimeError("No image model is loaded")
+        segment = _attach_shared_memory(shm)
+        batch = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        try:
+            # Copy so nothing refers to the segment once it's closed
+            return np.array(self.image_model.predict(batch), dtype=np.float32)
+        finally:
+            del batch  # release the buffer before closing the segment
+            segment.close()
+
+    def _op_stats(self):
+        with self._lock:
+            server = {"pid": os.getpid(), "connections": self._connections, "requests": self._requests}
+        return {
+            "server": server,
+            "profile": self.symptoms_model.profile.describe(),
+            "engine": self.symptoms_model.engine_stats(),
+            "batching": self.symptoms_model.batching_stats(),
+            "cascade": self.symptoms_model.cascade_stats(),
+        }
+
+
+class ModelClient:
+    """Connection to a ModelServer, usable from any thread of a web worker.
+
+    Each thread keeps its own connection, reopened after a fork and after
+    the server restarts. Without an `authkey` (or MODEL_SERVER_AUTHKEY), the
+    key the server wrote next to its socket is read on every connect, so a
+    restarted server's new key is picked up.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, authkey=AUTHKEY, poll_interval=0.5):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            authkey = self.authkey or read_authkey(self.socket_path)
+            local.connection = Client(self.socket_path, family="AF_UNIX", authkey=authkey)
+            local.pid = os.getpid()
+        return local.connection
+
+    def _reset(self):
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def call(self, op, **kwargs):
+        """Run an operation on the server and return its result"""
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send((op, kwargs))
+                status, value = connection.recv()
+                break
+            except (EOFError, ConnectionError, BrokenPipeError):
+                # The server restarted; reconnect once
+                self._reset()
+                if attempt:
+                    raise
+        if status == "error":
+            raise ModelServerError(value)
+        return value
+
+    def wait_ready(self, name, timeout=None):
+        """Block until the server has loaded a model; False if it failed or isn't configured"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                state = self.call("status")["models"].get(name, {}).get("state")
+            except (FileNotFoundError, ConnectionRefusedError):
+                state = None  # server not up yet
+            else:
+                if state == READY:
+                    return True
+                if state in (FAILED, None):
+                    return False
+            time.sleep(self.poll_interval)
+        return False
+
+    def predict_images(self, batch):
+        """Run the server's image model on a batch passed through shared memory"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        segment = shared_memory.SharedMemory(create=True, size=max(batch.nbytes, 1))
+        try:
+            np.ndarray(batch.shape, dtype=batch.dtype, buffer=segment.buf)[...] = batch
+            return self.call("predict_images", shm=segment.name, shape=batch.shape, dtype=batch.dtype.str)
+        finally:
+            segment.close()
+            segment.unlink()
+
+
+class RemoteProfile:
+    """Stands in for the analyzer's InferenceProfile in /api/stats"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def describe(self):
+        return self._client.call("stats")["profile"]
+
+
+class RemoteSymptomAnalyzer:
+    """The parts of SymptomAnalyzer main.py uses, answered by a ModelServer
+
+    With a `local` analyzer (a lazy SymptomAnalyzer over the same catalogue),
+    the catalogue details come from it without a round trip, and requests
+    fall back to its keyword matching, flagged degraded, while the server is
+    unreachable.
+    """
+
+    def __init__(self, client, refresh_interval=10.0, local=None):
+        self.client = client
+        self.profile = RemoteProfile(client)
+        self.refresh_interval = refresh_interval
+        self.local = local
+        self._catalogue = None
+        self._checked_at = 0.0
+
+    def _catalogue_value(self, key):
+        if self.local is not None:
+            return getattr(self.local, key)
+        # Fetched once per worker and dropped by refresh_catalogue(), or when
+        # a periodic fingerprint check shows the server reloaded its catalogue
+        now = time.monotonic()
+        catalogue = self._catalogue
+        if catalogue is not None and self.refresh_interval and now - self._checked_at > self.refresh_interval:
+            self._checked_at = now
+            if self.client.call("catalogue_fingerprint") != catalogue["catalogue_fingerprint"]:
+                catalogue = None
+        if catalogue is None:
+            catalogue = self._catalogue = self.client.call("catalogue")
+            self._checked_at = now
+        return catalogue[key]
+
+    @property
+    def labels(self):
+        return self._catalogue_value("labels")
+
+    @property
+    def hypothesis_template(self):
+        return self._catalogue_value("hypothesis_template")
+
+    @property
+    def catalogue_fingerprint(self):
+        return self._catalogue_value("catalogue_fingerprint")
+
+    def refresh_catalogue(self):
+        self._catalogue = None
+
+    def _call_or_fallback(self, op, fallback, **kwargs):
+        try:
+            with stage("model_server"):
+                return self.client.call(op, **kwargs)
+        except (OSError, EOFError, AuthenticationError):
+            if self.local is None:
+                raise
+        return fallback()
+
+    def analyze(self, text):
+        def fallback():
+            return dict(self.local.analyze(text), degraded=True)
+        return self._call_or_fallback("analyze", fallback, text=text)
+
+    def analyze_batch(self, texts, batch_size=None):
+        texts = list(texts)
+
+        def fallback():
+            return [dict(result, degraded=True) for result in self.local.analyze_batch(texts)]
+        return self._call_or_fallback("analyze_batch", fallback, texts=texts, batch_size=batch_size)
+
+    def batching_stats(self):
+        return self.client.call("stats")["batching"]
+
+    def cascade_stats(self):
+        return self.client.call("stats")["cascade"]
+
+    def engine_stats(self):
+        return self.client.call("stats")["engine"]
+
+
+class RemoteImageModel:
+    """Image model with the usual `predict(batch)` interface, run by a ModelServer"""
+
+    runtime = "model-server"
+
+    def __init__(self, client):
+        self.client = client
+
+    def predict(self, data):
+        with stage("model_server"):
+            return self.client.predict_images(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the symptom and image models to local web workers")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path (default: MODEL_SERVER_SOCKET)")
+    args = parser.parse_args()
+
+    server = ModelServer(args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
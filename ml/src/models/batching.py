@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import metrics
+
+
+class MicroBatcher:
+    """Collect concurrent requests into batches for a single inference thread.
+
+    Callers submit one item at a time and block on a future. A background
+    worker waits until either `max_batch_size` items are queued or the oldest
+    item has waited `max_wait_ms`, then calls `batch_fn` once with the whole
+    batch and hands each caller its own result. Stage timings recorded
+    while the batch runs, and each caller's queue wait, are added to the
+    timings of every request in the batch.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10, name="micro-batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Metrics
+        self._max_queue_depth = 0
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_batch_time = 0.0
+        self._batch_size_histogram = {}
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue an item and return a future for its result"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batcher has been closed")
+            self._queue.append((item, future, time.perf_counter(), metrics.current()))
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify()
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Submit an item and block until its result is available"""
+        return self.submit(item).result(timeout)
+
+    def close(self):
+        """Stop accepting work and let the worker drain the queue"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        """Return queue-depth and batch-size metrics"""
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items())),
+                "avg_queue_wait_ms": self._total_wait / self._items * 1000 if self._items else 0.0,
+                "max_queue_wait_ms": self._max_wait_seen * 1000,
+                "avg_batch_time_ms": self._total_batch_time / self._batches * 1000 if self._batches else 0.0,
+            }
+
+    def _next_batch(self):
+        """Block until a batch is ready; return None once closed and drained"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            # The wait budget is measured from the oldest queued request
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            items = [item for item, _, _, _ in batch]
+            batch_timings = metrics.RequestTimings(self._thread.name)
+            try:
+                with metrics.activate(batch_timings):
+                    results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"Batch function returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                self._charge(batch, started, batch_timings)
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                failed = True
+            else:
+                self._charge(batch, started, batch_timings)
+                for (_, future, _, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+            finished = time.perf_counter()
+
+            with self._cond:
+                self._batches += 1
+                self._items += len(batch)
+                self._errors += 1 if failed else 0
+                self._total_batch_time += finished - started
+                self._batch_size_histogram[len(batch)] = self._batch_size_histogram.get(len(batch), 0) + 1
+                for _, _, enqueued, _ in batch:
+                    waited = started - enqueued
+                    self._total_wait += waited
+                    self._max_wait_seen = max(self._max_wait_seen, waited)
+
+    @staticmethod
+    def _charge(batch, started, batch_timings):
+        """Add the shared batch's stage times to each caller's request timings"""
+        # Before the futures resolve, while the callers are still waiting
+        for _, _, enqueued, timings in batch:
+            if timings is not None:
+                timings.add("batch_wait", started - enqueued)
+                timings.merge(batch_timings)
@@ -0,0 +1,83 @@
+import os
+import threading
+
+# Where an analysis ended: answered by keyword matching without running the
+# classifier; answered by the classifier; the classifier ran but was not
+# confident enough (or failed) and the keyword answer was kept; or no
+# classifier was loaded
+OUTCOMES = ("keyword_exit", "classifier", "classifier_rejected", "classifier_error", "keyword_only")
+
+
+class CascadePolicy:
+    """Early-exit rules for SymptomAnalyzer's keyword -> classifier cascade.
+
+    Keyword matching is cheap and runs first. When its best condition has
+    at least `keyword_min_matches` matched symptoms and leads the runner-up
+    by at least `keyword_min_margin`, the answer is returned without running
+    the zero-shot classifier. Otherwise the classifier runs, and its top
+    label replaces the keyword answer only if its confidence exceeds
+    `classifier_min_confidence` percent.
+
+    `keyword_min_matches=None`, the default, never exits early, which is
+    the always-run-everything behaviour; early exit is opt-in because it
+    can change diagnoses.
+    """
+
+    def __init__(self, keyword_min_matches=None, keyword_min_margin=1, classifier_min_confidence=40):
+        self.keyword_min_matches = keyword_min_matches
+        self.keyword_min_margin = keyword_min_margin
+        self.classifier_min_confidence = classifier_min_confidence
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Build a policy from SYMPTOMS_CASCADE_MIN_MATCHES (unset or 0 disables early exit) and SYMPTOMS_CASCADE_MIN_MARGIN"""
+        min_matches = int(environ.get("SYMPTOMS_CASCADE_MIN_MATCHES") or 0)
+        return cls(
+            keyword_min_matches=min_matches or None,
+            keyword_min_margin=int(environ.get("SYMPTOMS_CASCADE_MIN_MARGIN", 1))
+        )
+
+    def keyword_decisive(self, ranked):
+        """Whether keyword matches, as [(condition, count), ...] best first, settle the answer"""
+        if self.keyword_min_matches is None or not ranked:
+            return False
+        best = ranked[0][1]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        return best >= self.keyword_min_matches and best - runner_up >= self.keyword_min_margin
+
+    def describe(self):
+        return {
+            "keyword_min_matches": self.keyword_min_matches,
+            "keyword_min_margin": self.keyword_min_margin,
+            "classifier_min_confidence": self.classifier_min_confidence,
+        }
+
+
+class CascadeStats:
+    """Thread-safe counts of how each analysis ended"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(OUTCOMES, 0)
+
+    def record(self, outcome, count=1):
+        with self._lock:
+            self._counts[outcome] += count
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(OUTCOMES, 0)
+
+    def snapshot(self):
+        """Counts per outcome, with each outcome's share of all analyses"""
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        classifier_runs = counts["classifier"] + counts["classifier_rejected"] + counts["classifier_error"]
+        return {
+            "analyses": total,
+            "counts": counts,
+            "hit_rates": {outcome: count / total if total else 0.0 for outcome, count in counts.items()},
+            "classifier_runs": classifier_runs,
+            "classifier_runs_saved": counts["keyword_exit"],
+        }
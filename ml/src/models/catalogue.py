@@ -0,0 +1,474 @@
+"""Versioned, memory-mapped condition catalogue.
+
+`SymptomAnalyzer.save` used to pickle `conditions_info`, so every worker
+had to unpickle the whole catalogue into its own Python objects and
+rebuild the keyword index on load. This format stores the catalogue as
+flat integer arrays plus one string table, with the keyword-matching trie
+and a sorted name index already built. Loading maps the file read-only
+and decodes nothing up front, so load time does not depend on the number
+of conditions and every process mapping the file shares the same page
+cache pages. Strings are decoded only when a condition is looked up.
+
+Layout (all integers in the writer's native byte order, recorded in the
+table of contents):
+
+    8 bytes   MAGIC
+    uint32    format version
+    uint32    length of the table of contents
+    ...       table of contents: JSON with the byte order, content
+              fingerprint and (offset, typecode, length) of every array
+    ...       arrays, each aligned to 8 bytes
+
+Arrays (int32 "i" or int64 "q"; "string ids" index the string table):
+
+    strings, string_offsets       UTF-8 blob and (S + 1) offsets into it
+    names                         string id per condition, in catalogue order
+    recommendations               string id per condition, or -1
+    extras                        string id of a JSON object with any other
+                                  keys of the condition, or -1
+    symptom_offsets, symptoms     CSR list of symptom string ids per condition
+    synonym_offsets, synonyms     CSR list of synonym string ids per symptom
+    labels                        string id per classifier label
+    sorted_names                  condition indices ordered by name
+    tokens                        string id per trie token
+    token_keys, token_values      open-addressing hash table, crc32 -> token id
+    edge_keys, edge_values        open-addressing hash table,
+                                  (node << 32 | token id) -> child node
+    end_offsets, end_symptoms     CSR list of symptom ids ending at each node
+    symptom_condition             condition index per symptom id
+
+Hash tables use linear probing with -1 marking empty slots, so a lookup
+costs a few array reads regardless of the catalogue size.
+"""
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping, Sequence
+
+from models.keyword_matcher import _END, KeywordMatcher, tokenize
+
+MAGIC = b"MEDICAT\x00"
+FORMAT_VERSION = 1
+
+# Where initialize_symptoms_model.py writes the catalogue, and the pickle it replaced
+DEFAULT_CATALOGUE_PATH = os.path.join("models", "clinical_symptoms_analyzer.catalogue")
+LEGACY_CONFIG_PATH = os.path.join("models", "clinical_symptoms_analyzer.pkl")
+
+_HEADER = struct.Struct("<8sII")
+_MASK64 = (1 << 64) - 1
+_MIX = 0x9E3779B97F4A7C15
+
+
+def find_catalogue(path=None):
+    """Return the catalogue file to load: `path`, else the default one, else a legacy pickle, or None"""
+    for candidate in (path, DEFAULT_CATALOGUE_PATH, LEGACY_CONFIG_PATH):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def is_catalogue_file(path):
+    """Whether `path` holds a catalogue in this format (rather than a legacy pickle)"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _slot(key, bits):
+    # Fibonacci hashing: the high bits of key * 2^64/phi
+    return ((key * _MIX) & _MASK64) >> (64 - bits)
+
+
+def _hash_table(items):
+    """Build parallel (keys, values) arrays for an open-addressing table of int keys >= 0"""
+    bits = max(3, (2 * len(items) - 1).bit_length())
+    size = 1 << bits
+    keys = array("q", [-1]) * size
+    values = array("i", [-1]) * size
+    for key, value in items:
+        slot = _slot(key, bits)
+        while keys[slot] != -1:
+            slot = (slot + 1) & (size - 1)
+        keys[slot] = key
+        values[slot] = value
+    return keys, values
+
+
+class _StringTable:
+    """Interns strings while writing, so repeated text is stored once"""
+
+    def __init__(self):
+        self.ids = {}
+        self.blob = bytearray()
+        self.offsets = array("q", [0])
+
+    def add(self, text):
+        if text is None:
+            return -1
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.offsets) - 1
+            self.blob += text.encode("utf-8")
+            self.offsets.append(len(self.blob))
+        return string_id
+
+
+def write_catalogue(path, conditions_info, labels=None):
+    """Write `conditions_info` (and the classifier's label list) to `path`
+
+    The file is written next to `path` and renamed over it, so processes
+    that have the previous version mapped keep reading a consistent copy.
+    Returns the content fingerprint.
+    """
+    labels = list(conditions_info) if labels is None else list(labels)
+    strings = _StringTable()
+    names = array("i")
+    recommendations = array("i")
+    extras = array("i")
+    symptom_offsets, symptoms = array("q", [0]), array("i")
+    synonym_offsets, synonyms = array("q", [0]), array("i")
+
+    for name, info in conditions_info.items():
+        names.append(strings.add(name))
+        recommendations.append(strings.add(info.get("recommendations")))
+        extra = {k: v for k, v in info.items() if k not in ("symptoms", "synonyms", "recommendations")}
+        extras.append(strings.add(json.dumps(extra, sort_keys=True)) if extra else -1)
+        condition_synonyms = info.get("synonyms", {})
+        for symptom in info.get("symptoms", []):
+            symptoms.append(strings.add(symptom))
+            synonyms.extend(strings.add(synonym) for synonym in condition_synonyms.get(symptom, []))
+            synonym_offsets.append(len(synonyms))
+        symptom_offsets.append(len(symptoms))
+
+    label_ids = array("i", (strings.add(label) for label in labels))
+    condition_names = list(conditions_info)
+    sorted_names = array("i", sorted(range(len(condition_names)), key=condition_names.__getitem__))
+
+    # Flatten KeywordMatcher's dict trie breadth-first; node 0 is the root
+    matcher = KeywordMatcher(conditions_info)
+    token_ids = {token: i for i, token in enumerate(sorted(_trie_tokens(matcher._trie)))}
+    tokens = array("i", (strings.add(token) for token in token_ids))
+    edges, end_offsets, end_symptoms = [], array("q", [0]), array("i")
+    nodes = [matcher._trie]
+    for node_id, node in enumerate(nodes):
+        for token, child in node.items():
+            if token is _END:
+                continue
+            edges.append(((node_id << 32) | token_ids[token], len(nodes)))
+            nodes.append(child)
+        end_symptoms.extend(sorted(set(node.get(_END, ()))))
+        end_offsets.append(len(end_symptoms))
+    edge_keys, edge_values = _hash_table(edges)
+    token_keys, token_values = _hash_table(
+        [(zlib.crc32(token.encode("utf-8")), i) for token, i in token_ids.items()]
+    )
+
+    arrays = {
+        "string_offsets": strings.offsets,
+        "names": names,
+        "recommendations": recommendations,
+        "extras": extras,
+        "symptom_offsets": symptom_offsets,
+        "symptoms": symptoms,
+        "synonym_offsets": synonym_offsets,
+        "synonyms": synonyms,
+        "labels": label_ids,
+        "sorted_names": sorted_names,
+        "tokens": tokens,
+        "token_keys": token_keys,
+        "token_values": token_values,
+        "edge_keys": edge_keys,
+        "edge_values": edge_values,
+        "end_offsets": end_offsets,
+        "end_symptoms": end_symptoms,
+        "symptom_condition": array("i", matcher._symptom_condition),
+    }
+
+    digest = hashlib.sha256(bytes(strings.blob))
+    for name, values in arrays.items():
+        digest.update(name.encode("ascii"))
+        digest.update(values.tobytes())
+    fingerprint = digest.hexdigest()
+
+    # Lay out the payload, then size the table of contents to fit in front of it
+    payload, toc_arrays = [], {}
+    offset = 0
+
+    def place(name, data, typecode):
+        nonlocal offset
+        offset += -offset % 8
+        toc_arrays[name] = [offset, typecode, len(data) // (array(typecode).itemsize if typecode else 1)]
+        payload.append((offset, data))
+        offset += len(data)
+
+    place("strings", bytes(strings.blob), "")
+    for name, values in arrays.items():
+        place(name, values.tobytes(), values.typecode)
+
+    toc = {"byteorder": sys.byteorder, "fingerprint": fingerprint, "arrays": toc_arrays}
+    toc_bytes = json.dumps(toc).encode("utf-8")
+    start = _HEADER.size + len(toc_bytes)
+    start += -start % 8
+    # Offsets in the table of contents are relative to the aligned start of the payload
+    toc["payload"] = start
+    toc_bytes = json.dumps(toc).encode("utf-8")
+    while _HEADER.size + len(toc_bytes) > start:
+        start += 8
+        toc["payload"] = start
+        toc_bytes = json.dumps(toc).encode("utf-8")
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(toc_bytes)))
+        f.write(toc_bytes)
+        for data_offset, data in payload:
+            f.seek(start + data_offset)
+            f.write(data)
+    os.replace(temporary, path)
+    return fingerprint
+
+
+def _trie_tokens(trie):
+    tokens, stack = set(), [trie]
+    while stack:
+        node = stack.pop()
+        for token, child in node.items():
+            if token is not _END:
+                tokens.add(token)
+                stack.append(child)
+    return tokens
+
+
+class _StringView(Sequence):
+    """Read-only sequence of strings given by an array of string ids"""
+
+    def __init__(self, catalogue, ids):
+        self._catalogue = catalogue
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._catalogue.string(i) for i in self._ids[index]]
+        return self._catalogue.string(self._ids[index])
+
+
+class _SortedNames(Sequence):
+    """Condition names in sorted order, for bisecting"""
+
+    def __init__(self, catalogue):
+        self._catalogue = catalogue
+
+    def __len__(self):
+        return len(self._catalogue)
+
+    def __getitem__(self, index):
+        return self._catalogue.name(self._catalogue._sorted_names[index])
+
+
+class Catalogue(Mapping):
+    """Read-only {condition name: info} mapping backed by a memory-mapped file.
+
+    Behaves like the `conditions_info` dict it was written from, with
+    conditions in the same order, and decodes each condition only when it
+    is accessed. `keyword_matcher` matches texts against the stored trie
+    without building it in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies the file that was mapped, for reload checks
+        self.file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        magic, version, toc_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a condition catalogue")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalogue version {version} in {path}")
+        toc = json.loads(bytes(self._mmap[_HEADER.size:_HEADER.size + toc_length]))
+        if toc["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {toc['byteorder']}-endian machine")
+        self.content_fingerprint = toc["fingerprint"]
+
+        view = memoryview(self._mmap)
+        self._views = []
+        for name, (offset, typecode, length) in toc["arrays"].items():
+            start = toc["payload"] + offset
+            if typecode:
+                data = view[start:start + length * array(typecode).itemsize].cast(typecode)
+            else:
+                data = view[start:start + length]
+            self._views.append(data)
+            setattr(self, f"_{name}", data)
+        self._views.append(view)
+
+        self._token_bits = (len(self._token_keys) - 1).bit_length()
+        self._edge_bits = (len(self._edge_keys) - 1).bit_length()
+        self.labels = _StringView(self, self._labels)
+        self.keyword_matcher = MappedKeywordMatcher(self)
+
+    def close(self):
+        """Unmap the file; only call once nothing uses the catalogue any more"""
+        for data in self._views:
+            data.release()
+        self._views = []
+        self._mmap.close()
+
+    # Strings and conditions by index
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        offsets = self._string_offsets
+        return str(self._strings[offsets[string_id]:offsets[string_id + 1]], "utf-8")
+
+    def name(self, index):
+        return self.string(self._names[index])
+
+    def index_of(self, name):
+        """Position of a condition in the catalogue, or -1"""
+        sorted_names = _SortedNames(self)
+        position = bisect.bisect_left(sorted_names, name)
+        if position < len(sorted_names) and sorted_names[position] == name:
+            return self._sorted_names[position]
+        return -1
+
+    def info(self, index):
+        """Decode one condition into the dict form of `conditions_info`"""
+        start, end = self._symptom_offsets[index], self._symptom_offsets[index + 1]
+        symptoms = [self.string(self._symptoms[i]) for i in range(start, end)]
+        info = {"symptoms": symptoms}
+        synonyms = {}
+        for symptom_id, symptom in zip(range(start, end), symptoms):
+            first, last = self._synonym_offsets[symptom_id], self._synonym_offsets[symptom_id + 1]
+            if last > first:
+                synonyms[symptom] = [self.string(self._synonyms[i]) for i in range(first, last)]
+        if synonyms:
+            info["synonyms"] = synonyms
+        recommendation = self.string(self._recommendations[index])
+        if recommendation is not None:
+            info["recommendations"] = recommendation
+        if self._extras[index] >= 0:
+            info.update(json.loads(self.string(self._extras[index])))
+        return info
+
+    # Mapping interface
+
+    def __getitem__(self, name):
+        index = self.index_of(name)
+        if index < 0:
+            raise KeyError(name)
+        return self.info(index)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self.index_of(name) >= 0
+
+    def __iter__(self):
+        for index in range(len(self._names)):
+            yield self.name(index)
+
+    def __len__(self):
+        return len(self._names)
+
+    # Hash table lookups
+
+    def token_id(self, token):
+        """Id of a trie token, or -1 if no symptom phrase contains it"""
+        encoded = token.encode("utf-8")
+        key = zlib.crc32(encoded)
+        keys, values = self._token_keys, self._token_values
+        mask = len(keys) - 1
+        slot = _slot(key, self._token_bits)
+        while True:
+            found = keys[slot]
+            if found == -1:
+                return -1
+            if found == key:
+                token_id = values[slot]
+                string_id = self._tokens[token_id]
+                offsets = self._string_offsets
+                if self._strings[offsets[string_id]:offsets[string_id + 1]] == encoded:
+                    return token_id
+            slot = (slot + 1) & mask
+
+    def child(self, node, token_id):
+        """Trie node reached from `node` by `token_id`, or -1"""
+        key = (node << 32) | token_id
+        keys = self._edge_keys
+        mask = len(keys) - 1
+        slot = _slot(key, self._edge_bits)
+        while True:
+            found = keys[slot]
+            if found == key:
+                return self._edge_values[slot]
+            if found == -1:
+                return -1
+            slot = (slot + 1) & mask
+
+
+class MappedKeywordMatcher:
+    """KeywordMatcher's interface over a Catalogue's stored trie"""
+
+    def __init__(self, catalogue):
+        self.catalogue = catalogue
+
+    def _matched_symptoms(self, text):
+        catalogue = self.catalogue
+        tokens = [catalogue.token_id(token) for token in tokenize(text)]
+        end_offsets, end_symptoms = catalogue._end_offsets, catalogue._end_symptoms
+        found = set()
+        for start in range(len(tokens)):
+            position = start
+            node = 0
+            while position < len(tokens) and tokens[position] >= 0:
+                node = catalogue.child(node, tokens[position])
+                if node < 0:
+                    break
+                position += 1
+                first, last = end_offsets[node], end_offsets[node + 1]
+                if last > first:
+                    found.update(end_symptoms[first:last].tolist())
+        return found
+
+    def _condition_counts(self, text):
+        counts = {}
+        symptom_condition = self.catalogue._symptom_condition
+        for symptom_id in self._matched_symptoms(text):
+            index = symptom_condition[symptom_id]
+            counts[index] = counts.get(index, 0) + 1
+        return counts
+
+    def match(self, text):
+        """Return {condition: matched symptom count} for conditions with at least one match"""
+        return {self.catalogue.name(index): count for index, count in self._condition_counts(text).items()}
+
+    def match_batch(self, texts):
+        """Match many texts; returns one count dict per text, in order"""
+        return [self.match(text) for text in texts]
+
+    def ranked(self, text, limit=None):
+        """Return [(condition, matches), ...] best first, ties in catalogue order"""
+        counts = self._condition_counts(text)
+        order = sorted(counts, key=lambda i: (-counts[i], i))
+        return [(self.catalogue.name(index), counts[index]) for index in order[:limit]]
+
+    def best(self, text):
+        """Return (condition, matches) for the best-matching condition, or (None, 0)
+
+        Ties go to the condition listed first in the catalogue.
+        """
+        counts = self._condition_counts(text)
+        if not counts:
+            return None, 0
+        index = min(counts, key=lambda i: (-counts[i], i))
+        return self.catalogue.name(index), counts[index]
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from metrics import stage
+
+# Sentence encoder used to embed patient texts and condition descriptions
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Version of the saved index layout
+INDEX_FORMAT = 1
+
+
+def index_path_for(config_path):
+    """Path of the vector index saved next to a SymptomAnalyzer configuration file"""
+    return os.path.splitext(config_path)[0] + ".index.npz"
+
+
+def condition_document(name, info):
+    """Text embedded for a condition: its name, optional description and symptom list"""
+    parts = [name]
+    if info.get("description"):
+        parts.append(info["description"])
+    if info.get("symptoms"):
+        parts.append("Symptoms: " + ", ".join(info["symptoms"]))
+    return ". ".join(parts)
+
+
+class SentenceEncoder:
+    """Mean-pooled, L2-normalized sentence embeddings from a transformers encoder"""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, device=-1, max_length=128):
+        # Deferred so that importing this module doesn't pull in torch/transformers
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.model_name = model_name
+        self.max_length = max_length
+        self.device = torch.device("cpu" if device < 0 else f"cuda:{device}")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.to(self.device)
+        self.model.eval()
+
+    def encode(self, texts, batch_size=64):
+        """Return a float32 (len(texts), dim) matrix of unit-length embeddings"""
+        import torch
+
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            with stage("tokenization"):
+                encoded = self.tokenizer(
+                    list(texts[start:start + batch_size]),
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt"
+                ).to(self.device)
+            with stage("model_forward"), torch.inference_mode():
+                hidden = self.model(**encoded).last_hidden_state
+                mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                pooled = torch.nn.functional.normalize(pooled, dim=-1)
+            chunks.append(pooled.float().cpu().numpy())
+        if not chunks:
+            return np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+        return np.concatenate(chunks)
+
+
+class ConditionIndex:
+    """Unit-length condition embeddings, searched by cosine similarity.
+
+    Row i of `vectors` embeds `labels[i]`. Because rows and queries are
+    normalized, one matrix multiply scores a query against every condition,
+    and the top k are picked with a partial sort, so the cost per request is
+    a single encoder pass plus O(conditions x dim) arithmetic.
+
+    `fingerprint` identifies the encoder and the embedded documents, so a
+    saved index is only reused for the catalogue it was built from.
+    """
+
+    def __init__(self, labels, vectors, fingerprint, model_name):
+        self.labels = list(labels)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.fingerprint = fingerprint
+        self.model_name = model_name
+
+    @staticmethod
+    def catalogue_fingerprint(conditions_info, labels, model_name):
+        documents = [condition_document(label, conditions_info.get(label, {})) for label in labels]
+        return hashlib.sha256(json.dumps([model_name, documents]).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def build(cls, encoder, conditions_info, labels):
+        """Embed every label's condition document"""
+        documents = [condition_document(label, conditions_info.get(label, {})) for label in labels]
+        return cls(
+            labels,
+            encoder.encode(documents),
+            cls.catalogue_fingerprint(conditions_info, labels, encoder.model_name),
+            encoder.model_name
+        )
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                format=np.array(INDEX_FORMAT),
+                labels=np.array(self.labels, dtype=str),
+                vectors=self.vectors,
+                fingerprint=np.array(self.fingerprint),
+                model_name=np.array(self.model_name)
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format"]) != INDEX_FORMAT:
+                raise ValueError(f"Unsupported index format {int(data['format'])} in {path}")
+            return cls(
+                data["labels"].tolist(),
+                data["vectors"],
+                str(data["fingerprint"]),
+                str(data["model_name"])
+            )
+
+    def search(self, queries, k):
+        """Return (indices, similarities, all similarities) for the top k rows per query
+
+        `queries` is a (num_queries, dim) matrix of unit vectors. The first two
+        results have shape (num_queries, k) and are ordered best first.
+        """
+        similarities = queries @ self.vectors.T
+        k = min(k, len(self.labels))
+        if k < len(self.labels):
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(len(self.labels)), (len(queries), 1))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return top, np.take_along_axis(top_scores, order, axis=1), similarities
+
+
+class EmbeddingRetriever:
+    """Zero-shot classifier that ranks conditions by embedding similarity.
+
+    Condition descriptions are embedded once into a ConditionIndex; each
+    request embeds only the patient text and scores it against the whole
+    catalogue in one matrix multiply, so adding conditions costs memory
+    rather than encoder passes. The similarities of the retrieved candidates
+    are turned into probabilities with a softmax at `temperature` over those
+    candidates alone; normalizing over the whole catalogue would spread the
+    mass across thousands of unrelated conditions and push even a clear
+    match below the service's confidence threshold.
+
+    With `reranker` (a zero-shot NLI classifier) and `rerank_top` > 0, the
+    best `rerank_top` candidates are re-scored by NLI, which pays for a
+    cross-encoder pass on only those labels. Their share of the probability
+    mass is split according to the NLI scores.
+
+    The call signature and returned dict match
+    `pipeline("zero-shot-classification")`, with only the top `top_k`
+    labels returned, so it can be used as a `SymptomAnalyzer.classifier`.
+    """
+
+    def __init__(self, conditions_info, labels, model_name=EMBEDDING_MODEL, device=-1, top_k=4,
+                 temperature=0.05, reranker=None, rerank_top=0, index_path=None, encoder=None):
+        self.encoder = encoder or SentenceEncoder(model_name, device=device)
+        self.top_k = top_k
+        self.temperature = temperature
+        self.reranker = reranker
+        self.rerank_top = rerank_top if reranker is not None else 0
+
+        self._checked_labels = None
+        self.index = self.build_index(conditions_info, labels, index_path)
+
+    def build_index(self, conditions_info, labels, index_path=None):
+        """Return the index for a catalogue, read from `index_path` if it is up to date"""
+        fingerprint = ConditionIndex.catalogue_fingerprint(conditions_info, labels, self.encoder.model_name)
+        if index_path and os.path.exists(index_path):
+            try:
+                index = ConditionIndex.load(index_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not read condition index {index_path}: {str(e)}")
+            else:
+                if index.fingerprint == fingerprint:
+                    return index
+        print(f"Embedding {len(labels)} conditions with {self.encoder.model_name}")
+        return ConditionIndex.build(self.encoder, conditions_info, labels)
+
+    def use_index(self, index):
+        """Switch to another catalogue's index, e.g. after a catalogue reload"""
+        self.index = index
+        self._checked_labels = None
+
+    @property
+    def model(self):
+        return self.encoder.model
+
+    @model.setter
+    def model(self, model):
+        # Lets InferenceProfile.prepare swap in a quantized encoder
+        self.encoder.model = model
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template="This example is {}.",
+                 multi_label=False, batch_size=None):
+        """Rank the catalogue's conditions for one text or a list of texts"""
+        # Comparing every label is O(conditions); skip it for the list checked last time
+        if candidate_labels is not self._checked_labels:
+            if list(candidate_labels) != self.index.labels:
+                raise ValueError("Candidate labels differ from the condition index; rebuild the index")
+            self._checked_labels = candidate_labels
+        single = isinstance(sequences, str)
+        texts = [sequences] if single else list(sequences)
+
+        queries = self.encoder.encode(texts, batch_size=batch_size or 64)
+        with stage("retrieval"):
+            top, top_scores, _ = self.index.search(queries, max(self.top_k, self.rerank_top))
+            # Softmax over the retrieved candidates, shifted by the best score for stability
+            logits = top_scores / self.temperature
+            probabilities = np.exp(logits - logits[:, :1])
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        results = []
+        for i, text in enumerate(texts):
+            labels = [self.index.labels[j] for j in top[i]]
+            scores = probabilities[i].tolist()
+            if self.rerank_top:
+                labels, scores = self._rerank(text, labels, scores, hypothesis_template)
+            results.append({"sequence": text, "labels": labels[:self.top_k], "scores": scores[:self.top_k]})
+
+        return results[0] if single else results
+
+    def _rerank(self, text, labels, scores, hypothesis_template):
+        """Re-score the leading candidates with NLI, keeping their total probability"""
+        count = min(self.rerank_top, len(labels))
+        candidates, mass = labels[:count], sum(scores[:count])
+        prediction = self.reranker(text, candidates, hypothesis_template=hypothesis_template, multi_label=False)
+        ranked = [(score * mass, label) for label, score in zip(prediction["labels"], prediction["scores"])]
+        ranked += list(zip(scores[count:], labels[count:]))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [label for _, label in ranked], [score for score, _ in ranked]
@@ -0,0 +1,93 @@
+import os
+import sys
+from contextlib import nullcontext
+
+# Zero-shot NLI model; we use BART for zero-shot as ClinicalBERT isn't designed for this
+ZERO_SHOT_MODEL = "facebook/bart-large-mnli"
+
+# Smaller MNLI checkpoint distilled from bart-large-mnli (12 encoder, 3 decoder layers)
+DISTILLED_ZERO_SHOT_MODEL = "valhalla/distilbart-mnli-12-3"
+
+# Named profiles: which checkpoint to load and whether to quantize it
+PROFILES = {
+    "fp32": {"model_name": ZERO_SHOT_MODEL, "quantize": False},
+    "int8": {"model_name": ZERO_SHOT_MODEL, "quantize": True},
+    "distilled": {"model_name": DISTILLED_ZERO_SHOT_MODEL, "quantize": False},
+    "distilled-int8": {"model_name": DISTILLED_ZERO_SHOT_MODEL, "quantize": True},
+}
+
+
+class InferenceProfile:
+    """How the zero-shot classifier runs on CPU.
+
+    A profile picks the checkpoint, optionally applies dynamic int8
+    quantization to its Linear layers, and pins torch's intra-op/inter-op
+    thread pools. When several Flask threads or gunicorn workers share a
+    node, setting `intra_op_threads` to roughly cores / workers avoids
+    oversubscribing the CPU. `model_name` overrides the profile's
+    checkpoint, e.g. with a local directory.
+    """
+
+    def __init__(self, name="fp32", intra_op_threads=None, inter_op_threads=None, model_name=None):
+        if name not in PROFILES:
+            raise ValueError(f"Unknown inference profile '{name}', expected one of {tuple(PROFILES)}")
+        self.name = name
+        self.model_name = model_name or PROFILES[name]["model_name"]
+        self.quantize = PROFILES[name]["quantize"]
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Build a profile from SYMPTOMS_PROFILE, SYMPTOMS_MODEL, TORCH_INTRA_OP_THREADS and TORCH_INTER_OP_THREADS"""
+        intra = environ.get("TORCH_INTRA_OP_THREADS")
+        inter = environ.get("TORCH_INTER_OP_THREADS")
+        return cls(
+            name=environ.get("SYMPTOMS_PROFILE", "fp32"),
+            intra_op_threads=int(intra) if intra else None,
+            inter_op_threads=int(inter) if inter else None,
+            model_name=environ.get("SYMPTOMS_MODEL")
+        )
+
+    def apply_threading(self):
+        """Configure torch's thread pools for this process"""
+        import torch
+        if self.intra_op_threads:
+            torch.set_num_threads(self.intra_op_threads)
+        if self.inter_op_threads:
+            try:
+                torch.set_num_interop_threads(self.inter_op_threads)
+            except RuntimeError as e:
+                # Can only be set once, before any inter-op parallel work has started
+                print(f"Could not set inter-op threads: {str(e)}")
+
+    def prepare(self, model):
+        """Return the torch model converted for this profile"""
+        if not self.quantize:
+            return model
+        import torch
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def inference_context(self):
+        """Context manager that disables autograd tracking during inference"""
+        try:
+            import torch
+        except ImportError:
+            return nullcontext()
+        return torch.inference_mode()
+
+    def describe(self):
+        """Return the profile settings, with effective thread counts once torch is loaded"""
+        description = {
+            "profile": self.name,
+            "model": self.model_name,
+            "quantized": self.quantize,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+        }
+        # Don't import torch just to report on it
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            description["intra_op_threads"] = torch.get_num_threads()
+            description["inter_op_threads"] = torch.get_num_interop_threads()
+        return description
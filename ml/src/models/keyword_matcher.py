@@ -0,0 +1,97 @@
+import re
+
+# Words are runs of letters/digits, so matches always fall on word boundaries
+TOKEN_RE = re.compile(r"\w+")
+
+# Key under which a trie node stores the symptoms that end there
+_END = None
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class KeywordMatcher:
+    """Precompiled multi-pattern matcher over a condition catalogue.
+
+    Every symptom phrase (and any synonyms listed under a condition's optional
+    `synonyms` mapping) is compiled into a token trie once. Matching walks the
+    text's tokens in a single pass, following the trie from each position, so
+    the cost depends on the text length and the longest phrase rather than on
+    the number of conditions.
+
+    Each condition's score is the number of its distinct symptoms mentioned
+    in the text; a synonym counts as the symptom it stands for.
+    """
+
+    def __init__(self, conditions_info):
+        self.conditions = list(conditions_info.keys())
+        self._order = {condition: i for i, condition in enumerate(self.conditions)}
+        self._trie = {}
+        # symptom id -> index of the condition it belongs to
+        self._symptom_condition = []
+
+        for condition_idx, condition in enumerate(self.conditions):
+            info = conditions_info[condition]
+            synonyms = info.get("synonyms", {})
+            for symptom in info.get("symptoms", []):
+                symptom_id = len(self._symptom_condition)
+                self._symptom_condition.append(condition_idx)
+                for phrase in [symptom] + list(synonyms.get(symptom, [])):
+                    self._add(phrase, symptom_id)
+
+    def _add(self, phrase, symptom_id):
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(_END, []).append(symptom_id)
+
+    def _matched_symptoms(self, text):
+        """Return the ids of every symptom mentioned in the text"""
+        tokens = tokenize(text)
+        trie = self._trie
+        found = set()
+        for start in range(len(tokens)):
+            node = trie.get(tokens[start])
+            position = start + 1
+            while node is not None:
+                ends = node.get(_END)
+                if ends:
+                    found.update(ends)
+                if position == len(tokens):
+                    break
+                node = node.get(tokens[position])
+                position += 1
+        return found
+
+    def match(self, text):
+        """Return {condition: matched symptom count} for conditions with at least one match"""
+        counts = {}
+        for symptom_id in self._matched_symptoms(text):
+            condition = self.conditions[self._symptom_condition[symptom_id]]
+            counts[condition] = counts.get(condition, 0) + 1
+        return counts
+
+    def match_batch(self, texts):
+        """Match many texts; returns one count dict per text, in order"""
+        return [self.match(text) for text in texts]
+
+    def ranked(self, text, limit=None):
+        """Return [(condition, matches), ...] best first, ties in catalogue order"""
+        counts = self.match(text)
+        order = sorted(counts, key=lambda c: (-counts[c], self._order[c]))
+        return [(condition, counts[condition]) for condition in order[:limit]]
+
+    def best(self, text):
+        """Return (condition, matches) for the best-matching condition, or (None, 0)
+
+        Ties go to the condition listed first in the catalogue.
+        """
+        counts = self.match(text)
+        if not counts:
+            return None, 0
+        condition = min(counts, key=lambda c: (-counts[c], self._order[c]))
+        return condition, counts[condition]
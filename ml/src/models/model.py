@@ -3,11 +3,24 @@ from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Conv2D, Flatten, Dropout, MaxPooling2D
 import numpy as np
 import matplotlib.pyplot as plt
+import json
+import os
+import threading
+from models.preprocessing import ImagePreprocessor
+
+# Serving artifacts written by MedicalImageClassifier.export
+SERVING_FORMATS = ("savedmodel", "tflite", "tflite_int8", "onnx")
+SERVING_MANIFEST = "manifest.json"
+
+# Runtime order used when the manifest has no latency measurements.
+# int8 is left out because it trades accuracy for speed.
+DEFAULT_RUNTIME_PREFERENCE = ("onnx", "tflite", "savedmodel")
 
 class MedicalImageClassifier:
     def __init__(self, input_shape=(224, 224, 3), num_classes=5):
         self.input_shape = input_shape
         self.num_classes = num_classes
+        self.preprocessor = ImagePreprocessor(size=(input_shape[1], input_shape[0]))
         self.model = self._build_model()
         
     def _build_model(self):
@@ -33,15 +46,61 @@ class MedicalImageClassifier:
         
         return model
     
-    def train(self, train_data, train_labels, validation_data=None, 
-              validation_labels=None, epochs=10, batch_size=32):
-        """Train the model on the given data"""
-        history = self.model.fit(
-            train_data, train_labels,
-            validation_data=(validation_data, validation_labels) if validation_data is not None else None,
-            epochs=epochs,
-            batch_size=batch_size
+    def make_dataset(self, source, batch_size=32, shuffle=True, **kwargs):
+        """Build a streaming tf.data pipeline sized for this model
+        
+        `source` is a directory of per-class subdirectories or TFRecord shards;
+        see models.training_data.image_dataset for the other options.
+        """
+        from models.training_data import image_dataset
+        return image_dataset(
+            source,
+            num_classes=self.num_classes,
+            image_size=(self.input_shape[1], self.input_shape[0]),
+            batch_size=batch_size,
+            shuffle=shuffle,
+            **kwargs
         )
+    
+    def train(self, train_data, train_labels=None, validation_data=None, 
+              validation_labels=None, epochs=10, batch_size=32, checkpoint_dir=None,
+              checkpoint_every="epoch", callbacks=None):
+        """Train the model on the given data
+        
+        `train_data` (and `validation_data`) may be arrays with separate
+        labels, a tf.data.Dataset of (images, one-hot labels) batches, or a
+        directory / TFRecord pattern that is streamed with `make_dataset`.
+        
+        With `checkpoint_dir`, the model and optimizer state are saved every
+        `checkpoint_every` ("epoch" or a number of batches). An interrupted
+        run called again with the same directory resumes where it stopped;
+        the checkpoint is removed once training completes.
+        """
+        if isinstance(train_data, str):
+            train_data = self.make_dataset(train_data, batch_size=batch_size, shuffle=True)
+        if isinstance(validation_data, str):
+            validation_data = self.make_dataset(validation_data, batch_size=batch_size, shuffle=False)
+        
+        callbacks = list(callbacks or [])
+        if checkpoint_dir:
+            callbacks.append(tf.keras.callbacks.BackupAndRestore(checkpoint_dir, save_freq=checkpoint_every))
+        
+        if isinstance(train_data, tf.data.Dataset):
+            # Already batched and labelled
+            history = self.model.fit(
+                train_data,
+                validation_data=validation_data,
+                epochs=epochs,
+                callbacks=callbacks
+            )
+        else:
+            history = self.model.fit(
+                train_data, train_labels,
+                validation_data=(validation_data, validation_labels) if validation_data is not None else None,
+                epochs=epochs,
+                batch_size=batch_size,
+                callbacks=callbacks
+            )
         return history
     
     def evaluate(self, test_data, test_labels):
@@ -50,7 +109,20 @@ class MedicalImageClassifier:
     
     def predict(self, data):
         """Make predictions on new data"""
-        return self.model.predict(data)
+        # Keras predict() sets up a full data pipeline per call; for the small
+        # batches the API serves, calling the model directly is much cheaper
+        if len(data) <= 32:
+            return self.model(data, training=False).numpy()
+        return self.model.predict(data, verbose=0)
+    
+    def predict_images(self, images, executor=None):
+        """Preprocess encoded images (optionally in parallel) and predict on them
+        
+        Returns (predictions, errors); rows whose image failed to decode
+        have an error message and should be ignored.
+        """
+        batch, errors = self.preprocessor.preprocess_batch(images, executor=executor)
+        return self.predict(batch), errors
     
     def save(self, filepath):
         """Save the model to the given filepath"""
@@ -61,4 +133,217 @@ class MedicalImageClassifier:
         """Load a model from the given filepath"""
         instance = cls()
         instance.model = tf.keras.models.load_model(filepath)
-        return instance 
\ No newline at end of file
+        return instance
+    
+    def export(self, output_dir, formats=("savedmodel", "tflite"), representative_data=None,
+               skip_unavailable=False):
+        """Export serving artifacts and a manifest describing them
+        
+        Args:
+            output_dir (str): Directory to write the artifacts to
+            formats (tuple): Any of SERVING_FORMATS. "tflite_int8" applies int8
+                post-training quantization; "onnx" requires tf2onnx.
+            representative_data (np.ndarray): Sample inputs used to calibrate
+                int8 quantization; required for "tflite_int8"
+            skip_unavailable (bool): Skip formats whose converter isn't
+                installed instead of raising ImportError
+            
+        Returns:
+            dict: The manifest, also written to output_dir/manifest.json
+        """
+        if "tflite_int8" in formats and representative_data is None:
+            raise ValueError("tflite_int8 needs representative_data to calibrate quantization")
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = {
+            "input_shape": list(self.input_shape),
+            "num_classes": self.num_classes,
+            "formats": {}
+        }
+        
+        # A concrete function with a fixed signature avoids retracing at serve time
+        signature = tf.TensorSpec([None, *self.input_shape], tf.float32, name="image")
+        serve = tf.function(lambda image: self.model(image, training=False), input_signature=[signature])
+        
+        for fmt in formats:
+            if fmt not in SERVING_FORMATS:
+                raise ValueError(f"Unknown serving format '{fmt}', expected one of {SERVING_FORMATS}")
+            
+            if fmt == "savedmodel":
+                path = "saved_model"
+                module = tf.Module()
+                # Attached so the SavedModel tracks (and saves) the model's variables
+                module.model = self.model
+                module.serve = serve
+                tf.saved_model.save(module, os.path.join(output_dir, path), signatures={"serving_default": serve})
+            elif fmt in ("tflite", "tflite_int8"):
+                path = f"model{'_int8' if fmt == 'tflite_int8' else ''}.tflite"
+                converter = tf.lite.TFLiteConverter.from_concrete_functions(
+                    [serve.get_concrete_function()], self.model
+                )
+                if fmt == "tflite_int8":
+                    samples = representative_data
+                    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                    converter.representative_dataset = lambda: (
+                        [samples[i:i + 1].astype(np.float32)] for i in range(min(len(samples), 200))
+                    )
+                with open(os.path.join(output_dir, path), "wb") as f:
+                    f.write(converter.convert())
+            else:
+                try:
+                    import tf2onnx
+                except ImportError:
+                    if not skip_unavailable:
+                        raise
+                    print("Skipping onnx export: tf2onnx is not installed")
+                    continue
+                path = "model.onnx"
+                tf2onnx.convert.from_function(
+                    serve, input_signature=[signature], opset=13,
+                    output_path=os.path.join(output_dir, path)
+                )
+            
+            manifest["formats"][fmt] = {"path": path, "size_bytes": _artifact_size(os.path.join(output_dir, path))}
+        
+        write_serving_manifest(output_dir, manifest)
+        return manifest
+
+
+def _artifact_size(path):
+    """Return the on-disk size of a file or directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def read_serving_manifest(directory):
+    with open(os.path.join(directory, SERVING_MANIFEST)) as f:
+        return json.load(f)
+
+
+def write_serving_manifest(directory, manifest):
+    with open(os.path.join(directory, SERVING_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+class SavedModelRuntime:
+    """Serve the exported concrete function directly, without Keras"""
+    
+    def __init__(self, path):
+        self._fn = tf.saved_model.load(path).signatures["serving_default"]
+    
+    def predict(self, data):
+        outputs = self._fn(tf.convert_to_tensor(data, dtype=tf.float32))
+        return next(iter(outputs.values())).numpy()
+
+
+class TFLiteRuntime:
+    """Serve a TFLite flatbuffer with the standalone runtime if installed"""
+    
+    def __init__(self, path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=path, num_threads=os.cpu_count())
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        # Interpreters aren't thread-safe
+        self._lock = threading.Lock()
+    
+    def predict(self, data):
+        data = np.asarray(data, dtype=np.float32)
+        with self._lock:
+            if self._batch_size != len(data):
+                self._interpreter.resize_tensor_input(self._input["index"], data.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(data)
+            self._interpreter.set_tensor(self._input["index"], data)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output["index"])
+
+
+class OnnxRuntime:
+    """Serve an ONNX export with onnxruntime on CPU"""
+    
+    def __init__(self, path):
+        import onnxruntime
+        self._session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+    
+    def predict(self, data):
+        return self._session.run(None, {self._input_name: np.asarray(data, dtype=np.float32)})[0]
+
+
+SERVING_RUNTIMES = {
+    "savedmodel": SavedModelRuntime,
+    "tflite": TFLiteRuntime,
+    "tflite_int8": TFLiteRuntime,
+    "onnx": OnnxRuntime,
+}
+
+
+def load_serving_model(directory, runtime=None):
+    """Load the fastest usable runtime for an exported model directory
+    
+    Formats are tried fastest first according to the latencies recorded in
+    the manifest by export_image_model.py, considering only formats that
+    passed the accuracy parity check on held-out data. Otherwise
+    DEFAULT_RUNTIME_PREFERENCE is used, which leaves out the quantized
+    format, so a format with unknown parity is never chosen for speed.
+    Formats that failed the check, and formats whose runtime isn't
+    installed, are skipped.
+    
+    Args:
+        directory (str): Directory written by MedicalImageClassifier.export
+        runtime (str): Force a specific format instead of choosing one
+        
+    Returns:
+        An object with a `predict(batch)` method and a `runtime` attribute
+    """
+    manifest = read_serving_manifest(directory)
+    formats = manifest["formats"]
+    
+    if runtime is not None:
+        candidates = [runtime]
+    else:
+        # parity_ok is None when parity was only checked on random inputs
+        verified = [
+            name for name, info in formats.items()
+            if info.get("latency_ms") is not None and info.get("parity_ok") is True
+        ]
+        if verified:
+            candidates = sorted(verified, key=lambda name: formats[name]["latency_ms"])
+        else:
+            candidates = [
+                name for name in DEFAULT_RUNTIME_PREFERENCE
+                if name in formats and formats[name].get("parity_ok") is not False
+            ]
+    
+    errors = {}
+    for name in candidates:
+        try:
+            model = SERVING_RUNTIMES[name](os.path.join(directory, formats[name]["path"]))
+        except Exception as e:
+            errors[name] = str(e)
+            continue
+        model.runtime = name
+        print(f"Serving image model with the {name} runtime")
+        return model
+    
+    raise RuntimeError(f"No usable serving runtime in {directory}: {errors}")
+
+
+def load_image_model(path, runtime=None):
+    """Load an image model saved with MedicalImageClassifier.save or exported for serving
+    
+    Directories written by export_image_model.py (with a manifest) are
+    served with the fastest exported runtime; anything else is loaded as a
+    Keras model.
+    """
+    if os.path.exists(os.path.join(path, SERVING_MANIFEST)):
+        return load_serving_model(path, runtime=runtime)
+    return MedicalImageClassifier.load(path)
@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+
+class ImagePreprocessor:
+    """Decode uploaded images straight into model-ready float32 arrays.
+
+    JPEGs are decoded with PIL's draft mode, which lets libjpeg scale by 1/2,
+    1/4 or 1/8 during decoding, so a multi-megapixel X-ray never has to be
+    fully materialized just to be resized to 224x224. Pixels are scaled to
+    [0, 1] directly into a caller-provided float32 buffer, avoiding the
+    float64 intermediate of `np.array(img) / 255.0`.
+    """
+
+    def __init__(self, size=(224, 224), dtype=np.float32):
+        self.size = tuple(size)
+        self.dtype = np.dtype(dtype)
+        self._scale = self.dtype.type(1.0 / 255.0)
+
+    @property
+    def shape(self):
+        """Shape of one preprocessed image (height, width, channels)"""
+        return (self.size[1], self.size[0], 3)
+
+    def decode(self, image_bytes):
+        """Decode and resize an image to `size`, returning an RGB PIL image
+
+        `image_bytes` may also be a binary file object, such as a spooled
+        upload, which is read without copying it into memory first.
+        """
+        source = image_bytes if hasattr(image_bytes, "read") else io.BytesIO(image_bytes)
+        img = Image.open(source)
+        if img.format == "JPEG":
+            # Decode at the smallest DCT scale that still covers the target size
+            img.draft("RGB", self.size)
+        img = img.convert("RGB")
+        if img.size != self.size:
+            img = img.resize(self.size)
+        return img
+
+    def preprocess(self, image_bytes, out=None):
+        """Preprocess one image, writing into `out` if given, and return the array"""
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        pixels = np.asarray(self.decode(image_bytes), dtype=np.uint8)
+        np.multiply(pixels, self._scale, out=out, casting="unsafe")
+        return out
+
+    def preprocess_batch(self, images, executor=None):
+        """Preprocess many images into one preallocated (n, h, w, 3) buffer
+
+        Args:
+            images (list): Encoded image bytes or binary file objects
+            executor: Optional concurrent.futures executor to decode in parallel
+
+        Returns:
+            tuple: (batch array, list of error messages or None per image).
+                Rows for images that failed to decode are left zeroed.
+        """
+        batch = np.zeros((len(images),) + self.shape, dtype=self.dtype)
+        errors = [None] * len(images)
+
+        def work(i):
+            try:
+                self.preprocess(images[i], out=batch[i])
+            except Exception as e:
+                batch[i] = 0
+                errors[i] = str(e)
+
+        if executor is None:
+            for i in range(len(images)):
+                work(i)
+        else:
+            list(executor.map(work, range(len(images))))
+        return batch, errors
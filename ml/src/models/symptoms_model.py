@@ -2,12 +2,96 @@ import numpy as np
 import pickle
 import os
 import json
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
-from scipy.special import softmax
+import hashlib
+import inspect
+import threading
+from models.batching import MicroBatcher
+from models.cascade import CascadePolicy, CascadeStats
+from models.catalogue import Catalogue, is_catalogue_file, write_catalogue
+from models.keyword_matcher import KeywordMatcher
+from models.inference_profile import InferenceProfile
+from models.embedding_index import EMBEDDING_MODEL, index_path_for
+from metrics import stage
+
+# Available zero-shot inference engines
+ENGINES = ("pipeline", "embedding")
+
+def _time_pipeline_stages(classifier):
+    """Report the zero-shot pipeline's tokenization and forward pass as request stages
+    
+    Wraps the pipeline's public `preprocess` and `forward` steps; returns
+    False, leaving the pipeline untimed, if it doesn't have them.
+    """
+    preprocess = getattr(classifier, "preprocess", None)
+    forward = getattr(classifier, "forward", None)
+    if not callable(preprocess) or not callable(forward):
+        return False
+    
+    def timed_preprocess(*args, **kwargs):
+        with stage("tokenization"):
+            inputs = preprocess(*args, **kwargs)
+        # The zero-shot pipeline tokenizes lazily, one candidate label at a time
+        return _timed_items(inputs, "tokenization") if inspect.isgenerator(inputs) else inputs
+    
+    def timed_forward(*args, **kwargs):
+        with stage("model_forward"):
+            return forward(*args, **kwargs)
+    
+    classifier.preprocess = timed_preprocess
+    classifier.forward = timed_forward
+    return True
+
+def _timed_items(items, name):
+    """Yield from a generator, timing the work done to produce each item"""
+    while True:
+        with stage(name):
+            item = next(items, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return
+        yield item
+
+_EXHAUSTED = object()
 
 class SymptomAnalyzer:
-    def __init__(self, model_path=None, clinical_model="emilyalsentzer/Bio_ClinicalBERT"):
+    def __init__(self, model_path=None, clinical_model="emilyalsentzer/Bio_ClinicalBERT", engine="pipeline",
+                 lazy=False, profile=None, embedding_model=EMBEDDING_MODEL, rerank_top=0, cascade=None,
+                 max_pairs_per_forward=256):
+        """
+        Args:
+            model_path (str): Optional saved configuration to load
+            clinical_model (str): Name of the clinical language model
+            engine (str): Zero-shot inference engine, one of ENGINES
+            profile (InferenceProfile or str): Checkpoint, quantization and
+                threading for the classifier; defaults to full-precision BART
+            lazy (bool): Skip loading the classifier; call `load_classifier` later.
+                Until then `analyze` falls back to keyword matching.
+            embedding_model (str): Sentence encoder for the "embedding" engine
+            rerank_top (int): With the "embedding" engine, re-rank this many of
+                the best candidates with the NLI model (0 disables re-ranking)
+            cascade (CascadePolicy): When keyword matching may answer without
+                the classifier; by default the classifier always runs
+            max_pairs_per_forward (int): Most premise/label pairs the classifier
+                runs in one forward pass, so large batches or catalogues are
+                split instead of padding one huge tensor
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        self.engine = engine
+        self.profile = InferenceProfile(profile) if isinstance(profile, str) else (profile or InferenceProfile())
+        self.embedding_model = embedding_model
+        self.rerank_top = rerank_top
+        self.max_pairs_per_forward = max_pairs_per_forward
+        self.cascade = cascade or CascadePolicy()
+        self._cascade_stats = CascadeStats()
+        # Vector index saved next to the loaded configuration, reused by the "embedding" engine
+        self.index_path = None
+        # File the catalogue was loaded from, and its identity, for hot reloads
+        self.catalogue_path = None
+        self._catalogue_file_id = None
+        self._label_list = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        
         self.conditions_info = {
             "Respiratory infection": {
                 "symptoms": ["cough", "fever", "shortness of breath", "sore throat", "runny nose"],
@@ -32,30 +116,109 @@ class SymptomAnalyzer:
         }
         
         self.labels = list(self.conditions_info.keys())
+        self.hypothesis_template = "This patient has {}"
+        self.clinical_model = clinical_model
+        self.classifier = None
+        self.batcher = None
+        self._refresh_catalogue()
         
         # If a custom model path is provided, load it
         if model_path and os.path.exists(model_path):
-            self.load(model_path)
+            self.load(model_path, build_classifier=not lazy)
+        elif not lazy:
+            self.load_classifier()
+    
+    def load_classifier(self):
+        """Load the pretrained zero-shot classifier"""
+        print(f"Loading ClinicalBERT model: {self.clinical_model}")
+        self._build_classifier()
+        if self.classifier is not None:
+            print("NLP classification model loaded successfully!")
+        return self.classifier is not None
+    
+    def _refresh_catalogue(self):
+        """Recompute derived state after `conditions_info` or `labels` change"""
+        mapped = isinstance(self.conditions_info, Catalogue)
+        
+        # Fingerprint of everything that affects a result, used to key caches
+        # (the cascade policy too, since it decides which stage answers)
+        if mapped and self.labels is self.conditions_info.labels:
+            # The file's content fingerprint covers conditions and labels without decoding them
+            catalogue = json.dumps(
+                [self.conditions_info.content_fingerprint, self.hypothesis_template, self.cascade.describe()]
+            )
         else:
-            # Load pretrained ClinicalBERT model
-            try:
-                print(f"Loading ClinicalBERT model: {clinical_model}")
+            catalogue = json.dumps(
+                [dict(self.conditions_info), list(self.labels), self.hypothesis_template, self.cascade.describe()],
+                sort_keys=True
+            )
+        self.catalogue_fingerprint = hashlib.sha256(catalogue.encode("utf-8")).hexdigest()
+        
+        # Compile the keyword index once rather than scanning every symptom per request;
+        # a mapped catalogue carries it prebuilt
+        if mapped:
+            self.keyword_matcher = self.conditions_info.keyword_matcher
+        else:
+            self.keyword_matcher = KeywordMatcher(self.conditions_info)
+    
+    def _build_classifier(self):
+        """Create the zero-shot classifier for the configured engine"""
+        try:
+            # Deferred so that importing this module doesn't pull in torch/transformers
+            import torch
+            from transformers import pipeline
+            
+            self.profile.apply_threading()
+            device = 0 if torch.cuda.is_available() else -1
+            if self.engine == "embedding":
+                from models.embedding_index import EmbeddingRetriever
+                reranker = None
+                if self.rerank_top:
+                    reranker = pipeline(
+                        "zero-shot-classification",
+                        model=self.profile.model_name,
+                        device=device
+                    )
+                    _time_pipeline_stages(reranker)
+                    if device < 0:
+                        reranker.model = self.profile.prepare(reranker.model)
+                classifier = EmbeddingRetriever(
+                    self.conditions_info,
+                    self.labels,
+                    model_name=self.embedding_model,
+                    device=device,
+                    reranker=reranker,
+                    rerank_top=self.rerank_top,
+                    index_path=self.index_path
+                )
+            else:
                 # For zero-shot classification, we'll use a classifier pipeline
-                self.classifier = pipeline(
+                classifier = pipeline(
                     "zero-shot-classification",
-                    model="facebook/bart-large-mnli",  # We use BART for zero-shot as ClinicalBERT isn't designed for this
-                    device=0 if torch.cuda.is_available() else -1
+                    model=self.profile.model_name,
+                    device=device
                 )
-                
-                print("NLP classification model loaded successfully!")
-            except Exception as e:
-                print(f"Error loading model: {str(e)}. Using fallback keyword matching only.")
-                self.classifier = None
+                _time_pipeline_stages(classifier)
+            
+            # Dynamic quantization only applies to CPU inference
+            if device < 0:
+                classifier.model = self.profile.prepare(classifier.model)
+            self.classifier = classifier
+        except Exception as e:
+            print(f"Error loading model: {str(e)}. Using fallback keyword matching only.")
+            self.classifier = None
+    
+    def engine_stats(self):
+        """Return the zero-shot engine serving requests"""
+        return {"engine": self.engine}
     
     def analyze(self, symptoms_text):
         """
         Analyze symptoms text using ClinicalBERT and return possible conditions
         
+        Keyword matching runs first; the classifier runs only if the cascade
+        policy finds the keyword answer indecisive.
+        
         Args:
             symptoms_text (str): Patient description of symptoms
             
@@ -63,64 +226,209 @@ class SymptomAnalyzer:
             dict: Analysis results with diagnosis, confidence, and recommendations
         """
         # Always start with keyword matching as a fallback
-        result = self._keyword_matching(symptoms_text)
+        result, ranked = self._keyword_pass(symptoms_text)
         
         # If classification model is available, use it for prediction
-        if self.classifier is not None:
+        if self.classifier is None:
+            outcome = "keyword_only"
+        elif self.cascade.keyword_decisive(ranked):
+            outcome = self._keyword_exit(result, ranked)
+        else:
             try:
                 # Use zero-shot classification to determine the most likely condition
-                hypothesis_template = "This patient has {}"
-                prediction = self.classifier(
-                    symptoms_text, 
-                    self.labels, 
-                    hypothesis_template=hypothesis_template,
-                    multi_label=False
-                )
-                
-                # Get the top prediction
-                top_label = prediction['labels'][0]
-                confidence = prediction['scores'][0] * 100
-                
-                # Update result if confidence is reasonable
-                if confidence > 40:  # Higher threshold for model predictions
-                    result["diagnosis"] = top_label
-                    result["confidence"] = confidence
-                    result["recommendation"] = self.conditions_info.get(top_label, {}).get(
-                        "recommendations", "Please consult with a doctor for a professional diagnosis."
-                    )
-                    result["model_used"] = "ClinicalBERT zero-shot classification"
-                    
-                    # Include other potential conditions
-                    result["differential_diagnosis"] = {
-                        label: score * 100 for label, score in 
-                        zip(prediction['labels'][1:4], prediction['scores'][1:4])
-                    }
-                
+                prediction = self._classify(symptoms_text)
+                outcome = "classifier" if self._apply_prediction(result, prediction) else "classifier_rejected"
             except Exception as e:
                 print(f"Model prediction failed: {str(e)}")
                 # Add error info to the result for debugging
                 result["model_error"] = str(e)
+                outcome = "classifier_error"
         
+        self._cascade_stats.record(outcome)
         return result
     
-    def _keyword_matching(self, symptoms_text):
-        """Fallback method using keyword matching"""
-        symptoms_lower = symptoms_text.lower()
-        max_matches = 0
-        best_condition = None
+    def analyze_batch(self, texts, batch_size=None):
+        """
+        Analyze many symptom texts with one classifier call
+        
+        Args:
+            texts (list): Patient descriptions of symptoms
+            batch_size (int): Premise/label pairs per forward pass; defaults to
+                all of them at once, up to `max_pairs_per_forward`
+            
+        Returns:
+            list: One analysis result per text, in input order
+        """
+        passes = [self._keyword_pass(text) for text in texts]
+        results = [result for result, _ in passes]
+        
+        if self.classifier is None:
+            self._cascade_stats.record("keyword_only", len(results))
+            return results
+        
+        # Only texts the keyword pass couldn't settle go to the classifier
+        pending = []
+        for i, (result, ranked) in enumerate(passes):
+            if self.cascade.keyword_decisive(ranked):
+                self._cascade_stats.record(self._keyword_exit(result, ranked))
+            else:
+                pending.append(i)
+        
+        if pending:
+            try:
+                predictions = self._classify_batch([texts[i] for i in pending], batch_size=batch_size)
+                for i, prediction in zip(pending, predictions):
+                    applied = self._apply_prediction(results[i], prediction)
+                    self._cascade_stats.record("classifier" if applied else "classifier_rejected")
+            except Exception as e:
+                print(f"Model prediction failed: {str(e)}")
+                for i in pending:
+                    results[i]["model_error"] = str(e)
+                self._cascade_stats.record("classifier_error", len(pending))
         
-        for condition, info in self.conditions_info.items():
-            matches = sum(1 for symptom in info["symptoms"] if symptom in symptoms_lower)
-            if matches > max_matches:
-                max_matches = matches
-                best_condition = condition
+        return results
+    
+    def _keyword_exit(self, result, ranked):
+        """Finish a keyword answer returned without the classifier"""
+        # Runner-up conditions, on the same scale as the keyword confidence
+        result["differential_diagnosis"] = {
+            condition: min(matches * 20, 90) for condition, matches in ranked[1:4]
+        }
+        return "keyword_exit"
+    
+    def _apply_prediction(self, result, prediction):
+        """Update a keyword matching result with a zero-shot prediction
         
+        Returns whether the prediction was confident enough to be used.
+        """
+        # Get the top prediction
+        top_label = prediction['labels'][0]
+        confidence = prediction['scores'][0] * 100
+        
+        # Update result if confidence is reasonable
+        if confidence <= self.cascade.classifier_min_confidence:
+            return False
+        result["diagnosis"] = top_label
+        result["confidence"] = confidence
+        result["recommendation"] = self.conditions_info.get(top_label, {}).get(
+            "recommendations", "Please consult with a doctor for a professional diagnosis."
+        )
+        result["model_used"] = self._model_description()
+        
+        # Include other potential conditions
+        result["differential_diagnosis"] = {
+            label: score * 100 for label, score in 
+            zip(prediction['labels'][1:4], prediction['scores'][1:4])
+        }
+        return True
+    
+    def set_cascade(self, policy):
+        """Switch the early-exit policy and start counting outcomes afresh"""
+        self.cascade = policy or CascadePolicy()
+        self._cascade_stats.reset()
+        self._refresh_catalogue()
+    
+    def cascade_stats(self):
+        """Return the cascade policy and how often each stage answered"""
+        return {"policy": self.cascade.describe(), **self._cascade_stats.snapshot()}
+    
+    def _model_description(self):
+        if self.engine != "embedding":
+            return "ClinicalBERT zero-shot classification"
+        if self.rerank_top:
+            return "embedding retrieval with NLI re-ranking"
+        return "embedding retrieval"
+    
+    def enable_batching(self, max_batch_size=16, max_wait_ms=10):
+        """Route classifier calls through a micro-batching queue
+        
+        Concurrent calls to `analyze` are gathered into one padded batch over
+        all premise x label pairs, trading up to `max_wait_ms` of latency for
+        throughput.
+        """
+        self.disable_batching()
+        if self.classifier is None:
+            return
+        self.batcher = MicroBatcher(
+            self._classify_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="symptoms-batcher"
+        )
+    
+    def disable_batching(self):
+        """Stop the batching queue and fall back to per-request inference"""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+    
+    def batching_stats(self):
+        """Return batching queue metrics, or None if batching is disabled"""
+        return self.batcher.stats() if self.batcher is not None else None
+    
+    def _candidate_labels(self):
+        """The labels as a list for the classifier, decoded once per catalogue"""
+        labels = self.labels
+        if isinstance(labels, list):
+            return labels
+        cached = self._label_list
+        if cached is None or cached[0] is not labels:
+            cached = self._label_list = (labels, list(labels))
+        return cached[1]
+    
+    def _classify(self, symptoms_text):
+        """Run zero-shot classification for a single text"""
+        if self.batcher is not None:
+            return self.batcher(symptoms_text)
+        with self.profile.inference_context():
+            return self.classifier(
+                symptoms_text,
+                self._candidate_labels(),
+                hypothesis_template=self.hypothesis_template,
+                multi_label=False
+            )
+    
+    def _classify_batch(self, texts, batch_size=None):
+        """Run zero-shot classification for several texts in padded batches"""
+        with self.profile.inference_context():
+            predictions = self.classifier(
+                list(texts),
+                self._candidate_labels(),
+                hypothesis_template=self.hypothesis_template,
+                multi_label=False,
+                batch_size=min(batch_size or len(texts) * len(self.labels), self.max_pairs_per_forward)
+            )
+        # The pipeline unwraps single-item inputs
+        if isinstance(predictions, dict):
+            predictions = [predictions]
+        return predictions
+    
+    def _keyword_matching(self, symptoms_text):
+        """Fallback method using keyword matching"""
+        return self._keyword_pass(symptoms_text)[0]
+    
+    def _keyword_pass(self, symptoms_text):
+        """Keyword matching result plus the best few (condition, matches), for the cascade"""
+        with stage("keyword_matching"):
+            ranked = self.keyword_matcher.ranked(symptoms_text, limit=4)
+        best_condition, max_matches = ranked[0] if ranked else (None, 0)
+        return self._keyword_result(best_condition, max_matches), ranked
+    
+    def keyword_matching_batch(self, texts):
+        """Run keyword matching over many texts, returning one result per text"""
+        return [self._keyword_matching(text) for text in texts]
+    
+    def _keyword_result(self, best_condition, max_matches):
+        """Build the keyword matching result for the best-matching condition"""
         if best_condition and max_matches > 0:
             confidence = min(max_matches * 20, 90)  # Scale confidence based on matches
             return {
                 "diagnosis": best_condition,
                 "confidence": confidence,
-                "recommendation": self.conditions_info[best_condition]["recommendations"],
+                # .get: the catalogue may have been reloaded since matching
+                "recommendation": self.conditions_info.get(best_condition, {}).get(
+                    "recommendations", "Please consult with a doctor for a professional diagnosis."
+                ),
                 "model_used": "keyword matching"
             }
         
@@ -132,37 +440,103 @@ class SymptomAnalyzer:
         }
     
     def save(self, filepath):
-        """Save the model configuration to the given filepath"""
-        # We only save the class configuration, not the model itself
-        config = {
-            "conditions_info": self.conditions_info,
-            "labels": self.labels
-        }
+        """Save the condition catalogue to the given filepath
+        
+        Writes the memory-mapped format of models.catalogue; the classifier
+        itself is not saved. The file is replaced atomically, so running
+        services can hot-reload it.
+        """
+        write_catalogue(filepath, self.conditions_info, self.labels)
         
-        with open(filepath, 'wb') as f:
-            pickle.dump(config, f)
+        # The embedding engine's condition vectors go alongside, so loading skips re-embedding
+        index = getattr(self.classifier, "index", None)
+        if index is not None:
+            self.index_path = index_path_for(filepath)
+            index.save(self.index_path)
     
-    def load(self, filepath):
-        """Load the model configuration from the given filepath"""
-        with open(filepath, 'rb') as f:
-            config = pickle.load(f)
-            
-        if isinstance(config, dict):
-            # Load configuration
-            self.conditions_info = config.get("conditions_info", self.conditions_info)
-            self.labels = config.get("labels", list(self.conditions_info.keys()))
-            
-            # Initialize the model
-            try:
-                self.classifier = pipeline(
-                    "zero-shot-classification",
-                    model="facebook/bart-large-mnli",
-                    device=0 if torch.cuda.is_available() else -1
-                )
-            except Exception as e:
-                print(f"Error loading model: {str(e)}. Using fallback keyword matching only.")
-                self.classifier = None
-        else:
+    def load(self, filepath, build_classifier=True):
+        """Load the condition catalogue from the given filepath
+        
+        Reads the memory-mapped catalogue format, or a legacy pickled
+        configuration. An already loaded classifier is kept and serves the
+        new catalogue; otherwise one is built if `build_classifier` is set.
+        """
+        if not self._load_catalogue(filepath):
             # For backward compatibility with old files
             print("Warning: Loading from an old format file. Some features may not work.")
-            self.classifier = None
\ No newline at end of file
+            self.classifier = None
+            return
+        
+        if self.classifier is None and build_classifier:
+            self._build_classifier()
+    
+    def _load_catalogue(self, filepath):
+        """Read a catalogue file and switch to it; False for an unrecognised old file"""
+        stat = os.stat(filepath)
+        if is_catalogue_file(filepath):
+            conditions_info = Catalogue(filepath)
+            labels = conditions_info.labels
+            file_id = conditions_info.file_id
+        else:
+            with open(filepath, 'rb') as f:
+                config = pickle.load(f)
+            if not isinstance(config, dict):
+                return False
+            conditions_info = config.get("conditions_info", self.conditions_info)
+            labels = config.get("labels", list(conditions_info.keys()))
+            file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        
+        # Re-embed before switching, so the retriever never sees a mismatched catalogue
+        index_path = index_path_for(filepath)
+        index = None
+        if hasattr(self.classifier, "build_index"):
+            index = self.classifier.build_index(conditions_info, labels, index_path)
+        
+        self.conditions_info = conditions_info
+        self.labels = labels
+        self.index_path = index_path
+        self.catalogue_path = filepath
+        self._catalogue_file_id = file_id
+        self._refresh_catalogue()
+        if index is not None:
+            self.classifier.use_index(index)
+        return True
+    
+    def reload_catalogue(self, filepath=None, force=False):
+        """Hot-reload the catalogue file if it changed, keeping the classifier
+        
+        Returns True if a new catalogue was loaded. Requests in flight keep
+        using the catalogue they started with.
+        """
+        filepath = filepath or self.catalogue_path
+        if not filepath:
+            return False
+        with self._reload_lock:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                return False
+            file_id = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if not force and filepath == self.catalogue_path and file_id == self._catalogue_file_id:
+                return False
+            try:
+                if not self._load_catalogue(filepath):
+                    return False
+            except Exception as e:
+                print(f"Could not reload catalogue {filepath}: {str(e)}")
+                return False
+        print(f"Reloaded condition catalogue from {filepath} ({len(self.labels)} labels)")
+        return True
+    
+    def watch_catalogue(self, interval=10.0):
+        """Check the catalogue file every `interval` seconds and reload it when it changes"""
+        if self._watcher is not None or interval <= 0:
+            return
+        stop = threading.Event()
+        
+        def watch():
+            while not stop.wait(interval):
+                self.reload_catalogue()
+        
+        self._watcher = stop
+        threading.Thread(target=watch, name="catalogue-watcher", daemon=True).start()
@@ -0,0 +1,214 @@
+"""Streaming tf.data input pipelines for training the image classifier.
+
+Images are read from disk as they are needed rather than materialized as
+one float array, so memory use depends on the batch and buffer sizes, not
+on the size of the dataset. Two sources are supported:
+
+- a directory with one subdirectory of images per class
+  (`train/Pneumonia/*.jpg`, `train/Normal/*.jpg`, ...)
+- sharded TFRecord files written by `write_tfrecord_shards`, holding the
+  original encoded bytes and the class index, which read sequentially and
+  are cheaper to open than many small files on network storage
+
+Decoding matches ImagePreprocessor: JPEGs are decoded at the smallest
+libjpeg scale that still covers the target size, resized and scaled to
+[0, 1] float32.
+"""
+import glob
+import math
+import os
+import random
+
+import tensorflow as tf
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+_RECORD_FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "label": tf.io.FixedLenFeature([], tf.int64),
+}
+
+
+def list_labelled_images(directory, class_names=None):
+    """Return (paths, labels, class_names) for a directory of per-class subdirectories
+
+    Labels index into `class_names`, which defaults to the sorted
+    subdirectory names. Pass it explicitly to match a model's class order.
+    """
+    if class_names is None:
+        class_names = sorted(
+            name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))
+        )
+    paths, labels = [], []
+    for label, name in enumerate(class_names):
+        class_dir = os.path.join(directory, name)
+        if not os.path.isdir(class_dir):
+            continue
+        for root, _, files in os.walk(class_dir):
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, filename))
+                    labels.append(label)
+    if not paths:
+        raise ValueError(f"No images found under {directory}")
+    return paths, labels, list(class_names)
+
+
+def write_tfrecord_shards(directory, output_prefix, num_shards=16, class_names=None, seed=0):
+    """Pack a per-class image directory into `num_shards` TFRecord files
+
+    Images are shuffled across shards so each shard holds a mix of classes,
+    and stored as their original encoded bytes. Returns the shard paths.
+    """
+    paths, labels, _ = list_labelled_images(directory, class_names)
+    items = list(zip(paths, labels))
+    random.Random(seed).shuffle(items)
+
+    os.makedirs(os.path.dirname(output_prefix) or ".", exist_ok=True)
+    per_shard = math.ceil(len(items) / num_shards)
+    shard_paths = []
+    for shard in range(num_shards):
+        chunk = items[shard * per_shard:(shard + 1) * per_shard]
+        if not chunk:
+            break
+        shard_path = f"{output_prefix}-{shard:05d}-of-{num_shards:05d}.tfrecord"
+        with tf.io.TFRecordWriter(shard_path) as writer:
+            for path, label in chunk:
+                with open(path, "rb") as f:
+                    encoded = f.read()
+                example = tf.train.Example(features=tf.train.Features(feature={
+                    "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[encoded])),
+                    "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+                }))
+                writer.write(example.SerializeToString())
+        shard_paths.append(shard_path)
+    return shard_paths
+
+
+def _decode_resized(encoded, size):
+    """Decode an encoded image to a (height, width, 3) uint8 tensor of `size` (width, height)"""
+    width, height = size
+
+    def decode_jpeg():
+        shape = tf.image.extract_jpeg_shape(encoded)
+        # Like PIL's draft mode: let libjpeg downscale by 1/8, 1/4 or 1/2 while decoding
+        smallest = tf.minimum(shape[0] // height, shape[1] // width)
+        branches = [
+            (smallest >= ratio, lambda ratio=ratio: tf.io.decode_jpeg(encoded, channels=3, ratio=ratio))
+            for ratio in (8, 4, 2)
+        ]
+        return tf.case(branches, default=lambda: tf.io.decode_jpeg(encoded, channels=3))
+
+    def decode_other():
+        return tf.io.decode_image(encoded, channels=3, expand_animations=False)
+
+    image = tf.cond(tf.io.is_jpeg(encoded), decode_jpeg, decode_other)
+    image.set_shape([None, None, 3])
+    image = tf.image.resize(image, (height, width), antialias=True)
+    # Kept as uint8 until after caching: a quarter of the memory of float32
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+
+
+def _augment_batch(images, flip):
+    """Random per-image brightness, contrast and optional horizontal flip on a float batch"""
+    batch = tf.shape(images)[0]
+    brightness = tf.random.uniform([batch, 1, 1, 1], -0.1, 0.1)
+    contrast = tf.random.uniform([batch, 1, 1, 1], 0.9, 1.1)
+    mean = tf.reduce_mean(images, axis=[1, 2, 3], keepdims=True)
+    images = (images - mean) * contrast + mean + brightness
+    if flip:
+        flipped = tf.random.uniform([batch, 1, 1, 1]) < 0.5
+        images = tf.where(flipped, tf.reverse(images, axis=[2]), images)
+    return tf.clip_by_value(images, 0.0, 1.0)
+
+
+def image_dataset(source, num_classes, image_size=(224, 224), batch_size=32, shuffle=True,
+                  augment=False, flip=False, cache=None, shuffle_buffer=1024, class_names=None,
+                  threads=None, seed=None):
+    """Build a batched, prefetched dataset of (images, one-hot labels)
+
+    Args:
+        source (str or list): Directory of per-class subdirectories, or a
+            glob pattern / list of TFRecord shards from write_tfrecord_shards
+        num_classes (int): Length of the one-hot labels
+        image_size (tuple): (width, height) to resize images to
+        batch_size (int): Images per batch; the last batch may be smaller
+        shuffle (bool): Reshuffle every epoch (use False for validation)
+        augment (bool): Random brightness/contrast, applied per batch
+        flip (bool): With `augment`, also flip images horizontally at random
+        cache (str): None, "memory", or a file path prefix. Decoded, resized
+            uint8 images are cached after the first epoch, so later epochs
+            skip reading and decoding. With `shuffle`, the cache holds one
+            full shuffle of the source and is reshuffled each epoch through
+            `shuffle_buffer`.
+        shuffle_buffer (int): Examples held for shuffling after a cache or
+            when reading shards
+        class_names (list): Subdirectory order for a directory source
+        threads (int): Size of a private thread pool for the pipeline;
+            defaults to TensorFlow's shared pool
+        seed (int): Shuffle seed
+    """
+    autotune = tf.data.AUTOTUNE
+    records = not (isinstance(source, str) and os.path.isdir(source))
+    # A cache is filled from the source once, so shuffling before it happens
+    # once, with a fixed seed; the shuffle after the cache varies per epoch
+    reshuffle = not cache
+    source_seed = 0 if cache and seed is None else seed
+
+    if records:
+        shards = sorted(glob.glob(source)) if isinstance(source, str) else list(source)
+        if not shards:
+            raise ValueError(f"No TFRecord shards match {source}")
+        dataset = tf.data.Dataset.from_tensor_slices(shards)
+        if shuffle:
+            dataset = dataset.shuffle(len(shards), seed=source_seed, reshuffle_each_iteration=reshuffle)
+        # Read several shards at once so one slow file doesn't stall the pipeline
+        dataset = dataset.interleave(
+            tf.data.TFRecordDataset,
+            cycle_length=min(len(shards), 8),
+            num_parallel_calls=autotune,
+            deterministic=not shuffle
+        )
+        if shuffle:
+            # Encoded bytes are small, so shuffling before decoding is cheap
+            dataset = dataset.shuffle(shuffle_buffer, seed=source_seed, reshuffle_each_iteration=reshuffle)
+
+        def load(serialized):
+            example = tf.io.parse_single_example(serialized, _RECORD_FEATURES)
+            return _decode_resized(example["image"], image_size), tf.cast(example["label"], tf.int32)
+    else:
+        paths, labels, _ = list_labelled_images(source, class_names)
+        dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+        if shuffle:
+            # Shuffling file names rather than images gives a full shuffle for almost no memory
+            dataset = dataset.shuffle(len(paths), seed=source_seed, reshuffle_each_iteration=reshuffle)
+
+        def load(path, label):
+            return _decode_resized(tf.io.read_file(path), image_size), label
+
+    dataset = dataset.map(load, num_parallel_calls=autotune, deterministic=not shuffle)
+    # Skip unreadable images instead of failing the epoch
+    dataset = dataset.ignore_errors()
+
+    if cache:
+        dataset = dataset.cache("" if cache == "memory" else cache)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size, num_parallel_calls=autotune, deterministic=not shuffle)
+
+    def finish(images, labels):
+        images = tf.cast(images, tf.float32) * (1.0 / 255.0)
+        if augment:
+            images = _augment_batch(images, flip)
+        return images, tf.one_hot(labels, num_classes)
+
+    # Converting and augmenting whole batches vectorizes the work
+    dataset = dataset.map(finish, num_parallel_calls=autotune, deterministic=not shuffle)
+    dataset = dataset.prefetch(autotune)
+
+    options = tf.data.Options()
+    options.deterministic = not shuffle
+    if threads:
+        options.threading.private_threadpool_size = threads
+    return dataset.with_options(options)
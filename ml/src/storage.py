@@ -0,0 +1,395 @@
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import weakref
+
+
+class DiagnosisStore:
+    """Storage backend interface for diagnosis records.
+
+    Diagnoses are the JSON-serializable dicts built by the API. Listing is
+    newest first: by `diagnosisDate`, then by insertion order within a day.
+    """
+
+    def create(self, diagnosis):
+        """Store a new diagnosis"""
+        raise NotImplementedError
+
+    def create_many(self, diagnoses):
+        """Store several diagnoses at once"""
+        for diagnosis in diagnoses:
+            self.create(diagnosis)
+
+    def save(self, diagnosis):
+        """Store a diagnosis, replacing any existing one with the same id
+
+        A replaced diagnosis keeps its position in the listing order.
+        """
+        raise NotImplementedError
+
+    def delete(self, diagnosis_id):
+        """Remove a diagnosis if it exists"""
+        raise NotImplementedError
+
+    def get(self, diagnosis_id):
+        """Return a diagnosis by id, or None if it doesn't exist"""
+        raise NotImplementedError
+
+    def scan(self, status=None, type=None, date_from=None, date_to=None, after=None, limit=100, offset=0):
+        """Yield (sort key, diagnosis JSON text) newest first
+
+        Args:
+            status (str): Only diagnoses with this status
+            type (str): Only diagnoses of this type, e.g. "Symptom Analysis"
+            date_from (str): Earliest `diagnosisDate` (YYYY-MM-DD), inclusive
+            date_to (str): Latest `diagnosisDate` (YYYY-MM-DD), inclusive
+            after (tuple): Sort key of the last diagnosis already seen; only
+                older diagnoses are returned
+            limit (int): Maximum number of diagnoses
+            offset (int): Number of matching diagnoses to skip
+        """
+        raise NotImplementedError
+
+    def count(self, status=None, type=None, date_from=None, date_to=None):
+        """Return the number of diagnoses matching the filters"""
+        raise NotImplementedError
+
+    def revision(self):
+        """Return a number that changes whenever any diagnosis is written"""
+        raise NotImplementedError
+
+    def list(self, status=None, type=None, date_from=None, date_to=None, limit=100, offset=0):
+        """Return (diagnoses, total matching) for one page of filtered results"""
+        filters = {"status": status, "type": type, "date_from": date_from, "date_to": date_to}
+        diagnoses = [json.loads(data) for _, data in self.scan(limit=limit, offset=offset, **filters)]
+        return diagnoses, self.count(**filters)
+
+    def close(self):
+        pass
+
+
+class MemoryDiagnosisStore(DiagnosisStore):
+    """Process-local store; contents are lost on restart"""
+
+    def __init__(self):
+        self._diagnoses = {}
+        self._keys = {}
+        self._revision = 0
+        self._lock = threading.Lock()
+
+    def create(self, diagnosis):
+        with self._lock:
+            self._revision += 1
+            self._keys[diagnosis["id"]] = (diagnosis["diagnosisDate"], self._revision)
+            self._diagnoses[diagnosis["id"]] = diagnosis
+
+    def save(self, diagnosis):
+        with self._lock:
+            self._revision += 1
+            _, seq = self._keys.get(diagnosis["id"], (None, self._revision))
+            self._keys[diagnosis["id"]] = (diagnosis["diagnosisDate"], seq)
+            self._diagnoses[diagnosis["id"]] = diagnosis
+
+    def delete(self, diagnosis_id):
+        with self._lock:
+            if self._diagnoses.pop(diagnosis_id, None) is not None:
+                del self._keys[diagnosis_id]
+                self._revision += 1
+
+    def get(self, diagnosis_id):
+        return self._diagnoses.get(diagnosis_id)
+
+    def _matching(self, status, type, date_from, date_to):
+        """Return [(sort key, diagnosis)] for matching diagnoses, oldest first"""
+        with self._lock:
+            matching = [
+                (self._keys[d["id"]], d) for d in self._diagnoses.values()
+                if (status is None or d["status"] == status)
+                and (type is None or d["type"] == type)
+                and (date_from is None or d["diagnosisDate"] >= date_from)
+                and (date_to is None or d["diagnosisDate"] <= date_to)
+            ]
+        matching.sort(key=lambda item: item[0])
+        return matching
+
+    def scan(self, status=None, type=None, date_from=None, date_to=None, after=None, limit=100, offset=0):
+        matching = self._matching(status, type, date_from, date_to)
+        end = len(matching) if after is None else bisect.bisect_left(matching, tuple(after), key=lambda item: item[0])
+        end -= offset
+        for i in range(end - 1, max(end - limit, 0) - 1, -1):
+            key, diagnosis = matching[i]
+            yield key, json.dumps(diagnosis)
+
+    def count(self, status=None, type=None, date_from=None, date_to=None):
+        return len(self._matching(status, type, date_from, date_to))
+
+    def revision(self):
+        return self._revision
+
+
+class SQLiteDiagnosisStore(DiagnosisStore):
+    """Embedded SQLite store shared by every worker on the host.
+
+    The database runs in WAL mode so readers never block the writer. Each
+    thread keeps its own connection, reopened after a fork, so gunicorn
+    workers don't share sockets or file handles. Per-(status, type) counts
+    and a global revision number are maintained by triggers, so totals and
+    ETags don't require a table scan.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS diagnoses (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            diagnosis_date TEXT NOT NULL,
+            status TEXT NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_diagnoses_date ON diagnoses (diagnosis_date, seq);
+        CREATE INDEX IF NOT EXISTS idx_diagnoses_status ON diagnoses (status, diagnosis_date, seq);
+        CREATE INDEX IF NOT EXISTS idx_diagnoses_type ON diagnoses (type, diagnosis_date, seq);
+
+        CREATE TABLE IF NOT EXISTS diagnosis_counts (
+            status TEXT NOT NULL,
+            type TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (status, type)
+        );
+        CREATE TRIGGER IF NOT EXISTS diagnoses_count_insert AFTER INSERT ON diagnoses BEGIN
+            INSERT INTO diagnosis_counts (status, type, total) VALUES (NEW.status, NEW.type, 1)
+                ON CONFLICT (status, type) DO UPDATE SET total = total + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diagnoses_count_delete AFTER DELETE ON diagnoses BEGIN
+            UPDATE diagnosis_counts SET total = total - 1
+                WHERE status = OLD.status AND type = OLD.type;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diagnoses_count_update AFTER UPDATE OF status, type ON diagnoses BEGIN
+            UPDATE diagnosis_counts SET total = total - 1
+                WHERE status = OLD.status AND type = OLD.type;
+            INSERT INTO diagnosis_counts (status, type, total) VALUES (NEW.status, NEW.type, 1)
+                ON CONFLICT (status, type) DO UPDATE SET total = total + 1;
+        END;
+
+        CREATE TABLE IF NOT EXISTS store_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO store_revision (id, revision) VALUES (1, 0);
+        CREATE TRIGGER IF NOT EXISTS diagnoses_revision_insert AFTER INSERT ON diagnoses BEGIN
+            UPDATE store_revision SET revision = revision + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diagnoses_revision_update AFTER UPDATE ON diagnoses BEGIN
+            UPDATE store_revision SET revision = revision + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS diagnoses_revision_delete AFTER DELETE ON diagnoses BEGIN
+            UPDATE store_revision SET revision = revision + 1 WHERE id = 1;
+        END;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection, opening one if needed
+
+        The connection is closed when its thread exits, so servers that
+        start a thread per request don't accumulate open connections.
+        """
+        holder = getattr(self._local, "holder", None)
+        if holder is not None:
+            if holder.pid == os.getpid():
+                return holder.conn
+            # Inherited through fork: the parent still owns that connection
+            holder.finalizer.detach()
+
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        holder = _ConnectionHolder(conn)
+        # Thread-local values are dropped when their thread exits, which frees the holder
+        holder.finalizer = weakref.finalize(holder, _close_connection, conn, self._connections, self._lock)
+        with self._lock:
+            self._connections.add(conn)
+        self._local.holder = holder
+        return conn
+
+    @staticmethod
+    def _row(diagnosis):
+        return (
+            diagnosis["id"],
+            diagnosis["diagnosisDate"],
+            diagnosis["status"],
+            diagnosis["type"],
+            json.dumps(diagnosis)
+        )
+
+    def create(self, diagnosis):
+        self._connection().execute(
+            "INSERT INTO diagnoses (id, diagnosis_date, status, type, data) VALUES (?, ?, ?, ?, ?)",
+            self._row(diagnosis)
+        )
+
+    def create_many(self, diagnoses):
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO diagnoses (id, diagnosis_date, status, type, data) VALUES (?, ?, ?, ?, ?)",
+                (self._row(diagnosis) for diagnosis in diagnoses)
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def save(self, diagnosis):
+        # Updating in place keeps the row's seq, and with it the listing order
+        self._connection().execute(
+            "INSERT INTO diagnoses (id, diagnosis_date, status, type, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET diagnosis_date = excluded.diagnosis_date, "
+            "status = excluded.status, type = excluded.type, data = excluded.data",
+            self._row(diagnosis)
+        )
+
+    def delete(self, diagnosis_id):
+        self._connection().execute("DELETE FROM diagnoses WHERE id = ?", (diagnosis_id,))
+
+    def get(self, diagnosis_id):
+        row = self._connection().execute(
+            "SELECT data FROM diagnoses WHERE id = ?", (diagnosis_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _where(status, type, date_from, date_to, after=None):
+        clauses, params = [], []
+        for clause, value in (
+            ("status = ?", status),
+            ("type = ?", type),
+            ("diagnosis_date >= ?", date_from),
+            ("diagnosis_date <= ?", date_to),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if after is not None:
+            # Keyset pagination: rows strictly older than the cursor, served by the (date, seq) indexes
+            clauses.append("(diagnosis_date, seq) < (?, ?)")
+            params.extend(after)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def scan(self, status=None, type=None, date_from=None, date_to=None, after=None, limit=100, offset=0):
+        where, params = self._where(status, type, date_from, date_to, after)
+        rows = self._connection().execute(
+            f"SELECT diagnosis_date, seq, data FROM diagnoses{where} "
+            f"ORDER BY diagnosis_date DESC, seq DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        # Rows are fetched from SQLite as they're consumed
+        for diagnosis_date, seq, data in rows:
+            yield (diagnosis_date, seq), data
+
+    def count(self, status=None, type=None, date_from=None, date_to=None):
+        conn = self._connection()
+        if date_from is None and date_to is None:
+            where, params = self._where(status, type, None, None)
+            row = conn.execute(f"SELECT COALESCE(SUM(total), 0) FROM diagnosis_counts{where}", params).fetchone()
+        else:
+            where, params = self._where(status, type, date_from, date_to)
+            row = conn.execute(f"SELECT COUNT(*) FROM diagnoses{where}", params).fetchone()
+        return row[0]
+
+    def revision(self):
+        return self._connection().execute("SELECT revision FROM store_revision WHERE id = 1").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class _ConnectionHolder:
+    """One thread's connection to a SQLiteDiagnosisStore"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        self.finalizer = None
+
+
+def _close_connection(conn, connections, lock):
+    with lock:
+        connections.discard(conn)
+    conn.close()
+
+
+def create_store(location):
+    """Create a diagnosis store: ":memory:" for the in-process dict, otherwise a SQLite file path"""
+    if location == ":memory:":
+        return MemoryDiagnosisStore()
+    return SQLiteDiagnosisStore(location)
+
+
+def encode_cursor(key):
+    """Encode a sort key as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor, raising ValueError if it is malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        diagnosis_date, seq = key
+        if not isinstance(diagnosis_date, str) or not isinstance(seq, int):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return diagnosis_date, seq
+
+
+def stream_page(store, limit=100, after=None, offset=0, chunk_size=64 * 1024, **filters):
+    """Yield one page of diagnoses as JSON text, encoded incrementally
+
+    Diagnoses are written out as they're read from the store, in chunks of
+    about `chunk_size` characters, so the page is never held in memory as
+    Python objects. The document has the same shape as the non-streaming
+    response plus `nextCursor`, which is null on the last page.
+    """
+    total = store.count(**filters)
+    buffer = ['{"diagnoses": [']
+    size = 0
+    last_key = None
+    next_cursor = None
+
+    # Read one extra row to learn whether another page follows
+    for i, (key, data) in enumerate(store.scan(after=after, limit=limit + 1, offset=offset, **filters)):
+        if i == limit:
+            next_cursor = encode_cursor(last_key)
+            break
+        buffer.append(data if i == 0 else "," + data)
+        size += len(data)
+        last_key = key
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+
+    buffer.append(
+        f'], "total": {total}, "limit": {limit}, "offset": {offset}, "nextCursor": {json.dumps(next_cursor)}}}'
+    )
+    yield "".join(buffer)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Tests import the service modules the way the entry points do, from ml/src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main opens its stores at import time; keep them out of the working tree
+_DATA_DIR = tempfile.mkdtemp(prefix="ml-tests-")
+os.environ.setdefault("DIAGNOSES_DB", os.path.join(_DATA_DIR, "diagnoses.db"))
+os.environ.setdefault("DIAGNOSIS_JOBS_DB", os.path.join(_DATA_DIR, "diagnosis_jobs.db"))
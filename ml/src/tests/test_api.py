@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def queued_diagnosis():
+    return main.submit_diagnosis("symptoms", {"description": "headache"})
+
+
+@pytest.mark.parametrize("wait", ["nan", "inf", "-inf", "-1", "soon"])
+def test_invalid_wait_is_rejected(client, queued_diagnosis, wait):
+    response = client.get(f"/api/diagnoses/{queued_diagnosis['id']}?wait={wait}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_short_wait_returns_the_record(client, queued_diagnosis):
+    response = client.get(f"/api/diagnoses/{queued_diagnosis['id']}?wait=0.1")
+    assert response.status_code == 200
+    assert response.get_json()["id"] == queued_diagnosis["id"]
+
+
+def test_diagnoses_etag_is_readable_cross_origin(client):
+    response = client.get("/api/diagnoses", headers={"Origin": "http://localhost:3000"})
+    etag = response.headers["ETag"]
+    assert "ETag" in response.headers["Access-Control-Expose-Headers"]
+    assert client.get("/api/diagnoses", headers={"If-None-Match": etag}).status_code == 304
+
+
+def _loader(state):
+    loader = main.ModelLoader()
+    loader.add("symptoms", lambda: state == "ready")
+    if state != "loading":
+        loader.start(background=False)
+    return loader
+
+
+@pytest.mark.parametrize("state, degraded", [("loading", True), ("failed", False), ("ready", False)])
+def test_keyword_answers_are_degraded_only_while_loading(monkeypatch, state, degraded):
+    monkeypatch.setattr(main, "model_loader", _loader(state))
+    result = main._finalize_symptoms_result({"diagnosis": "Migraine", "confidence": 60})
+    assert result.get("degraded", False) is degraded
+
+
+def test_readyz_reports_a_failed_model(client, monkeypatch):
+    monkeypatch.setattr(main, "model_loader", _loader("failed"))
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body["state"] == "failed"
+    assert body["models"]["symptoms"]["error"] == "Model could not be loaded"
+
+
+def test_cache_hits_report_their_own_timing(client, monkeypatch):
+    monkeypatch.setattr(main, "model_loader", _loader("failed"))
+    main.result_cache.clear()
+    first = client.post("/api/symptoms", json={"symptoms": "pounding headache and nausea"})
+    stored = dict(first.get_json(), processing_time_ms=12345.0)
+    main.result_cache.set(main._symptoms_cache_key("pounding headache and nausea"), stored)
+    hit = client.post("/api/symptoms", json={"symptoms": "pounding headache and nausea"})
+    assert hit.headers["X-Cache"] == "HIT"
+    assert hit.get_json()["processing_time_ms"] < 12345.0
+    assert stored["processing_time_ms"] == 12345.0
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+pytest.importorskip("multipart")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Entering the client runs the app's lifespan startup and shutdown
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("path", ["/api/predict", "/api/predict/batch", "/api/diagnoses"])
+def test_malformed_multipart_is_a_client_error(client, path):
+    response = client.post(
+        path,
+        content=b"--boundary\r\nContent-Disposition: form-data\r\n\r\n",
+        headers={"Content-Type": "multipart/form-data"},  # no boundary parameter
+    )
+    assert response.status_code == 400
+    assert response.json() == {"error": "Invalid multipart form data"}
+
+
+
+@pytest.mark.parametrize("wait", ["nan", "inf", "-inf", "-1", "soon"])
+def test_invalid_wait_is_rejected(client, wait):
+    diagnosis = main.submit_diagnosis("symptoms", {"description": "headache"})
+    response = client.get(f"/api/diagnoses/{diagnosis['id']}", params={"wait": wait})
+    assert response.status_code == 400
+
+
+def test_diagnoses_etag_is_readable_cross_origin(client):
+    response = client.get("/api/diagnoses", headers={"Origin": "http://localhost:3000"})
+    etag = response.headers["ETag"]
+    assert "etag" in response.headers["Access-Control-Expose-Headers"].lower()
+    assert client.get("/api/diagnoses", headers={"If-None-Match": etag}).status_code == 304
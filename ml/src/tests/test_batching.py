@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from models.batching import MicroBatcher
+
+
+def submit_concurrently(batcher, items):
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    def call(i):
+        try:
+            results[i] = batcher(items[i], timeout=5)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_each_caller_gets_its_own_result():
+    batches = []
+
+    def batch_fn(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    try:
+        results, errors = submit_concurrently(batcher, list(range(20)))
+    finally:
+        batcher.close()
+
+    assert errors == [None] * 20
+    assert results == [i * 10 for i in range(20)]
+    assert all(len(batch) <= 8 for batch in batches)
+    assert sorted(item for batch in batches for item in batch) == list(range(20))
+    assert batcher.stats()["items"] == 20
+
+
+def test_batch_failure_reaches_every_caller():
+    def batch_fn(items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=20)
+    try:
+        _, errors = submit_concurrently(batcher, list(range(6)))
+    finally:
+        batcher.close()
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert batcher.stats()["errors"] >= 1
+
+
+def test_result_count_mismatch_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=1, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError, match="returned 0 results for 1 items"):
+            batcher("text", timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_closed_batcher_rejects_work():
+    batcher = MicroBatcher(lambda items: items)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit("text")
@@ -0,0 +1,25 @@
+from models.cascade import CascadePolicy
+from models.symptoms_model import SymptomAnalyzer
+
+DECISIVE = [("Migraine", 6), ("Flu", 1)]
+
+
+def test_early_exit_is_off_by_default():
+    assert not CascadePolicy().keyword_decisive(DECISIVE)
+    assert not CascadePolicy.from_env({}).keyword_decisive(DECISIVE)
+    assert not CascadePolicy.from_env({"SYMPTOMS_CASCADE_MIN_MATCHES": "0"}).keyword_decisive(DECISIVE)
+
+
+def test_service_and_analyzer_share_the_default():
+    analyzer = SymptomAnalyzer(lazy=True)
+    assert analyzer.cascade.describe() == CascadePolicy.from_env({}).describe()
+    analyzer.set_cascade(None)
+    assert analyzer.cascade.describe() == CascadePolicy.from_env({}).describe()
+
+
+def test_early_exit_opt_in():
+    policy = CascadePolicy.from_env({"SYMPTOMS_CASCADE_MIN_MATCHES": "4", "SYMPTOMS_CASCADE_MIN_MARGIN": "2"})
+    assert policy.keyword_decisive(DECISIVE)
+    assert not policy.keyword_decisive([("Migraine", 4), ("Flu", 3)])
+    assert not policy.keyword_decisive([("Migraine", 3)])
+    assert not policy.keyword_decisive([])
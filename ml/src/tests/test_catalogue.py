@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from benchmarks.bench_keyword_matcher import VOCABULARY, make_catalogue
+from initialize_symptoms_model import TEST_SYMPTOMS
+from models.catalogue import Catalogue, is_catalogue_file, write_catalogue
+from models.keyword_matcher import KeywordMatcher
+
+CONDITIONS = {
+    "Migraine": {
+        "symptoms": ["headache", "sensitivity to light", "nausea"],
+        "synonyms": {"headache": ["head pain", "pounding head"]},
+        "recommendations": "Rest in a dark, quiet room."
+    },
+    "Common Cold": {
+        "symptoms": ["cough", "sore throat", "runny nose", "fever"],
+        "recommendations": "Stay hydrated and rest."
+    },
+    # Shares "fever" and "cough" with the cold, and one phrase extends another
+    "Flu": {
+        "symptoms": ["fever", "cough", "body aches", "aches"],
+        "severity": "moderate",
+        "icd10": ["J11"]
+    },
+    "Gastroenteritis": {
+        "symptoms": ["abdominal pain", "nausea", "diarrhea"],
+        "synonyms": {"abdominal pain": ["stomach ache", "tummy ache"]}
+    },
+    "Eczema": {
+        "symptoms": ["itchy skin", "rash", "dry skin", "éruption"]
+    },
+    "Empty": {"symptoms": []},
+}
+
+TEXTS = TEST_SYMPTOMS + [
+    "",
+    "nothing relevant here",
+    "Pounding head, and LIGHT sensitivity... sensitivity to light!",
+    "fever fever cough",
+    "body aches and aches",
+    "a stomach ache with nausea and diarrhea",
+    "tummy  ache",
+    "sore\tthroat and a runny nose",
+    "itchy skin, dry skin and an éruption",
+    "headaches",
+]
+
+
+def random_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(1, 12))) for _ in range(count)]
+
+
+@pytest.fixture(params=["handwritten", "synthetic"])
+def conditions_info(request):
+    return CONDITIONS if request.param == "handwritten" else make_catalogue(300, seed=1)
+
+
+@pytest.fixture
+def catalogue(tmp_path, conditions_info):
+    path = str(tmp_path / "conditions.catalogue")
+    write_catalogue(path, conditions_info)
+    catalogue = Catalogue(path)
+    yield catalogue
+    catalogue.close()
+
+
+def test_catalogue_reads_back_conditions_info(catalogue, conditions_info):
+    assert list(catalogue) == list(conditions_info)
+    assert len(catalogue) == len(conditions_info)
+    assert list(catalogue.labels) == list(conditions_info)
+    for name, info in conditions_info.items():
+        assert name in catalogue
+        assert catalogue[name] == info
+    assert "Unknown" not in catalogue
+    with pytest.raises(KeyError):
+        catalogue["Unknown"]
+
+
+def test_mapped_matcher_matches_keyword_matcher(catalogue, conditions_info):
+    reference = KeywordMatcher(conditions_info)
+    mapped = catalogue.keyword_matcher
+    for text in TEXTS + random_texts(200):
+        assert mapped.match(text) == reference.match(text), text
+        assert mapped.ranked(text) == reference.ranked(text), text
+        assert mapped.ranked(text, limit=2) == reference.ranked(text, limit=2), text
+        assert mapped.best(text) == reference.best(text), text
+    assert mapped.match_batch(TEXTS) == reference.match_batch(TEXTS)
+
+
+def test_explicit_labels_are_kept(tmp_path):
+    path = str(tmp_path / "conditions.catalogue")
+    labels = ["Flu", "Migraine"]
+    write_catalogue(path, CONDITIONS, labels=labels)
+    catalogue = Catalogue(path)
+    try:
+        assert list(catalogue.labels) == labels
+        assert list(catalogue) == list(CONDITIONS)
+    finally:
+        catalogue.close()
+
+
+def test_fingerprint_follows_content(tmp_path):
+    first = write_catalogue(str(tmp_path / "a.catalogue"), CONDITIONS)
+    assert write_catalogue(str(tmp_path / "b.catalogue"), dict(CONDITIONS)) == first
+    changed = dict(CONDITIONS, Flu=dict(CONDITIONS["Flu"], symptoms=["fever"]))
+    assert write_catalogue(str(tmp_path / "c.catalogue"), changed) != first
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "legacy.pkl"
+    path.write_bytes(b"\x80\x04not a catalogue")
+    assert not is_catalogue_file(str(path))
+    with pytest.raises(ValueError):
+        Catalogue(str(path))
@@ -0,0 +1,257 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from diagnosis_jobs import QUEUED, RUNNING, BacklogFull, JobBacklog, JobRunner
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+@pytest.fixture
+def backlog(path):
+    backlog = JobBacklog(path)
+    yield backlog
+    backlog.close()
+
+
+def test_claims_oldest_first(backlog):
+    for i in range(3):
+        backlog.enqueue(f"j{i}", "symptoms", {"n": i}, data=b"x" if i == 1 else None)
+    claimed = [backlog.claim() for _ in range(4)]
+    assert [job["id"] for job in claimed[:3]] == ["j0", "j1", "j2"]
+    assert claimed[1]["payload"] == {"n": 1}
+    assert claimed[1]["data"] == b"x"
+    assert claimed[0]["attempts"] == 1
+    assert claimed[3] is None
+    assert backlog.counts() == {QUEUED: 0, RUNNING: 3}
+
+
+def test_backlog_limit(path):
+    backlog = JobBacklog(path, max_jobs=2)
+    backlog.enqueue("j0", "symptoms", {})
+    backlog.enqueue("j1", "symptoms", {})
+    with pytest.raises(BacklogFull):
+        backlog.enqueue("j2", "symptoms", {})
+    backlog.claim()
+    backlog.complete("j0")
+    backlog.enqueue("j2", "symptoms", {})
+    assert backlog.counts() == {QUEUED: 2, RUNNING: 0}
+
+
+def test_released_job_waits_for_its_delay(backlog):
+    backlog.enqueue("j0", "symptoms", {})
+    backlog.enqueue("j1", "symptoms", {})
+    assert backlog.release(backlog.claim()["id"], delay=0.3)
+    assert backlog.claim()["id"] == "j1"
+    assert backlog.claim() is None
+    time.sleep(0.35)
+    job = backlog.claim()
+    assert job["id"] == "j0"
+    assert job["attempts"] == 2
+
+
+def test_expired_lease_is_taken_over(path):
+    crashed = JobBacklog(path, lease_seconds=0.1)
+    other = JobBacklog(path, lease_seconds=10)
+    crashed.enqueue("j0", "symptoms", {})
+    crashed.claim()
+    assert other.claim() is None
+    time.sleep(0.15)
+    job = other.claim()
+    assert job["id"] == "j0"
+    assert job["attempts"] == 2
+    # The first owner lost the job, so it can no longer finish or release it
+    assert not crashed.complete("j0")
+    assert not crashed.release("j0")
+    assert other.complete("j0")
+    assert other.counts() == {QUEUED: 0, RUNNING: 0}
+
+
+def test_renew_keeps_the_lease(path):
+    owner = JobBacklog(path, lease_seconds=0.3)
+    other = JobBacklog(path)
+    owner.enqueue("j0", "symptoms", {})
+    owner.claim()
+    time.sleep(0.2)
+    assert owner.renew() == 1
+    time.sleep(0.2)
+    assert other.claim() is None
+    assert other.recover() == 0
+
+
+def test_recover_requeues_only_expired_leases(path):
+    owner = JobBacklog(path, lease_seconds=0.1)
+    owner.enqueue("j0", "symptoms", {})
+    owner.claim()
+    assert JobBacklog(path).recover() == 0
+    time.sleep(0.15)
+    assert JobBacklog(path).recover() == 1
+    assert owner.counts() == {QUEUED: 1, RUNNING: 0}
+
+
+def test_upgrades_backlog_written_by_the_pid_schema(path):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            data BLOB,
+            state TEXT NOT NULL,
+            owner INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL
+        );
+        INSERT INTO jobs (id, kind, payload, state, owner, attempts, enqueued_at)
+            VALUES ('j0', 'symptoms', '{}', 'running', 1, 1, 0);
+        INSERT INTO jobs (id, kind, payload, state, attempts, enqueued_at)
+            VALUES ('j1', 'symptoms', '{}', 'queued', 0, 0);
+    """)
+    conn.close()
+
+    backlog = JobBacklog(path)
+    # A job running under a process id has no lease, so it counts as expired
+    assert backlog.recover() == 1
+    assert [backlog.claim()["id"] for _ in range(2)] == ["j0", "j1"]
+
+
+class Recorder:
+    """process/fail callbacks for a JobRunner, failing chosen jobs a number of times"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.processed = []
+        self.failed = []
+
+    def process(self, job):
+        self.processed.append((job["id"], job["attempts"]))
+        if self.failures.get(job["id"], 0) > 0:
+            self.failures[job["id"]] -= 1
+            raise RuntimeError(f"{job['id']} failed")
+
+    def fail(self, job, error):
+        self.failed.append((job["id"], str(error)))
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def make_runner(backlog):
+    runners = []
+
+    def make(recorder, **kwargs):
+        kwargs = {"workers": 1, "poll_interval": 0.05, "retry_delay": 0.01, **kwargs}
+        runner = JobRunner(kwargs.pop("backlog", backlog), recorder.process, recorder.fail, **kwargs)
+        runners.append(runner)
+        return runner
+
+    yield make
+    for runner in runners:
+        runner.stop(timeout=5)
+
+
+def test_runner_retries_then_completes(backlog, make_runner):
+    recorder = Recorder(failures={"j0": 1})
+    runner = make_runner(recorder, max_attempts=3)
+    runner.start()
+    runner.submit("j0", "symptoms", {})
+    assert wait_until(lambda: runner.stats()["completed"] == 1)
+    assert recorder.processed == [("j0", 1), ("j0", 2)]
+    assert recorder.failed == []
+    stats = runner.stats()
+    assert stats["retried"] == 1
+    assert stats["backlog"] == {QUEUED: 0, RUNNING: 0}
+
+
+def test_runner_fails_after_max_attempts(backlog, make_runner):
+    recorder = Recorder(failures={"j0": 5})
+    runner = make_runner(recorder, max_attempts=2)
+    runner.start()
+    runner.submit("j0", "symptoms", {})
+    assert wait_until(lambda: runner.stats()["failed"] == 1)
+    assert recorder.processed == [("j0", 1), ("j0", 2)]
+    assert recorder.failed == [("j0", "j0 failed")]
+    assert backlog.counts() == {QUEUED: 0, RUNNING: 0}
+
+
+def test_runner_backs_off_between_retries(backlog, make_runner):
+    recorder = Recorder(failures={"j0": 1})
+    runner = make_runner(recorder, retry_delay=0.5)
+    runner.start()
+    runner.submit("j0", "symptoms", {})
+    assert wait_until(lambda: runner.stats()["retried"] == 1)
+    time.sleep(0.2)
+    assert recorder.processed == [("j0", 1)]
+    assert wait_until(lambda: runner.stats()["completed"] == 1)
+
+
+def test_runner_fails_job_abandoned_too_often(backlog, make_runner):
+    backlog.enqueue("j0", "symptoms", {})
+    for _ in range(2):
+        # Claimed by workers that died without finishing it
+        backlog.claim()
+        backlog.release("j0")
+    recorder = Recorder()
+    runner = make_runner(recorder, max_attempts=2)
+    runner.start()
+    assert wait_until(lambda: runner.stats()["failed"] == 1)
+    assert recorder.processed == []
+    assert recorder.failed[0][0] == "j0"
+
+
+class FlakyBacklog(JobBacklog):
+    """Raises from the first few claims, like a locked or unreadable backlog file"""
+
+    def __init__(self, path, errors):
+        super().__init__(path)
+        self.errors = errors
+
+    def claim(self):
+        if self.errors:
+            self.errors -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().claim()
+
+
+def test_runner_survives_backlog_errors(path, make_runner):
+    recorder = Recorder()
+    runner = make_runner(recorder, backlog=FlakyBacklog(path, errors=2))
+    runner.start()
+    runner.submit("j0", "symptoms", {})
+    assert wait_until(lambda: runner.stats()["completed"] == 1)
+    assert runner.stats()["errors"] == 2
+    assert all(thread.is_alive() for thread in runner._threads)
+
+
+def test_runner_renews_leases_while_processing(path, make_runner):
+    started, finish = threading.Event(), threading.Event()
+
+    class Slow(Recorder):
+        def process(self, job):
+            started.set()
+            finish.wait(5)
+            super().process(job)
+
+    recorder = Slow()
+    runner = make_runner(recorder, backlog=JobBacklog(path, lease_seconds=0.2))
+    runner.start()
+    runner.submit("j0", "symptoms", {})
+    assert started.wait(5)
+    time.sleep(0.5)
+    # Still leased well past lease_seconds, so no other process can take it
+    assert JobBacklog(path).claim() is None
+    finish.set()
+    assert wait_until(lambda: runner.stats()["completed"] == 1)
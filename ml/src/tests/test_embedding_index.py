@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from models.embedding_index import ConditionIndex, EmbeddingRetriever
+
+CONDITIONS = 10000
+DIM = 384
+
+
+class FixedEncoder:
+    """Encodes every text as the same query vector"""
+
+    model_name = "fixed"
+
+    def __init__(self, query):
+        self.query = query
+
+    def encode(self, texts, batch_size=64):
+        return np.tile(self.query, (len(texts), 1))
+
+
+def unit(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def test_clear_match_in_a_large_catalogue_is_confident():
+    # Sentence embeddings share a common direction, so unrelated conditions
+    # still score around 0.2 and the clear match around 0.6
+    rng = np.random.default_rng(0)
+    common = unit(rng.normal(size=DIM))
+    vectors = unit(0.6 * common + 0.8 * unit(rng.normal(size=(CONDITIONS, DIM))))
+    query = unit(vectors[123] + 1.2 * rng.normal(size=DIM) / np.sqrt(DIM))
+    labels = [f"Condition {i}" for i in range(CONDITIONS)]
+
+    retriever = EmbeddingRetriever({}, labels, encoder=FixedEncoder(query), index_path=None)
+    retriever.use_index(ConditionIndex(labels, vectors, "synthetic", "fixed"))
+    result = retriever("a clear description of condition 123", labels)
+
+    assert result["labels"][0] == "Condition 123"
+    assert len(result["scores"]) == retriever.top_k
+    assert result["scores"] == sorted(result["scores"], reverse=True)
+    assert sum(result["scores"]) == pytest.approx(1.0)
+    # Above the service's default classifier_min_confidence of 40%
+    assert result["scores"][0] * 100 >= 40
@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tensorflow")
+pytest.importorskip("matplotlib")
+
+from models.model import MedicalImageClassifier, load_image_model, load_serving_model, write_serving_manifest
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    classifier = MedicalImageClassifier(input_shape=(32, 32, 3), num_classes=5)
+    directory = str(tmp_path_factory.mktemp("export"))
+    classifier.export(directory, formats=("savedmodel", "tflite"))
+    return classifier, directory
+
+
+@pytest.mark.parametrize("runtime", ["savedmodel", "tflite"])
+def test_export_round_trip_matches_keras(exported, runtime):
+    classifier, directory = exported
+    x = np.random.default_rng(0).random((4, 32, 32, 3), dtype=np.float32)
+    model = load_image_model(directory, runtime=runtime)
+    assert model.runtime == runtime
+    np.testing.assert_allclose(model.predict(x), classifier.predict(x), atol=1e-5)
+
+
+def test_int8_export_needs_calibration_data(tmp_path):
+    classifier = MedicalImageClassifier(input_shape=(32, 32, 3))
+    with pytest.raises(ValueError, match="representative_data"):
+        classifier.export(str(tmp_path), formats=("tflite_int8",))
+
+
+def test_unverified_formats_are_not_picked_for_speed(exported, tmp_path):
+    _, directory = exported
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    os.symlink(os.path.join(directory, "model.tflite"), tmp_path / "model.tflite")
+    os.symlink(os.path.join(directory, "saved_model"), tmp_path / "saved_model")
+
+    # Parity only measured on random inputs: latency is ignored
+    manifest["formats"]["savedmodel"].update({"latency_ms": 1.0, "parity_ok": None})
+    manifest["formats"]["tflite"].update({"latency_ms": 5.0, "parity_ok": None})
+    write_serving_manifest(str(tmp_path), manifest)
+    assert load_serving_model(str(tmp_path)).runtime == "tflite"
+
+    # A format that failed parity is never served automatically
+    manifest["formats"]["tflite"]["parity_ok"] = False
+    write_serving_manifest(str(tmp_path), manifest)
+    assert load_serving_model(str(tmp_path)).runtime == "savedmodel"
+
+    # Verified formats are picked by latency
+    manifest["formats"]["savedmodel"]["parity_ok"] = True
+    manifest["formats"]["tflite"].update({"latency_ms": 0.5, "parity_ok": True})
+    write_serving_manifest(str(tmp_path), manifest)
+    assert load_serving_model(str(tmp_path)).runtime == "tflite"
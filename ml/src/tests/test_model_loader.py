@@ -0,0 +1,59 @@
+import time
+
+from model_loader import FAILED, LOADING, READY, ModelLoader
+
+
+def flaky(failures):
+    calls = []
+
+    def load():
+        calls.append(len(calls))
+        if len(calls) <= failures:
+            raise RuntimeError(f"attempt {len(calls)} failed")
+        return True
+
+    return load, calls
+
+
+def test_retries_until_loaded():
+    load, calls = flaky(failures=2)
+    loader = ModelLoader()
+    loader.add("symptoms", load, retries=2, retry_delay=0.01)
+    loader.start(background=False)
+    assert loader.is_ready("symptoms")
+    assert len(calls) == 3
+    status = loader.status()
+    assert status["state"] == READY and status["ready"]
+    assert status["models"]["symptoms"]["attempts"] == 3
+    assert status["models"]["symptoms"]["error"] is None
+
+
+def test_failed_after_every_retry():
+    load, calls = flaky(failures=10)
+    loader = ModelLoader()
+    loader.add("symptoms", load, retries=1, retry_delay=0.01)
+    loader.add("optional", lambda: True, required=False)
+    loader.start(background=False)
+    assert len(calls) == 2
+    assert loader.has_failed("symptoms")
+    assert not loader.is_ready()
+    status = loader.status()
+    assert status["state"] == FAILED and not status["ready"]
+    assert status["models"]["symptoms"]["error"] == "attempt 2 failed"
+
+
+def test_reports_loading_with_the_last_error_while_retrying():
+    load, _ = flaky(failures=1)
+    loader = ModelLoader()
+    loader.add("symptoms", load, retries=1, retry_delay=0.5)
+    loader.start()
+    deadline = time.monotonic() + 5
+    while loader.status()["models"]["symptoms"]["error"] is None:
+        assert time.monotonic() < deadline, "first attempt did not fail"
+        time.sleep(0.01)
+    status = loader.status()
+    assert status["state"] == LOADING
+    assert not loader.has_failed("symptoms")
+    assert status["models"]["symptoms"]["error"] == "attempt 1 failed"
+    loader.wait()
+    assert loader.is_ready("symptoms")
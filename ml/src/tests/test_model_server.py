@@ -0,0 +1,85 @@
+import os
+import socket
+import stat
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from model_loader import ModelLoader
+from model_server import ModelClient, ModelServer, RemoteSymptomAnalyzer, key_path_for
+
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / "models.sock")
+    server = ModelServer(socket_path, authkey=None)
+    # No models: the tests only exercise the connection handling
+    server.loader = ModelLoader()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        assert time.monotonic() < deadline, "model server did not start"
+        time.sleep(0.01)
+    yield server
+    # The daemon accept thread stays blocked in accept() until the process exits
+    server.close()
+
+
+def test_socket_and_generated_key_are_private(server):
+    assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(key_path_for(server.socket_path)).st_mode) == 0o600
+    assert server.authkey not in (None, b"", b"medibox-model-server")
+
+
+def test_client_reads_the_generated_key(server):
+    assert ModelClient(server.socket_path).call("status")["ready"] is True
+
+
+def test_bad_clients_do_not_stop_the_server(server):
+    with pytest.raises(AuthenticationError):
+        Client(server.socket_path, family="AF_UNIX", authkey=b"wrong key")
+
+    # Disconnect in the middle of the handshake
+    raw = socket.socket(socket.AF_UNIX)
+    raw.connect(server.socket_path)
+    raw.close()
+
+    # A client that never answers only holds up its own thread
+    silent = socket.socket(socket.AF_UNIX)
+    silent.connect(server.socket_path)
+    try:
+        assert ModelClient(server.socket_path).call("status")["ready"] is True
+    finally:
+        silent.close()
+
+
+class KeywordAnalyzer:
+    """Stands in for the worker's lazy SymptomAnalyzer"""
+
+    hypothesis_template = "This patient has {}"
+    catalogue_fingerprint = "local"
+    labels = ["Migraine"]
+
+    def analyze(self, text):
+        return {"diagnosis": "Migraine", "confidence": 60}
+
+    def analyze_batch(self, texts):
+        return [self.analyze(text) for text in texts]
+
+
+def test_remote_analyzer_falls_back_while_the_server_is_down(tmp_path):
+    client = ModelClient(str(tmp_path / "missing.sock"), authkey=b"key")
+    remote = RemoteSymptomAnalyzer(client, local=KeywordAnalyzer())
+    # Catalogue details need no round trip to the server
+    assert remote.catalogue_fingerprint == "local"
+    assert remote.analyze("headache") == {"diagnosis": "Migraine", "confidence": 60, "degraded": True}
+    assert [result["degraded"] for result in remote.analyze_batch(["a", "b"])] == [True, True]
+
+    with pytest.raises(OSError):
+        RemoteSymptomAnalyzer(client).analyze("headache")
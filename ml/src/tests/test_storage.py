@@ -0,0 +1,170 @@
+import gc
+import json
+import os
+import threading
+
+import pytest
+
+from storage import create_store, decode_cursor, encode_cursor, stream_page
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    location = ":memory:" if request.param == "memory" else str(tmp_path / "diagnoses.db")
+    store = create_store(location)
+    yield store
+    store.close()
+
+
+def make_diagnosis(i, date="2025-03-01", status="pending", type="Symptom Analysis"):
+    return {"id": f"d{i}", "diagnosisDate": date, "status": status, "type": type, "n": i}
+
+
+def test_listing_is_newest_first_by_date_then_insertion(store):
+    store.create_many([
+        make_diagnosis(0, "2025-03-02"),
+        make_diagnosis(1, "2025-03-01"),
+        make_diagnosis(2, "2025-03-02"),
+    ])
+    diagnoses, total = store.list()
+    assert [d["id"] for d in diagnoses] == ["d2", "d0", "d1"]
+    assert total == 3
+
+
+def test_filters_and_counts(store):
+    store.create_many([
+        make_diagnosis(0, "2025-03-01", "pending", "Symptom Analysis"),
+        make_diagnosis(1, "2025-03-02", "reviewed", "Image Analysis"),
+        make_diagnosis(2, "2025-03-03", "pending", "Image Analysis"),
+    ])
+    assert store.count() == 3
+    assert store.count(status="pending") == 2
+    assert store.count(type="Image Analysis", status="pending") == 1
+    assert store.count(date_from="2025-03-02") == 2
+    assert store.count(date_from="2025-03-02", date_to="2025-03-02") == 1
+
+    diagnoses, total = store.list(status="pending", limit=1)
+    assert [d["id"] for d in diagnoses] == ["d2"]
+    assert total == 2
+
+
+def test_offset_pagination(store):
+    store.create_many([make_diagnosis(i) for i in range(5)])
+    diagnoses, total = store.list(limit=2, offset=2)
+    assert [d["id"] for d in diagnoses] == ["d2", "d1"]
+    assert total == 5
+
+
+def test_get(store):
+    store.create(make_diagnosis(7))
+    assert store.get("d7")["n"] == 7
+    assert store.get("missing") is None
+
+
+def test_save_replaces_in_place(store):
+    store.create_many([make_diagnosis(i) for i in range(3)])
+    store.save({**make_diagnosis(0), "status": "reviewed"})
+    store.save(make_diagnosis(3))
+
+    diagnoses, _ = store.list()
+    assert [d["id"] for d in diagnoses] == ["d3", "d2", "d1", "d0"]
+    assert store.get("d0")["status"] == "reviewed"
+    assert store.count(status="pending") == 3
+    assert store.count(status="reviewed") == 1
+
+
+def test_delete(store):
+    store.create_many([make_diagnosis(i) for i in range(2)])
+    store.delete("d0")
+    store.delete("missing")
+    assert store.get("d0") is None
+    assert store.count() == 1
+    assert store.count(status="pending") == 1
+
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+
+
+def test_sqlite_connections_close_with_their_threads(tmp_path):
+    store = create_store(str(tmp_path / "diagnoses.db"))
+    store.create(make_diagnosis(0))
+    fds = _open_fds()
+
+    def request():
+        assert store.get("d0")["id"] == "d0"
+
+    # Like a server that starts a thread per request
+    for _ in range(200):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(store._connections) == 1
+    if fds is not None:
+        assert _open_fds() <= fds + 2
+    assert store.get("d0")["id"] == "d0"
+    store.close()
+    assert not store._connections
+
+
+def read_page(store, **params):
+    return json.loads("".join(stream_page(store, **params)))
+
+
+def test_cursor_walks_every_diagnosis_once(store):
+    store.create_many([make_diagnosis(i, f"2025-03-0{1 + i % 3}") for i in range(10)])
+    expected = [d["id"] for d in store.list(limit=100)[0]]
+
+    seen = []
+    page = read_page(store, limit=4)
+    while True:
+        seen += [d["id"] for d in page["diagnoses"]]
+        assert page["total"] == 10
+        if page["nextCursor"] is None:
+            break
+        page = read_page(store, limit=4, after=decode_cursor(page["nextCursor"]))
+    assert seen == expected
+
+
+def test_cursor_is_stable_when_newer_diagnoses_arrive(store):
+    store.create_many([make_diagnosis(i) for i in range(4)])
+    first = read_page(store, limit=2)
+    store.create(make_diagnosis(99))
+    second = read_page(store, limit=2, after=decode_cursor(first["nextCursor"]))
+    assert [d["id"] for d in first["diagnoses"]] == ["d3", "d2"]
+    assert [d["id"] for d in second["diagnoses"]] == ["d1", "d0"]
+    assert second["nextCursor"] is None
+
+
+def test_cursor_with_filters(store):
+    store.create_many([make_diagnosis(i, status="pending" if i % 2 else "reviewed") for i in range(6)])
+    page = read_page(store, limit=2, status="pending")
+    page = read_page(store, limit=2, status="pending", after=decode_cursor(page["nextCursor"]))
+    assert [d["id"] for d in page["diagnoses"]] == ["d1"]
+    assert page["total"] == 3
+
+
+def test_small_chunks_still_produce_one_document(store):
+    store.create_many([make_diagnosis(i) for i in range(5)])
+    chunks = list(stream_page(store, limit=5, chunk_size=1))
+    assert len(chunks) > 1
+    assert [d["id"] for d in json.loads("".join(chunks))["diagnoses"]] == ["d4", "d3", "d2", "d1", "d0"]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(("2025-03-01", 42))) == ("2025-03-01", 42)
+    for cursor in ("not-base64!", encode_cursor(("2025-03-01",)), encode_cursor((1, 2))):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_revision_changes_on_writes_only(store):
+    # ETags on GET /api/diagnoses are keyed on the revision
+    start = store.revision()
+    store.list()
+    store.get("d0")
+    assert store.revision() == start
+    store.create(make_diagnosis(0))
+    assert store.revision() != start
@@ -0,0 +1,71 @@
+import pytest
+
+import metrics
+from models.symptoms_model import SymptomAnalyzer, _time_pipeline_stages
+
+
+class RecordingClassifier:
+    """Zero-shot classifier stand-in that records the batch size it was given"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template=None, multi_label=False, batch_size=None):
+        self.batch_sizes.append(batch_size)
+        labels = list(candidate_labels)
+        return [
+            {"sequence": text, "labels": labels, "scores": [1.0 / len(labels)] * len(labels)}
+            for text in sequences
+        ]
+
+
+@pytest.mark.parametrize("texts, batch_size, expected", [
+    (2, None, 10),     # 2 texts x 5 labels fit in one pass
+    (40, None, 64),    # 200 pairs are capped
+    (40, 1000, 64),    # so is a caller's batch size
+    (40, 16, 16),
+])
+def test_pair_batch_size_is_capped(texts, batch_size, expected):
+    analyzer = SymptomAnalyzer(lazy=True, max_pairs_per_forward=64)
+    analyzer.classifier = RecordingClassifier()
+    results = analyzer.analyze_batch([f"headache and nausea {i}" for i in range(texts)], batch_size=batch_size)
+    assert len(results) == texts
+    assert analyzer.classifier.batch_sizes == [expected]
+
+
+class FakePipeline:
+    """The preprocess/forward/postprocess steps of a transformers ChunkPipeline"""
+
+    def preprocess(self, text, candidate_labels):
+        for label in candidate_labels:
+            yield {"pair": (text, label)}
+
+    def forward(self, inputs):
+        return {"logits": len(inputs["pair"][1])}
+
+    def postprocess(self, outputs):
+        return [output["logits"] for output in outputs]
+
+    def __call__(self, text, candidate_labels):
+        return self.postprocess([self.forward(inputs) for inputs in self.preprocess(text, candidate_labels)])
+
+
+def test_pipeline_stages_are_timed_through_public_steps():
+    classifier = FakePipeline()
+    assert _time_pipeline_stages(classifier)
+    timings, token = metrics.begin("symptoms")
+    try:
+        assert classifier("headache", ["Flu", "Migraine"]) == [3, 8]
+    finally:
+        metrics.end(token)
+    assert set(timings.stages) == {"tokenization", "model_forward"}
+
+
+def test_pipelines_without_public_steps_are_left_untimed():
+    class Legacy:
+        def __call__(self, text, candidate_labels):
+            return []
+
+    classifier = Legacy()
+    assert not _time_pipeline_stages(classifier)
+    assert "preprocess" not in vars(classifier)
@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+Image = pytest.importorskip("PIL.Image")
+
+from models.training_data import image_dataset
+
+CLASSES = 4
+PER_CLASS = 16
+
+
+@pytest.fixture(scope="module")
+def image_dir(tmp_path_factory):
+    """Per-class directories, so the unshuffled order is sorted by label"""
+    root = tmp_path_factory.mktemp("images")
+    for label in range(CLASSES):
+        class_dir = root / f"class{label}"
+        class_dir.mkdir()
+        for i in range(PER_CLASS):
+            Image.new("RGB", (8, 8), (label * 60, i * 10, 0)).save(class_dir / f"{i:02d}.png")
+    return str(root)
+
+
+def epoch_labels(dataset):
+    return [int(label) for _, labels in dataset for label in np.argmax(labels, axis=1)]
+
+
+@pytest.mark.parametrize("cache", [None, "memory"])
+def test_shuffled_dataset_mixes_classes(image_dir, cache):
+    # A one-example buffer makes the post-cache shuffle a no-op, so any mixing
+    # comes from shuffling the file list
+    dataset = image_dataset(
+        image_dir, num_classes=CLASSES, image_size=(8, 8), batch_size=8, cache=cache, shuffle_buffer=1
+    )
+    labels = epoch_labels(dataset)
+    assert sorted(labels) == sorted(label for label in range(CLASSES) for _ in range(PER_CLASS))
+    assert labels != sorted(labels)
+
+
+def test_cached_dataset_keeps_every_example_each_epoch(image_dir):
+    dataset = image_dataset(image_dir, num_classes=CLASSES, image_size=(8, 8), batch_size=8, cache="memory")
+    first, second = epoch_labels(dataset), epoch_labels(dataset)
+    assert sorted(first) == sorted(second)
+    assert len(first) == CLASSES * PER_CLASS
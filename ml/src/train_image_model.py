@@ -0,0 +1,83 @@
+import argparse
+import os
+
+from models.model import MedicalImageClassifier
+from models.training_data import write_tfrecord_shards
+
+# Same order as CLASS_LABELS in main.py, so predictions map to the right names
+DEFAULT_CLASS_NAMES = ["Pneumonia", "Normal", "COVID-19", "Tuberculosis", "Lung Cancer"]
+
+
+def shard(args):
+    shards = write_tfrecord_shards(
+        args.directory, args.output_prefix, num_shards=args.num_shards, class_names=args.class_names
+    )
+    print(f"Wrote {len(shards)} shards to {os.path.dirname(args.output_prefix) or '.'}")
+
+
+def train(args):
+    classifier = MedicalImageClassifier(num_classes=len(args.class_names))
+    pipeline_options = {
+        "cache": args.cache,
+        "class_names": args.class_names,
+        "threads": args.threads,
+        "seed": args.seed,
+    }
+    train_data = classifier.make_dataset(
+        args.train, batch_size=args.batch_size, shuffle=True, augment=args.augment, flip=args.flip,
+        shuffle_buffer=args.shuffle_buffer, **pipeline_options
+    )
+    validation_data = None
+    if args.validation:
+        pipeline_options["cache"] = "memory" if args.cache else None
+        validation_data = classifier.make_dataset(
+            args.validation, batch_size=args.batch_size, shuffle=False, **pipeline_options
+        )
+
+    checkpoint_every = args.checkpoint_every if args.checkpoint_every == "epoch" else int(args.checkpoint_every)
+    classifier.train(
+        train_data,
+        validation_data=validation_data,
+        epochs=args.epochs,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_every=checkpoint_every
+    )
+    classifier.save(args.output)
+    print(f"Model saved to {args.output}")
+
+
+def main():
+    """Train the image classifier from a directory of images or TFRecord shards"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--class-names", nargs="+", default=DEFAULT_CLASS_NAMES,
+                        help="Class subdirectories, in the model's output order")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shard_parser = commands.add_parser("shard", help="Pack a per-class image directory into TFRecord shards")
+    shard_parser.add_argument("directory")
+    shard_parser.add_argument("output_prefix", help="e.g. data/shards/train")
+    shard_parser.add_argument("--num-shards", type=int, default=64)
+    shard_parser.set_defaults(run=shard)
+
+    train_parser = commands.add_parser("train", help="Train and save a model")
+    train_parser.add_argument("train", help="Directory of per-class subdirectories, or a TFRecord glob")
+    train_parser.add_argument("output", help="Where to save the trained Keras model")
+    train_parser.add_argument("--validation", help="Validation directory or TFRecord glob")
+    train_parser.add_argument("--epochs", type=int, default=10)
+    train_parser.add_argument("--batch-size", type=int, default=32)
+    train_parser.add_argument("--augment", action="store_true", help="Random brightness and contrast")
+    train_parser.add_argument("--flip", action="store_true", help="With --augment, also flip horizontally")
+    train_parser.add_argument("--cache", help="'memory' or a file prefix for caching decoded images")
+    train_parser.add_argument("--shuffle-buffer", type=int, default=1024)
+    train_parser.add_argument("--threads", type=int, help="Private tf.data thread pool size")
+    train_parser.add_argument("--seed", type=int)
+    train_parser.add_argument("--checkpoint-dir", help="Save resumable checkpoints here")
+    train_parser.add_argument("--checkpoint-every", default="epoch", help="'epoch' or a number of batches")
+    train_parser.set_defaults(run=train)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()